@@ -0,0 +1,7 @@
+import os
+
+# the benchmarks run against in-process stand-ins of MQTT and InfluxDB, so they
+# use their own configuration unless another one is given
+os.environ.setdefault(
+    "TOAD_API_CONFIG_FILE", os.path.join(os.path.dirname(__file__), "config.ini")
+)
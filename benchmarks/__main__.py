@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks import bench_handlers, bench_server
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), "results")
+
+# metrics that regress when they decrease; the rest regress when they increase
+HIGHER_IS_BETTER = ("calls_per_second", "messages_per_second", "points_per_second")
+# metrics that are reported but not compared
+NOT_COMPARED = ("write_requests",)
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """
+
+    :param results: results of this run.
+    :param baseline: results of a previous run.
+    :param tolerance: relative change that is not considered a regression.
+    :return: a description of every metric that regressed.
+    """
+    regressions = []
+    for name, metrics in results["benchmarks"].items():
+        baseline_metrics = baseline["benchmarks"].get(name, {})
+        for metric, value in metrics.items():
+            previous = baseline_metrics.get(metric)
+            if not previous or metric in NOT_COMPARED:
+                continue
+            change = (value - previous) / previous
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            if change > tolerance:
+                regressions.append(
+                    f"{name}.{metric}: {previous:.6g} -> {value:.6g} "
+                    f"({change:+.1%} worse)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmarks of the handlers and of the DataServer end to end.",
+    )
+    parser.add_argument("--only", choices=("handlers", "server"))
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--records", type=int, default=2)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--pack-records", type=int, default=500)
+    parser.add_argument("--min-seconds", type=float, default=1.0)
+    parser.add_argument("--output", default=RESULTS_DIRECTORY)
+    parser.add_argument("--baseline", help="results file to check regressions against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    benchmarks: Dict[str, Dict[str, float]] = {}
+    if args.only in (None, "handlers"):
+        benchmarks.update(bench_handlers.run(args.pack_records, args.min_seconds))
+    if args.only in (None, "server"):
+        benchmarks["server_end_to_end"] = asyncio.run(
+            bench_server.run(args.messages, args.records, args.devices)
+        )
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "arguments": vars(args),
+        "benchmarks": benchmarks,
+    }
+    for name, metrics in benchmarks.items():
+        print(name)
+        for metric, value in metrics.items():
+            print(f"    {metric}: {value:.6g}")
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(
+        args.output, time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + ".json"
+    )
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f"Results saved to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
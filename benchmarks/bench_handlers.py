@@ -0,0 +1,70 @@
+import time
+from typing import Any, Callable, Dict
+
+from benchmarks import payloads
+from toad_influx_data.handlers.generic_handler import GenericHandler
+
+Result = Dict[str, float]
+
+
+def measure(function: Callable[[], Any], points: int, min_seconds: float) -> Result:
+    """
+    Runs a function for at least `min_seconds` seconds, in rounds that double the
+    calls, and keeps the fastest round.
+
+    :param function: function to benchmark.
+    :param points: points converted by each call.
+    :param min_seconds: minimum seconds to run the function for.
+    :return: calls and points per second, and seconds per point.
+    """
+    function()  # warm up
+    best = float("inf")
+    calls = 1
+    total = 0.0
+    while total < min_seconds:
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        best = min(best, elapsed / calls)
+        calls *= 2
+    return {
+        "calls_per_second": 1 / best,
+        "points_per_second": points / best,
+        "seconds_per_point": best / points,
+    }
+
+
+def run(pack_records: int = 500, min_seconds: float = 1.0) -> Dict[str, Result]:
+    """
+    Micro-benchmarks of the ~`GenericHandler` conversions of a message, with a
+    power and a status record, and of a whole SenML pack.
+
+    :param pack_records: records of the SenML pack.
+    :param min_seconds: minimum seconds to run each benchmark for.
+    :return: the results by benchmark name.
+    """
+    handler = GenericHandler()
+    device_id = payloads.device_ids(1)[0]
+    message = payloads.senml_pack(device_id, 2)
+    pack = payloads.senml_pack(device_id, pack_records)
+
+    def dict_points():
+        handler.get_influx_power_points(message)
+        handler.get_influx_status_points(message)
+
+    return {
+        "handler_dict_points": measure(dict_points, 2, min_seconds),
+        "handler_lines": measure(
+            lambda: handler.get_influx_point_batch(message).to_lines(), 2, min_seconds
+        ),
+        "handler_pack_lines": measure(
+            lambda: handler.get_influx_point_batch(pack).to_lines(),
+            pack_records,
+            min_seconds,
+        ),
+        "handler_pack_batch": measure(
+            lambda: handler.get_influx_point_batch(pack), pack_records, min_seconds
+        ),
+    }
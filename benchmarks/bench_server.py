@@ -0,0 +1,82 @@
+import resource
+import time
+from typing import Dict, List
+
+from benchmarks import payloads
+from benchmarks.fakes import FakeInfluxDB, FakeMQTTBroker
+from toad_influx_data.handlers.generic_handler import GenericHandler
+from toad_influx_data.server import DataServer
+from toad_influx_data.writer import InfluxWriter
+
+Result = Dict[str, float]
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+
+    :param values: measured values.
+    :param percent: percentile, from 0 to 100.
+    :return: the nearest-rank percentile of the values.
+    """
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def peak_memory() -> float:
+    """
+
+    :return: peak resident set size of the process, in bytes.
+    """
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024.0
+
+
+async def run(
+    messages: int = 10000, records: int = 2, devices: int = 100, timeout: float = 120
+) -> Result:
+    """
+    End-to-end benchmark of a ~`DataServer` with the ~`GenericHandler`, which
+    receives messages from a fake MQTT broker and writes them to a fake InfluxDB.
+
+    :param messages: messages to publish.
+    :param records: SenML records of each message.
+    :param devices: devices the messages are spread over.
+    :param timeout: maximum seconds to wait for every point to be written.
+    :return: throughput, latency and peak memory of the run.
+    """
+    influxdb = FakeInfluxDB()
+    broker = FakeMQTTBroker()
+    await influxdb.start()
+    await broker.start()
+    writer = InfluxWriter(influxdb.host, influxdb.port)
+    data_server = DataServer(handlers=[GenericHandler()], writer=writer)
+    if data_server.http_server is not None:
+        # an ephemeral port, so that it does not conflict with a running server
+        data_server.http_server.port = 0
+    await data_server.start(mqtt_host=broker.host, mqtt_port=broker.port)
+    try:
+        await broker.wait_for_subscription(timeout)
+        topics = [payloads.topic(device) for device in payloads.device_ids(devices)]
+        device_ids = payloads.device_ids(devices)
+        start = time.perf_counter()
+        for index in range(messages):
+            device = index % devices
+            payload = payloads.payload(device_ids[device], records)
+            await broker.publish(topics[device], payload)
+        await influxdb.wait_for_lines(messages * records, timeout)
+        elapsed = time.perf_counter() - start
+    finally:
+        await data_server.stop()
+        await broker.stop()
+        await influxdb.stop()
+    return {
+        "messages_per_second": messages / elapsed,
+        "points_per_second": influxdb.lines / elapsed,
+        "latency_p50_seconds": percentile(influxdb.latencies, 50),
+        "latency_p99_seconds": percentile(influxdb.latencies, 99),
+        "write_requests": influxdb.requests,
+        "peak_memory_bytes": peak_memory(),
+    }
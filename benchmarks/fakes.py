@@ -0,0 +1,260 @@
+import asyncio
+import struct
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+from toad_influx_data.router import topic_matches
+
+# MQTT 3.1.1 control packet types
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+SHARED_SUBSCRIPTION_PREFIX = "$share/"
+
+
+class FakeInfluxDB:
+    """
+    In-process stand-in of the InfluxDB ``/write`` endpoint, which counts the
+    written lines instead of storing them.
+
+    The benchmarks publish the send time of every record as its value, so the
+    latency of a line is the time between it being published and written.
+
+    :ivar host: IP the endpoint listens on.
+    :ivar port: port the endpoint listens on; a free one is picked if 0.
+    :ivar requests: number of write requests received.
+    :ivar lines: number of lines received.
+    :ivar latencies: seconds between the publication and the write of each line.
+    """
+
+    host: str
+    port: int
+    requests: int
+    lines: int
+    latencies: List[float]
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        """
+        FakeInfluxDB initializer.
+
+        :param host: IP the endpoint listens on.
+        :param port: port the endpoint listens on; a free one is picked if 0.
+        """
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.lines = 0
+        self.latencies = []
+        self._runner: Optional[web.AppRunner] = None
+        self._lines_event = asyncio.Event()
+        self._expected_lines = 0
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 ** 2)
+        app.router.add_post("/write", self._write)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def wait_for_lines(self, lines: int, timeout: float):
+        """
+        Waits until at least `lines` lines were written.
+
+        :param lines: number of lines to wait for.
+        :param timeout: maximum seconds to wait.
+        :return:
+        """
+        self._expected_lines = lines
+        if self.lines < lines:
+            self._lines_event.clear()
+            await asyncio.wait_for(self._lines_event.wait(), timeout)
+
+    async def _write(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        now = time.time()
+        self.requests += 1
+        for line in body.splitlines():
+            self.lines += 1
+            # <series key> value=<send time> <timestamp>
+            value = line.rsplit(b" ", 2)[1]
+            self.latencies.append(now - float(value.split(b"=", 1)[1]))
+        if self.lines >= self._expected_lines:
+            self._lines_event.set()
+        return web.Response(status=204)
+
+
+class FakeMQTTBroker:
+    """
+    In-process stand-in of an MQTT broker, with the minimal MQTT 3.1.1 subset
+    that the ~`toad_influx_data.mqtt.MQTT` client uses: connections, subscriptions
+    with wildcards, keep alive, and QoS 0 and 1 publications, which are delivered
+    with QoS 0. Shared subscriptions are treated as plain subscriptions.
+
+    :ivar host: IP the broker listens on.
+    :ivar port: port the broker listens on; a free one is picked if 0.
+    """
+
+    host: str
+    port: int
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        """
+        FakeMQTTBroker initializer.
+
+        :param host: IP the broker listens on.
+        :param port: port the broker listens on; a free one is picked if 0.
+        """
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._subscriptions: Dict[asyncio.StreamWriter, Set[str]] = {}
+        self._subscribed = asyncio.Event()
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle_client, self.host, self.port
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        for writer in list(self._subscriptions):
+            writer.close()
+        await self._server.wait_closed()
+
+    async def wait_for_subscription(self, timeout: float):
+        """
+        Waits until a client subscribes to a topic.
+
+        :param timeout: maximum seconds to wait.
+        :return:
+        """
+        await asyncio.wait_for(self._subscribed.wait(), timeout)
+
+    async def publish(self, topic: str, payload: bytes):
+        """
+        Delivers a message to the clients subscribed to its topic, waiting for
+        their connections to take it.
+
+        :param topic: MQTT topic of the message.
+        :param payload: MQTT message payload.
+        :return:
+        """
+        packet = _packet(PUBLISH << 4, _string(topic) + payload)
+        for writer, patterns in list(self._subscriptions.items()):
+            if any(topic_matches(pattern, topic) for pattern in patterns):
+                writer.write(packet)
+                await writer.drain()
+
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        self._subscriptions[writer] = set()
+        try:
+            while True:
+                header = await reader.readexactly(1)
+                body = await reader.readexactly(await _read_remaining_length(reader))
+                if not self._handle_packet(header[0], body, writer):
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self._subscriptions[writer]
+            writer.close()
+
+    def _handle_packet(
+        self, header: int, body: bytes, writer: asyncio.StreamWriter
+    ) -> bool:
+        """
+
+        :param header: first byte of the fixed header.
+        :param body: packet after the fixed header.
+        :param writer: connection of the client.
+        :return: if the connection has to be kept open.
+        """
+        packet_type = header >> 4
+        if packet_type == CONNECT:
+            writer.write(_packet(CONNACK << 4, b"\x00\x00"))
+        elif packet_type == SUBSCRIBE:
+            packet_id, offset = body[:2], 2
+            granted = b""
+            while offset < len(body):
+                topic, offset = _read_string(body, offset)
+                offset += 1  # requested QoS
+                self._subscriptions[writer].add(_strip_share(topic))
+                granted += b"\x00"
+            writer.write(_packet(SUBACK << 4, packet_id + granted))
+            self._subscribed.set()
+        elif packet_type == UNSUBSCRIBE:
+            packet_id, offset = body[:2], 2
+            while offset < len(body):
+                topic, offset = _read_string(body, offset)
+                self._subscriptions[writer].discard(_strip_share(topic))
+            writer.write(_packet(UNSUBACK << 4, packet_id))
+        elif packet_type == PUBLISH:
+            qos = (header >> 1) & 0x03
+            topic, offset = _read_string(body, 0)
+            if qos:
+                packet_id, offset = body[offset:][:2], offset + 2
+                writer.write(_packet(PUBACK << 4, packet_id))
+            asyncio.create_task(self.publish(topic, body[offset:]))
+        elif packet_type == PINGREQ:
+            writer.write(_packet(PINGRESP << 4, b""))
+        elif packet_type == DISCONNECT:
+            return False
+        return True
+
+
+def _strip_share(topic: str) -> str:
+    if topic.startswith(SHARED_SUBSCRIPTION_PREFIX):
+        return topic.split("/", 2)[2]
+    return topic
+
+
+def _packet(header: int, body: bytes) -> bytes:
+    length = len(body)
+    remaining_length = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        remaining_length.append(byte | 0x80 if length else byte)
+        if not length:
+            break
+    return bytes([header]) + bytes(remaining_length) + body
+
+
+def _string(value: str) -> bytes:
+    encoded = value.encode()
+    return struct.pack("!H", len(encoded)) + encoded
+
+
+def _read_string(body: bytes, offset: int) -> Tuple[str, int]:
+    (length,) = struct.unpack_from("!H", body, offset)
+    start = offset + 2
+    end = start + length
+    return body[start:end].decode(), end
+
+
+async def _read_remaining_length(reader: asyncio.StreamReader) -> int:
+    length, multiplier = 0, 1
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            return length
+        multiplier *= 128
@@ -0,0 +1,66 @@
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import toad_influx_data.utils.protocol as prot
+
+DATABASE = "smartplugs"
+ROWS = 10
+COLUMNS = 10
+
+
+def device_ids(devices: int) -> List[str]:
+    """
+
+    :param devices: number of devices.
+    :return: IDs of smart plugs in a wall of `ROWS` rows, e.g. sp_w.r1.c2.
+    """
+    return [
+        f"sp_w.r{index // COLUMNS % ROWS}.c{index % COLUMNS}"
+        for index in range(devices)
+    ]
+
+
+def topic(device_id: str) -> str:
+    """
+
+    :param device_id: ID of the device that publishes the data.
+    :return: the topic that ~`GenericHandler` listens to, for the device.
+    """
+    return f"data/{device_id}/influx_data/{DATABASE}"
+
+
+def senml_pack(
+    device_id: str, records: int, send_time: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """
+    SenML pack of a device, alternating power and status records; the value of
+    every record is its send time, which the fake InfluxDB measures latency with.
+
+    :param device_id: ID of the device that publishes the data.
+    :param records: number of records of the pack.
+    :param send_time: send time of the records; now if not given.
+    :return: the SenML records.
+    """
+    send_time = time.time() if send_time is None else send_time
+    pack = []
+    for index in range(records):
+        record = {"bn": f"{device_id}/", "v": send_time, "t": send_time}
+        if index % 2:
+            record["n"] = "status"
+        else:
+            record["n"], record["u"] = "power", "W"
+        pack.append(record)
+    return pack
+
+
+def payload(device_id: str, records: int, send_time: Optional[float] = None) -> bytes:
+    """
+
+    :param device_id: ID of the device that publishes the data.
+    :param records: number of records of the pack.
+    :param send_time: send time of the records; now if not given.
+    :return: JSON MQTT payload with the SenML pack of the device.
+    """
+    data = senml_pack(device_id, records, send_time)
+    return json.dumps({prot.PAYLOAD_DATA_FIELD: data}).encode()
@@ -0,0 +1,157 @@
+import json
+
+import pytest
+
+from tests.utils import fake_writer
+from toad_influx_data.backfill import (
+    Backfill,
+    Checkpoint,
+    _merge_points,
+    find_files,
+    split_chunks,
+)
+from toad_influx_data.handlers.handler_abc import PointBatch
+from toad_influx_data.series import SeriesDescriptor
+
+TOPIC = "data/sp_m2/influx_data/db"
+
+
+def payload(index):
+    return {
+        "data": [
+            {
+                "bn": "sp_m2/",
+                "bt": 1584000000 + index,
+                "n": "power",
+                "u": "W",
+                "v": index,
+            },
+            {"n": "status", "v": 1},
+        ]
+    }
+
+
+def write_payloads(path, indexes, topic=None):
+    with open(path, "w") as file:
+        for index in indexes:
+            data = payload(index)
+            if topic is not None:
+                data["topic"] = topic
+            file.write(json.dumps(data) + "\n")
+
+
+def test_merge_points():
+    power = SeriesDescriptor("power", {"id": "sp_m2"}, "power,id=sp_m2")
+    key = ("db", "ms", "GenericHandler")
+    points = {}
+    for timestamp in (1, 2):
+        batch = PointBatch("ms")
+        batch.append(power, timestamp, 1.0)
+        _merge_points(points, key, batch)
+    assert isinstance(points[key], PointBatch)
+    assert list(points[key].timestamps) == [1, 2]
+    # batches of other fields are merged as lines
+    batch = PointBatch("ms", "state")
+    batch.append(power, 3, 1.0)
+    _merge_points(points, key, batch)
+    assert points[key] == [
+        b"power,id=sp_m2 value=1.0 1",
+        b"power,id=sp_m2 value=1.0 2",
+        b"power,id=sp_m2 state=1.0 3",
+    ]
+
+
+def test_find_files(tmp_path):
+    (tmp_path / "b").mkdir()
+    for name in ("a.jsonl", "b/c.jsonl", "b/d.txt"):
+        (tmp_path / name).write_text("")
+    assert find_files([str(tmp_path)]) == [
+        str(tmp_path / "a.jsonl"),
+        str(tmp_path / "b" / "c.jsonl"),
+    ]
+
+
+def test_split_chunks(tmp_path):
+    path = tmp_path / "a.jsonl"
+    path.write_bytes(b"aaaa\nbb\ncccccc\nd")
+    assert [chunk[1:] for chunk in split_chunks(str(path), 0, 3)] == [
+        (0, 5),
+        (5, 8),
+        (8, 15),
+        (15, 16),
+    ]
+    assert [chunk[1:] for chunk in split_chunks(str(path), 5, 100)] == [(5, 16)]
+    assert list(split_chunks(str(path), 16, 3)) == []
+
+
+@pytest.mark.asyncio
+async def test_backfill_resumes_from_checkpoint(tmp_path):
+    write_payloads(tmp_path / "a.jsonl", range(50))
+    write_payloads(tmp_path / "b.jsonl", range(50, 60), topic=TOPIC)
+    with open(tmp_path / "b.jsonl", "a") as file:
+        file.write("not json\n")
+        bad_record = {"n": "sp_m2/status", "v": 1}
+        file.write(json.dumps({"topic": TOPIC, "data": [bad_record]}) + "\n")
+    checkpoint = str(tmp_path / "checkpoint.json")
+    writer, writes = fake_writer(batch_size=40)
+    backfill = Backfill(writer, TOPIC, workers=2, chunk_size=500, checkpoint=checkpoint)
+
+    stats = await backfill.run([str(tmp_path)])
+    assert stats == {"payloads": 62, "errors": 1, "rejected": 1, "points": 120}
+    lines = b"\n".join(body for _, body, _ in writes).split(b"\n")
+    assert len(lines) == 120
+    assert lines[0] == b"power,id=sp_m2,type=m,unit=W value=0i 1584000000000"
+    assert {database for database, _, _ in writes} == {"db"}
+    offsets = Checkpoint(checkpoint).offsets
+    assert offsets[str(tmp_path / "b.jsonl")] == (tmp_path / "b.jsonl").stat().st_size
+
+    # only the new payloads are loaded again
+    write_payloads(tmp_path / "c.jsonl", range(60, 65))
+    writer, writes = fake_writer()
+    backfill = Backfill(writer, TOPIC, workers=1, checkpoint=checkpoint)
+    assert await backfill.run([str(tmp_path)]) == {
+        "payloads": 5,
+        "errors": 0,
+        "rejected": 0,
+        "points": 10,
+    }
+
+
+@pytest.mark.asyncio
+async def test_backfill_does_not_checkpoint_failed_writes(tmp_path):
+    write_payloads(tmp_path / "a.jsonl", range(5))
+    checkpoint = tmp_path / "checkpoint.json"
+    writer, _ = fake_writer()
+
+    async def post(database, body, time_precision):
+        raise ValueError("Invalid write")
+
+    writer.transports["http"].write = post  # type: ignore
+    backfill = Backfill(writer, TOPIC, workers=1, checkpoint=str(checkpoint))
+    with pytest.raises(RuntimeError):
+        await backfill.run([str(tmp_path)])
+    assert not checkpoint.exists()
+
+
+@pytest.mark.asyncio
+async def test_backfill_does_not_checkpoint_failed_batch_writes(tmp_path):
+    write_payloads(tmp_path / "a.jsonl", range(5))
+    checkpoint = tmp_path / "checkpoint.json"
+    writer, writes = fake_writer(batch_size=4)
+    post = writer.transports["http"].write
+    failures = [ValueError("Invalid write")]
+
+    async def fail_once(database, body, time_precision):
+        if failures:
+            raise failures.pop()
+        await post(database, body, time_precision)
+
+    writer.transports["http"].write = fail_once  # type: ignore
+    backfill = Backfill(
+        writer, TOPIC, workers=1, chunk_size=1, checkpoint=str(checkpoint)
+    )
+    # the first batch written when it is full fails, and the next ones succeed
+    with pytest.raises(RuntimeError):
+        await backfill.run([str(tmp_path)])
+    assert writes
+    assert not checkpoint.exists()
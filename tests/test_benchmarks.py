@@ -0,0 +1,20 @@
+import pytest
+
+from benchmarks import bench_server
+from benchmarks.__main__ import compare
+
+
+@pytest.mark.asyncio
+async def test_server_end_to_end_with_fakes():
+    result = await bench_server.run(messages=50, records=4, devices=5, timeout=10)
+    assert result["points_per_second"] == pytest.approx(
+        result["messages_per_second"] * 4
+    )
+    assert result["latency_p50_seconds"] <= result["latency_p99_seconds"]
+
+
+def test_compare_regressions():
+    baseline = {"benchmarks": {"a": {"points_per_second": 100, "latency": 1.0}}}
+    results = {"benchmarks": {"a": {"points_per_second": 95, "latency": 1.2}}}
+    assert compare(results, baseline, 0.1) == ["a.latency: 1 -> 1.2 (+20.0% worse)"]
+    assert compare(results, baseline, 0.25) == []
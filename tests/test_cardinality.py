@@ -0,0 +1,117 @@
+import pytest
+
+from toad_influx_data.cardinality import (
+    DROP,
+    FOLD,
+    WARN,
+    BloomFilter,
+    CardinalityGuard,
+    HyperLogLog,
+    hash_series,
+)
+from toad_influx_data.handlers.handler_abc import PointBatch
+from toad_influx_data.series import SeriesDescriptor
+
+
+def line(device, value=1):
+    return f"power,id={device},type=m value={value}i 1584000000000".encode()
+
+
+def test_hyperloglog_estimate():
+    sketch = HyperLogLog(precision=12)
+    for index in range(50000):
+        sketch.add(hash_series(f"power,id=sp_{index}".encode())[0])
+    assert sketch.estimate() == pytest.approx(50000, rel=0.05)
+    assert not sketch.add(hash_series(b"power,id=sp_0")[0])
+    assert HyperLogLog(precision=4).estimate() == 0
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=17)
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(1000, 0.01)
+    for index in range(1000):
+        bloom.add(hash_series(str(index).encode()))
+    assert all(hash_series(str(index).encode()) in bloom for index in range(1000))
+    false_positives = sum(
+        hash_series(str(index).encode()) in bloom for index in range(1000, 11000)
+    )
+    assert false_positives < 300
+
+
+def test_cardinality_warn():
+    guard = CardinalityGuard(limit=10, action=WARN)
+    points = [line(f"sp_{index}") for index in range(20)]
+    assert guard.filter("db", points) == points
+    assert guard.estimate("db", "power") == pytest.approx(20, abs=1)
+    assert guard.estimate("db", "status") == 0
+
+
+def test_cardinality_drop():
+    guard = CardinalityGuard(limit=10, action=DROP)
+    admitted = [line(f"sp_{index}") for index in range(11)]
+    assert guard.filter("db", admitted) == admitted
+    # the admitted series are still written, and the new ones are dropped
+    assert guard.filter("db", [line("sp_0", 2), line("sp_new")]) == [line("sp_0", 2)]
+    assert guard.filter("other_db", [line("sp_new")]) == [line("sp_new")]
+
+
+def test_cardinality_fold():
+    guard = CardinalityGuard(limit=10, action=FOLD, fold_tags=["id"])
+    guard.filter("db", [line(f"sp_{index}") for index in range(11)])
+    point = {
+        "measurement": "power",
+        "tags": {"id": "sp_new", "type": "m"},
+        "time": 1584000000000000000,
+        "fields": {"value": 1},
+    }
+    assert guard.filter("db", [line("sp_new"), point, b"power value=1i 1"]) == [
+        b'power,type=m value=1i,id="sp_new" 1584000000000',
+        {
+            "measurement": "power",
+            "tags": {"type": "m"},
+            "time": 1584000000000000000,
+            "fields": {"value": 1, "id": "sp_new"},
+        },
+    ]
+    assert point["tags"] == {"id": "sp_new", "type": "m"}
+
+
+def batch(*devices):
+    points = PointBatch("ms")
+    for device in devices:
+        series = SeriesDescriptor(
+            "power", {"id": device, "type": "m"}, f"power,id={device},type=m"
+        )
+        points.append(series, 1584000000000, 1)
+    return points
+
+
+def test_cardinality_batch():
+    guard = CardinalityGuard(limit=10, action=DROP)
+    admitted = batch(*(f"sp_{index}" for index in range(11)))
+    assert guard.filter("db", admitted) is admitted
+    kept = guard.filter("db", batch("sp_new", "sp_0"))
+    assert isinstance(kept, PointBatch)
+    assert kept.to_lines() == [line("sp_0")]
+    guard = CardinalityGuard(limit=10, action=FOLD, fold_tags=["id"])
+    guard.filter("db", batch(*(f"sp_{index}" for index in range(11))))
+    # the folded points have another field than the batch
+    assert guard.filter("db", batch("sp_0", "sp_new")) == [
+        line("sp_0"),
+        b'power,type=m value=1i,id="sp_new" 1584000000000',
+    ]
+
+
+def test_cardinality_max_measurements():
+    guard = CardinalityGuard(limit=10, action=DROP, max_measurements=1)
+    guard.filter("db", [line("sp_0")])
+    points = [f"status_{index},id=sp_0 value=1i 1".encode() for index in range(11)]
+    assert guard.filter("db", points) == points
+    assert guard.estimate("db", "*") == pytest.approx(11, abs=1)
+    assert guard.filter("db", [b"status_new,id=sp_0 value=1i 1"]) == []
+
+
+def test_cardinality_invalid_action():
+    with pytest.raises(ValueError):
+        CardinalityGuard(action="ignore")
@@ -0,0 +1,33 @@
+import cbor
+
+from toad_influx_data.codecs import CBORCodec, CodecRegistry, JSONCodec
+
+SENML_JSON_PACK = [{"bn": "sp_m2/power", "bt": 1584000000.5, "bu": "W", "v": 120.1}]
+# the same pack with SenML-CBOR integer labels
+SENML_CBOR_PACK = [{-2: "sp_m2/power", -3: 1584000000.5, -4: "W", 2: 120.1}]
+
+
+def test_json_codec_decodes_bytes_and_memoryview():
+    payload = b'{"data": [{"n": "sp_m2/power", "v": 1}]}'
+    for backend in ("json", "auto"):
+        codec = JSONCodec(backend)
+        assert codec.decode(payload) == {"data": [{"n": "sp_m2/power", "v": 1}]}
+        assert codec.decode(memoryview(payload)) == codec.decode(payload)
+
+
+def test_cbor_codec_senml_labels():
+    codec = CBORCodec()
+    expected = {"data": SENML_JSON_PACK}
+    assert codec.decode(cbor.dumps(SENML_CBOR_PACK)) == expected
+    assert codec.decode(cbor.dumps({"data": SENML_CBOR_PACK})) == expected
+    assert codec.decode(cbor.dumps({"data": SENML_JSON_PACK})) == expected
+
+
+def test_codec_registry_choice():
+    registry = CodecRegistry(topic_codecs=[("data/+/influx_data/cbor", "cbor")])
+    assert registry.get_codec("data/sp/influx_data/db").name == "json"
+    assert registry.get_codec("data/sp/influx_data/cbor").name == "cbor"
+    properties = {"content_type": ["application/senml+cbor"]}
+    assert registry.get_codec("data/sp/influx_data/db", properties).name == "cbor"
+    properties = {"content_type": ["application/json; charset=utf-8"]}
+    assert registry.get_codec("data/sp/influx_data/cbor", properties).name == "json"
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from tests.utils import fake_writer
+from toad_influx_data import metrics
+from toad_influx_data.handlers.generic_handler import GenericHandler
+from toad_influx_data.server import DataServer
+from toad_influx_data.utils import config
+
+TOPIC = "data/sp_m2/influx_data/db"
+
+
+def make_server():
+    writer, writes = fake_writer(flush_interval=60)
+    server = DataServer(handlers=[GenericHandler()], writer=writer)
+    published = []
+    server.mqtt_client.publish = lambda topic, payload, qos: published.append(
+        (topic, json.loads(payload))
+    )
+    return server, writes, published
+
+
+@pytest.mark.asyncio
+async def test_bad_records_are_dead_lettered(monkeypatch):
+    monkeypatch.setattr(config, "MQTT_DEAD_LETTER_TOPIC", "dead_letter")
+    server, writes, published = make_server()
+    rejected = metrics.RECORDS_REJECTED.labels("GenericHandler").value
+    received = metrics.MESSAGES_RECEIVED.labels("GenericHandler").value
+    payload = {
+        "data": [
+            {"n": "sp_m2/power", "t": 1584000000, "v": 1},
+            {"n": "sp_m2/power", "v": 2},
+        ]
+    }
+    await server.writer.start()
+    await server._mqtt_response_handler(TOPIC, json.dumps(payload).encode(), {})
+    await server.writer.stop()
+    assert [body for _, body, _ in writes] == [
+        b"power,id=sp_m2,type=m value=1i 1584000000000"
+    ]
+    assert published == [
+        (
+            "dead_letter",
+            {
+                "topic": TOPIC,
+                "handler": "GenericHandler",
+                "errors": [
+                    {
+                        "record": {"n": "sp_m2/power", "v": 2},
+                        "reason": "No time specified",
+                    }
+                ],
+            },
+        )
+    ]
+    assert metrics.RECORDS_REJECTED.labels("GenericHandler").value == rejected + 1
+    assert metrics.MESSAGES_RECEIVED.labels("GenericHandler").value == received + 1
+
+
+@pytest.mark.asyncio
+async def test_invalid_payloads_are_dead_lettered(monkeypatch):
+    monkeypatch.setattr(config, "MQTT_DEAD_LETTER_TOPIC", "dead_letter")
+    server, writes, published = make_server()
+    await server._mqtt_response_handler(TOPIC, b"not json", {})
+    assert writes == []
+    _, message = published[0]
+    assert message["handler"] is None
+    assert message["errors"][0]["record"] == "not json"
+    assert message["errors"][0]["reason"].startswith("Invalid payload")
+
+
+@pytest.mark.asyncio
+async def test_dead_letter_topic_disabled(monkeypatch):
+    monkeypatch.setattr(config, "MQTT_DEAD_LETTER_TOPIC", "")
+    server, _, published = make_server()
+    await server._mqtt_response_handler(TOPIC, b'{"data": [{"v": 1}]}', {})
+    assert published == []
@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import time
+from typing import Any, List
+
+import pytest
+
+from tests.utils import fake_writer
+from toad_influx_data.execution import HandlerExecutor
+from toad_influx_data.handlers.generic_handler import GenericHandler
+from toad_influx_data.handlers.handler_abc import INLINE, PROCESS, THREAD, IHandler
+from toad_influx_data.server import DataServer
+
+TOPIC = "data/sp_m2/influx_data/db"
+PAYLOAD = [{"n": "sp_m2/power", "t": 1584000000, "v": 1}]
+
+
+class SlowHandler(IHandler):
+    def __init__(self):
+        self.threads = set()
+
+    def get_topics(self) -> List[str]:
+        return ["slow/#"]
+
+    def can_handle(self, topic: str) -> bool:
+        return topic.startswith("slow/")
+
+    def get_influx_database(self, topic: str) -> str:
+        return "db"
+
+    def get_influx_power_points(self, data: Any) -> List[dict]:
+        if data is None:
+            raise ValueError("No data")
+        self.threads.add(threading.get_ident())
+        time.sleep(0.01)
+        return [{"measurement": "slow", "fields": {"value": data}}]
+
+    def get_influx_status_points(self, data: Any) -> List[dict]:
+        return []
+
+    def get_execution_mode(self) -> str:
+        return THREAD
+
+
+def collect():
+    results = []
+
+    async def result_handler(handler, topic, data, conversion, error):
+        results.append((topic, data, conversion, error))
+
+    return results, result_handler
+
+
+@pytest.mark.asyncio
+async def test_thread_pool_keeps_topic_order():
+    results, result_handler = collect()
+    executor = HandlerExecutor(result_handler, lanes=2, batch_size=4)
+    handler = SlowHandler()
+    assert executor.get_mode(handler) == THREAD
+    for index in range(10):
+        for topic in ("slow/a", "slow/b", "slow/c"):
+            await executor.submit(handler, topic, index)
+    await executor.submit(handler, "slow/a", None)
+    assert executor.pending > 0
+    await executor.stop()
+    assert executor.pending == 0
+    for topic in ("slow/a", "slow/b", "slow/c"):
+        assert [data for result_topic, data, _, _ in results if result_topic == topic][
+            :10
+        ] == list(range(10))
+    assert results[-1][2:] == (None, "No data")
+    assert threading.get_ident() not in handler.threads
+    database, points, time_precision, rejected = results[0][2]
+    assert (database, time_precision, rejected) == ("db", None, [])
+    assert points == [{"measurement": "slow", "fields": {"value": 0}}]
+
+
+@pytest.mark.asyncio
+async def test_slow_handler_does_not_block_the_event_loop():
+    results, result_handler = collect()
+    executor = HandlerExecutor(result_handler, lanes=1, batch_size=1)
+    for index in range(5):
+        await executor.submit(SlowHandler(), "slow/a", index)
+    start = time.perf_counter()
+    await asyncio.sleep(0)
+    assert time.perf_counter() - start < 0.01
+    await executor.stop()
+    assert len(results) == 5
+
+
+@pytest.mark.asyncio
+async def test_process_pool():
+    results, result_handler = collect()
+    executor = HandlerExecutor(
+        result_handler, process_workers=1, modes={"GenericHandler": PROCESS}
+    )
+    handler = GenericHandler()
+    assert executor.get_mode(handler) == PROCESS
+    await executor.submit(handler, TOPIC, PAYLOAD)
+    await executor.stop()
+    [(_, _, conversion, error)] = results
+    assert error is None
+    database, batch, time_precision, rejected = conversion
+    assert (database, time_precision, rejected) == ("db", "ms", [])
+    # the descriptors of the batch are rebuilt in this process
+    assert batch.series[0].tags == {"id": "sp_m2", "type": "m"}
+    assert batch.to_lines() == [b"power,id=sp_m2,type=m value=1i 1584000000000"]
+
+
+@pytest.mark.asyncio
+async def test_inline_handlers_are_not_submitted():
+    _, result_handler = collect()
+    executor = HandlerExecutor(result_handler)
+    assert executor.get_mode(GenericHandler()) == INLINE
+    with pytest.raises(ValueError):
+        await executor.submit(GenericHandler(), TOPIC, PAYLOAD)
+    with pytest.raises(ValueError):
+        HandlerExecutor(result_handler, modes={"GenericHandler": "fiber"})
+
+
+@pytest.mark.asyncio
+async def test_server_writes_pooled_conversions():
+    writer, writes = fake_writer(flush_interval=60)
+    server = DataServer(handlers=[SlowHandler()], writer=writer)
+    await writer.start()
+    await server._mqtt_response_handler("slow/a", b'{"data": 1}', {})
+    await server._mqtt_response_handler("slow/a", b'{"data": null}', {})
+    await server.executor.stop()
+    await writer.stop()
+    assert [(database, body.strip()) for database, body, _ in writes] == [
+        ("db", b"slow value=1i")
+    ]
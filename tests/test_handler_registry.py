@@ -0,0 +1,81 @@
+import subprocess
+import sys
+from typing import Any, List
+from unittest import mock
+
+import pytest
+
+from toad_influx_data.handlers import registry
+from toad_influx_data.handlers.generic_handler import GenericHandler
+from toad_influx_data.handlers.handler_abc import IHandler, InfluxPoint
+from toad_influx_data.handlers.registry import HandlerRegistry, import_handler
+
+PLUGIN = f"{__name__}:PluginHandler"
+
+
+class PluginHandler(IHandler):
+    def get_topics(self) -> List[str]:
+        return ["plugin/+/data"]
+
+    def can_handle(self, topic: str) -> bool:
+        return True
+
+    def get_influx_database(self, topic: str) -> str:
+        return "plugin"
+
+    def get_influx_power_points(self, data: Any) -> List[InfluxPoint]:
+        return []
+
+    def get_influx_status_points(self, data: Any) -> List[InfluxPoint]:
+        return []
+
+
+def test_import_handler():
+    assert isinstance(import_handler(PLUGIN), PluginHandler)
+    with pytest.raises(ValueError):
+        import_handler(__name__)
+    with pytest.raises(TypeError):
+        import_handler(f"{__name__}:PLUGIN")
+
+
+def test_registry_loads_enabled_handlers():
+    handlers = HandlerRegistry(enabled=["generic", PLUGIN], lazy={}).load_enabled()
+    assert [type(handler) for handler in handlers] == [GenericHandler, PluginHandler]
+
+
+def test_registry_discovers_entry_points():
+    entry_point = mock.Mock(value=PLUGIN)
+    entry_point.name = "plugin"
+    entry_points = mock.Mock()
+    entry_points.select.return_value = [entry_point]
+    with mock.patch.object(
+        registry.metadata, "entry_points", return_value=entry_points
+    ):
+        handler_registry = HandlerRegistry(enabled=["plugin"], lazy={})
+    builtin = registry.BUILTIN_HANDLERS["generic"]
+    assert handler_registry.available["generic"] == builtin
+    assert isinstance(handler_registry.load_enabled()[0], PluginHandler)
+
+
+def test_registry_loads_lazy_handlers_on_first_topic():
+    handler_registry = HandlerRegistry(enabled=[], lazy={PLUGIN: ["plugin/#"]})
+    assert handler_registry.get_lazy_topics() == ["plugin/#"]
+    assert handler_registry.load_for("data/sp/influx_data/db") == []
+    assert handler_registry.loaded == {}
+
+    handlers = handler_registry.load_for("plugin/sp/data")
+    assert [type(handler) for handler in handlers] == [PluginHandler]
+    assert handler_registry.load_for("plugin/other/data") == []
+    assert handler_registry.load(PLUGIN) is handlers[0]
+
+
+def test_importing_the_server_defers_handler_dependencies():
+    code = (
+        "import sys, toad_influx_data.server; "
+        "print(any(m in sys.modules for m in ('senml', 'strict_rfc3339', "
+        "'aioinflux', 'toad_influx_data.handlers.generic_handler')))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, check=True, text=True
+    )
+    assert output.stdout.strip() == "False"
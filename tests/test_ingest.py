@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from toad_influx_data.ingest import (
+    IngestQueue,
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_DROP_OLDEST,
+)
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.payloads = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, topic, payload, properties):
+        await self.release.wait()
+        self.payloads.append(payload)
+
+
+async def fill_queue(policy, **kwargs):
+    handler = RecordingHandler()
+    queue = IngestQueue(handler, maxsize=2, workers=1, overflow_policy=policy, **kwargs)
+    await queue.start()
+    queue.put_nowait("topic", b"0", None)
+    await asyncio.sleep(0)  # the worker takes the first message
+    for payload in (b"1", b"2", b"3"):
+        queue.put_nowait("topic", payload, None)
+    return handler, queue
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_drop_newest():
+    handler, queue = await fill_queue(OVERFLOW_DROP_NEWEST)
+    assert queue.depth == 2
+    assert queue.dropped == 1
+    handler.release.set()
+    await queue.stop()
+    assert handler.payloads == [b"0", b"1", b"2"]
+    assert queue.processed == 3
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_drop_oldest():
+    handler, queue = await fill_queue(OVERFLOW_DROP_OLDEST)
+    assert queue.depth == 2
+    assert queue.dropped == 1
+    handler.release.set()
+    await queue.stop()
+    assert handler.payloads == [b"0", b"2", b"3"]
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_block_pauses_and_resumes():
+    calls = []
+    handler, queue = await fill_queue(
+        OVERFLOW_BLOCK,
+        pause=lambda: calls.append("pause"),
+        resume=lambda: calls.append("resume"),
+    )
+    assert calls == ["pause"]
+    assert queue.dropped == 0
+    handler.release.set()
+    await queue.stop()
+    assert calls == ["pause", "resume"]
+    assert handler.payloads == [b"0", b"1", b"2", b"3"]
+
+
+def test_ingest_queue_unknown_policy():
+    with pytest.raises(ValueError):
+        IngestQueue(RecordingHandler, overflow_policy="unknown")
@@ -0,0 +1,166 @@
+import json
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer, make_mocked_request
+
+from toad_influx_data.handlers.handler_abc import PointBatch
+from toad_influx_data.last_values import LAST_VALUES_PATH, LastValueStore
+from toad_influx_data.series import SeriesDescriptor
+from toad_influx_data.utils import line_protocol
+
+LINES = [
+    b"power,column=1,id=sp_w.r1.c1,row=1,type=w,unit=W value=120.1 1584000000250",
+    b"power,column=2,id=sp_w.r1.c2,row=1,type=w,unit=W value=80.0 1584000000250",
+    b"status,id=sp_m2,type=m value=1i 1584000000500",
+]
+
+
+def test_parse_tags():
+    assert line_protocol.parse_tags(b",id=a\\,b,type=m") == {"id": "a,b", "type": "m"}
+    assert line_protocol.parse_tags(b"") == {}
+
+
+def test_last_values_keeps_the_newest_point():
+    store = LastValueStore()
+    store.update("db", LINES, "ms")
+    store.update(
+        "db", [b"power,column=1,id=sp_w.r1.c1,row=1,type=w,unit=W value=1.0 1"], "ms"
+    )
+    store.update(
+        "db",
+        [b"power,column=1,id=sp_w.r1.c1,row=1,type=w,unit=W value=99.5 1584000001"],
+        "s",
+    )
+    assert len(store) == 3
+    assert store.query(tags={"id": "sp_w.r1.c1"}) == [
+        {
+            "database": "db",
+            "measurement": "power",
+            "tags": {
+                "column": "1",
+                "id": "sp_w.r1.c1",
+                "row": "1",
+                "type": "w",
+                "unit": "W",
+            },
+            "time": 1584000001.0,
+            "fields": {"value": 99.5},
+        }
+    ]
+
+
+def test_last_values_indexes():
+    store = LastValueStore()
+    store.update("db", LINES, "ms")
+    store.update(
+        "other",
+        [
+            {
+                "time": 1584000000000000000,
+                "measurement": "power",
+                "tags": {"id": "sp_m3", "type": "m"},
+                "fields": {"value": 5.0},
+            }
+        ],
+        None,
+    )
+
+    def ids(**kwargs):
+        return sorted(value["tags"]["id"] for value in store.query(**kwargs))
+
+    assert ids(tags={"row": "1"}) == ["sp_w.r1.c1", "sp_w.r1.c2"]
+    assert ids(tags={"row": "1", "column": "2"}) == ["sp_w.r1.c2"]
+    assert ids(tags={"type": "m"}) == ["sp_m2", "sp_m3"]
+    assert ids(tags={"type": "m"}, database="other") == ["sp_m3"]
+    assert ids(measurement="status") == ["sp_m2"]
+    assert ids(tags={"row": "9"}) == []
+    with pytest.raises(ValueError):
+        store.query(tags={"unit": "W"})
+
+
+def test_last_values_measurements_and_max_series():
+    store = LastValueStore(measurements=["status"], max_series=2)
+    store.update("db", LINES, "ms")
+    assert [value["measurement"] for value in store.query()] == ["status"]
+    store.update("db", [b"status,id=sp_m3,type=m value=0i 1"], "ms")
+    assert len(store) == 2
+    # the ignored series count too, and the store is reset when it is full
+    store.update("db", [b"status,id=sp_m4,type=m value=0i 1"], "ms")
+    assert len(store) == 1
+
+
+@pytest.mark.asyncio
+async def test_last_values_http_api():
+    store = LastValueStore()
+    store.update("db", LINES, "ms")
+    response = await store.handle_request(
+        make_mocked_request("GET", "/last_values?measurement=power&column=2")
+    )
+    values = json.loads(response.body)
+    assert [value["tags"]["id"] for value in values] == ["sp_w.r1.c2"]
+    with pytest.raises(web.HTTPBadRequest):
+        await store.handle_request(make_mocked_request("GET", "/last_values?unit=W"))
+
+
+@pytest.mark.asyncio
+async def test_last_values_queries_peers():
+    peer = LastValueStore()
+    peer.update("db", LINES[:1], "ms")
+    peer.update("db", [b"power,id=sp_m3,type=m value=3.0 1584000000"], "s")
+    app = web.Application()
+    app.router.add_get(LAST_VALUES_PATH, peer.handle_request)
+    server = TestServer(app, port=0)
+    await server.start_server()
+    try:
+        store = LastValueStore(peers=[f"http://{server.host}:{server.port}"])
+        # the peer has an older point of the series
+        store.update(
+            "db",
+            [b"power,column=1,id=sp_w.r1.c1,row=1,type=w,unit=W value=1.0 1584000001"],
+            "s",
+        )
+        response = await store.handle_request(
+            make_mocked_request("GET", "/last_values?measurement=power")
+        )
+        values = {
+            value["tags"]["id"]: value["fields"]["value"]
+            for value in json.loads(response.body)
+        }
+        assert values == {"sp_w.r1.c1": 1.0, "sp_m3": 3.0}
+        response = await store.handle_request(
+            make_mocked_request("GET", "/last_values?measurement=power&local=1")
+        )
+        assert len(json.loads(response.body)) == 1
+        with pytest.raises(web.HTTPBadRequest):
+            await store.handle_request(make_mocked_request("GET", "/last_values?a=1"))
+    finally:
+        await server.close()
+    with pytest.raises(web.HTTPServiceUnavailable):
+        await store.handle_request(make_mocked_request("GET", "/last_values"))
+
+
+def test_last_values_point_batch():
+    store = LastValueStore(measurements=["power"])
+    power = SeriesDescriptor(
+        "power", {"id": "sp_m2", "type": "m"}, "power,id=sp_m2,type=m"
+    )
+    status = SeriesDescriptor(
+        "status", {"id": "sp_m2", "type": "m"}, "status,id=sp_m2,type=m"
+    )
+    batch = PointBatch("ms")
+    batch.extend([power, power, status], [1584000000250, 1000, 1000], [1.5, 2.0, 1])
+    store.update("db", batch, None)
+    assert store.query() == [
+        {
+            "database": "db",
+            "measurement": "power",
+            "tags": {"id": "sp_m2", "type": "m"},
+            "time": 1584000000.25,
+            "fields": {"value": 1.5},
+        }
+    ]
+    # the lines of the series update the same last value
+    store.update("db", [b"power,id=sp_m2,type=m value=3i 1584000001"], "s")
+    assert len(store) == 1
+    assert store.query()[0]["fields"] == {"value": 3}
@@ -0,0 +1,68 @@
+import pytest
+
+from toad_influx_data.handlers.generic_handler import GenericHandler
+from toad_influx_data.utils import line_protocol
+
+
+def test_encode_series_key_escapes_and_sorts_tags():
+    series_key = line_protocol.encode_series_key(
+        "power usage", [("type", "w"), ("id", "a,b=c"), ("unit", None)]
+    )
+    assert series_key == r"power\ usage,id=a\,b\=c,type=w"
+
+
+def test_encode_fields_types():
+    fields = {"f": 1.5, "i": 1, "b": True, "s": 'say "hi"', "n": None}
+    assert line_protocol.encode_fields(fields) == r'f=1.5,i=1i,b=true,s="say \"hi\""'
+
+
+@pytest.mark.parametrize("value", [float("nan"), float("inf"), float("-inf")])
+def test_encode_field_value_rejects_non_finite_floats(value):
+    with pytest.raises(ValueError):
+        line_protocol.encode_field_value(value)
+
+
+def test_generic_handler_rejects_non_finite_values():
+    handler = GenericHandler()
+    pack = [
+        {"n": "sp_m2/power", "t": 1584000000, "v": float("nan")},
+        {"n": "sp_m2/power", "t": 1584000001, "v": float("inf")},
+        {"n": "sp_m2/power", "t": 1584000002, "v": 1.5},
+    ]
+    batch = handler.get_influx_point_batch(pack)
+    assert batch.to_lines() == [b"power,id=sp_m2,type=m value=1.5 1584000002000"]
+    assert [reason for _, reason in batch.rejected] == [
+        "Value is not finite: nan",
+        "Value is not finite: inf",
+    ]
+
+
+def test_to_timestamp():
+    assert line_protocol.to_timestamp(1.5, "s") == 2
+    assert line_protocol.to_timestamp(1.5, "ms") == 1500
+    assert line_protocol.to_timestamp(1.5, None) == 1500000000
+
+
+def test_generic_handler_lines():
+    handler = GenericHandler()
+    data = [
+        {"bn": "sp_w.r1.c1/", "bt": 1584000000.25, "n": "power", "u": "W", "v": 120.1},
+        {"bn": "sp_m2/", "n": "status", "t": 0.25, "v": 1},
+    ]
+    assert handler.get_influx_point_batch(data).to_lines() == [
+        b"power,column=1,id=sp_w.r1.c1,row=1,type=w,unit=W value=120.1 1584000000250",
+        b"status,id=sp_m2,type=m value=1i 1584000000500",
+    ]
+
+
+def test_generic_handler_batch_lines():
+    handler = GenericHandler()
+    pack = [
+        {"n": "sp_w.r1.c1/power", "t": 1584000000 + i, "u": "W", "v": float(i)}
+        for i in range(300)
+    ]
+    lines = handler.get_influx_point_batch(pack).to_lines()
+    assert len(lines) == 300
+    assert lines[299] == (
+        b"power,column=1,id=sp_w.r1.c1,row=1,type=w,unit=W value=299.0 1584000299000"
+    )
@@ -0,0 +1,64 @@
+import logging
+import queue
+from unittest import mock
+
+from toad_influx_data.utils import logger
+
+
+def test_sampler_logs_one_in_every():
+    sampler = logger._Sampler(every=10, rate=1000)
+    sampled = [sampler.sample() for _ in range(100)]
+    assert sum(sampled) == 10
+    assert sampled[9] and not sampled[10]
+    assert sampler.seen == 100 and sampler.logged == 10
+
+
+def test_sampler_rate_limit():
+    sampler = logger._Sampler(every=1, rate=5)
+    assert sum(sampler.sample() for _ in range(1000)) == 5
+    assert sampler.suppressed == 995
+
+
+def test_log_info_sampled(caplog):
+    sampler = logger._Sampler(every=3, rate=1000)
+    with mock.patch.object(logger, "VERBOSE", True), mock.patch.dict(
+        logger._samplers, {"test.category": sampler}
+    ), caplog.at_level(logging.INFO):
+        for index in range(7):
+            logger.log_info_sampled("test.category", "message %d", index)
+        assert logger.get_suppressed()["test.category"] == 5
+    assert [record.getMessage() for record in caplog.records] == [
+        "message 2 (+2 test.category messages suppressed)",
+        "message 5 (+2 test.category messages suppressed)",
+    ]
+
+
+def test_log_info_sampled_not_verbose(caplog):
+    points = mock.MagicMock()
+    with mock.patch.object(logger, "VERBOSE", False), caplog.at_level(logging.INFO):
+        logger.log_info_sampled("test.not_verbose", "points %s", points)
+    assert caplog.records == []
+    points.__str__.assert_not_called()
+
+
+def test_queue_handler_drops_when_full():
+    handler = logger._DroppingQueueHandler(queue.Queue(2))
+    record = logging.LogRecord("test", logging.INFO, "", 0, "message %s", ("a",), None)
+    for _ in range(5):
+        handler.emit(record)
+    assert handler.dropped == 3
+    # formatted lazily, by the listener
+    assert handler.queue.get_nowait().args == ("a",)
+
+
+def test_configure_logs_from_a_thread(capsys):
+    root = logging.getLogger()
+    level = root.level
+    logger.configure(queue_size=10)
+    try:
+        logger.log_info("hello %s", "world")
+    finally:
+        logger.shutdown()
+        root.setLevel(level)
+    assert "hello world" in capsys.readouterr().err
+    assert logger.get_dropped() == 0
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from toad_influx_data import main
+from toad_influx_data import runtime
+from toad_influx_data.server import DataServer
+
+
+class ServerCreated(Exception):
+    pass
+
+
+class EventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    pass
+
+
+def test_run_server_creates_server_after_installing_policy(monkeypatch):
+    servers = []
+
+    def install_event_loop_policy():
+        asyncio.set_event_loop_policy(EventLoopPolicy())
+        return runtime.EVENT_LOOP_ASYNCIO
+
+    def create_server():
+        assert isinstance(asyncio.get_event_loop_policy(), EventLoopPolicy)
+        servers.append(DataServer(handlers=[]))
+        raise ServerCreated()
+
+    monkeypatch.setattr(runtime, "install_event_loop_policy", install_event_loop_policy)
+    monkeypatch.setattr(runtime, "tune_gc", lambda: None)
+    try:
+        with pytest.raises(ServerCreated):
+            main.run_server(create_server)
+        loop = asyncio.get_event_loop()
+        # the MQTT client schedules a task on the current loop when it is created
+        resend_task = servers[0].mqtt_client._resend_task
+        assert resend_task.get_loop() is loop
+        resend_task.cancel()
+        loop.run_until_complete(asyncio.gather(resend_task, return_exceptions=True))
+        loop.close()
+    finally:
+        asyncio.set_event_loop_policy(None)
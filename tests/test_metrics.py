@@ -0,0 +1,46 @@
+import aiohttp
+import pytest
+
+from toad_influx_data.http_api import HTTPServer
+from toad_influx_data.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_registry_exposition():
+    registry = Registry()
+    counter = Counter("messages_total", "Messages.", ["topic"], registry=registry)
+    gauge = Gauge("depth", "Depth.", registry=registry)
+    histogram = Histogram("latency", "Latency.", buckets=(0.1, 1), registry=registry)
+    counter.labels('a"b').inc()
+    counter.labels('a"b').inc(2)
+    gauge.set_function(lambda: 7)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    assert registry.expose().splitlines() == [
+        "# HELP messages_total Messages.",
+        "# TYPE messages_total counter",
+        'messages_total{topic="a\\"b"} 3.0',
+        "# HELP depth Depth.",
+        "# TYPE depth gauge",
+        "depth 7.0",
+        "# HELP latency Latency.",
+        "# TYPE latency histogram",
+        'latency_bucket{le="0.1"} 1',
+        'latency_bucket{le="1.0"} 2',
+        'latency_bucket{le="+Inf"} 3',
+        "latency_sum 5.55",
+        "latency_count 3",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_http_server_metrics():
+    http_server = HTTPServer("127.0.0.1", 0)
+    await http_server.start()
+    port = http_server._runner.addresses[0][1]
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"http://127.0.0.1:{port}/metrics") as resp:
+            assert resp.status == 200
+            assert "# TYPE toad_write_seconds histogram" in await resp.text()
+    await http_server.stop()
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from tests.utils import fake_writer
+from toad_influx_data import metrics
+from toad_influx_data.handlers.generic_handler import GenericHandler
+from toad_influx_data.handlers.handler_abc import PointBatch
+from toad_influx_data.parquet_sink import ParquetSink, get_partition_directory
+from toad_influx_data.series import SeriesDescriptor
+from toad_influx_data.server import DataServer
+from toad_influx_data.writer import ISink
+
+DAY = 18333  # 2020-03-12
+POWER = SeriesDescriptor("power", {"id": "sp_m2", "type": "m"}, "power,id=sp_m2,type=m")
+
+
+def test_partition_directory():
+    assert get_partition_directory("archive", "db", "power/1m", DAY) == os.path.join(
+        "archive", "db", "power%2F1m", "date=2020-03-12"
+    )
+
+
+@pytest.mark.asyncio
+async def test_parquet_sink_buffers_columns(tmp_path):
+    sink = ParquetSink(str(tmp_path), row_group_size=10)
+    await sink.write(
+        "db",
+        [
+            b"power,id=sp_m2,type=m value=1.5 1584000000000",
+            b"power,id=sp_m3 value=2.5,on=true 1584000001000",
+            b"status,id=sp_m2 value=1i 1583999999000",
+        ],
+        "ms",
+    )
+    await sink.write(
+        "db",
+        [
+            {
+                "measurement": "power",
+                "tags": {"id": "sp_m4"},
+                "time": 1584000002000000000,
+                "fields": {"value": 3.5},
+            }
+        ],
+    )
+    assert sink.pending() == 4
+    power = sink._partitions[("db", "power", DAY)]
+    assert power.times == [
+        1584000000000000000,
+        1584000001000000000,
+        1584000002000000000,
+    ]
+    assert power.columns == {
+        "id": ["sp_m2", "sp_m3", "sp_m4"],
+        "type": ["m", None, None],
+        "value": [1.5, 2.5, 3.5],
+        "on": [None, True, None],
+    }
+    assert power.tag_keys == {"id", "type"}
+    assert ("db", "status", DAY) in sink._partitions
+
+
+@pytest.mark.asyncio
+async def test_parquet_sink_writes_and_compacts(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    # the day is not closed yet
+    sink = ParquetSink(str(tmp_path), row_group_size=2, close_after=10 ** 10)
+    await sink.start()
+    batch = PointBatch("ms")
+    batch.extend([POWER] * 3, [1584000002000, 1584000000000, 1584000001000], [3, 1, 2])
+    await sink.write("db", batch)
+    # the flush task writes the full partition
+    while sink.pending():
+        await asyncio.sleep(0.01)
+    # a new tag starts a new part file
+    await sink.write("db", [b"power,id=sp_m2,row=1 value=4i 1584000003000"], "ms")
+    await sink.stop()
+    directory = get_partition_directory(str(tmp_path), "db", "power", DAY)
+    parts = sorted(os.listdir(directory))
+    assert len(parts) == 2
+    table = pq.read_table(os.path.join(directory, parts[0]))
+    assert table.column_names == ["time", "id", "type", "value"]
+    assert table.column("value").to_pylist() == [3, 1, 2]
+
+    # the day closed long ago, so its part files are found and compacted
+    sink = ParquetSink(str(tmp_path), close_after=0)
+    await sink.start()
+    await sink.stop()
+    assert os.listdir(directory) == ["data.parquet"]
+    table = pq.read_table(os.path.join(directory, "data.parquet"))
+    assert table.column("value").to_pylist() == [1, 2, 3, 4]
+    assert table.column("row").to_pylist() == [None, None, None, "1"]
+    assert table.schema.metadata[b"tags"] == b"id,row,type"
+
+
+@pytest.mark.asyncio
+async def test_parquet_sink_buffers_rows_that_fail_to_be_written(tmp_path):
+    sink = ParquetSink(str(tmp_path), close_after=10 ** 10)
+    written = []
+
+    def write_row_group(key, partition):
+        if not written:
+            written.append(None)
+            raise OSError("No space left on device")
+        written.append(list(partition.columns["value"]))
+
+    sink._write_row_group = write_row_group  # type: ignore
+    await sink.write("db", [b"power,id=sp_m2 value=1i 1584000000000"], "ms")
+    with pytest.raises(OSError):
+        await sink.flush()
+    await sink.write("db", [b"power,id=sp_m2 value=2i 1584000001000"], "ms")
+    assert sink.pending() == 2
+    await sink.flush()
+    assert written == [None, [1, 2]]
+    assert sink.pending() == 0
+
+
+class FailingSink(ISink):
+    async def write(self, database, points, time_precision=None):
+        raise OSError("No space left on device")
+
+
+@pytest.mark.asyncio
+async def test_failing_sink_does_not_affect_influx_writes():
+    writer, writes = fake_writer(flush_interval=60)
+    server = DataServer(handlers=[GenericHandler()], writer=writer)
+    server.sinks = [FailingSink()]
+    errors = metrics.SINK_ERRORS.labels("FailingSink").value
+    payload = {"data": [{"n": "sp_m2/power", "t": 1584000000, "v": 1}]}
+    await writer.start()
+    await server._mqtt_response_handler(
+        "data/sp_m2/influx_data/db", json.dumps(payload).encode(), {}
+    )
+    await writer.stop()
+    assert [body for _, body, _ in writes] == [
+        b"power,id=sp_m2,type=m value=1i 1584000000000"
+    ]
+    assert metrics.SINK_ERRORS.labels("FailingSink").value == errors + 1
+
+
+class RecordingSink(ISink):
+    def __init__(self):
+        self.writes = []
+
+    async def write(self, database, points, time_precision=None):
+        self.writes.append((database, points, time_precision))
+
+
+@pytest.mark.asyncio
+async def test_sinks_get_point_batches():
+    writer, writes = fake_writer(flush_interval=60)
+    server = DataServer(handlers=[GenericHandler()], writer=writer)
+    sink = RecordingSink()
+    server.sinks = [sink]
+    payload = {"data": [{"n": "sp_m2/power", "t": 1584000000, "v": 1}]}
+    await writer.start()
+    await server._mqtt_response_handler(
+        "data/sp_m2/influx_data/db", json.dumps(payload).encode(), {}
+    )
+    await writer.stop()
+    # the batch is only serialized by the writer
+    [(database, points, time_precision)] = sink.writes
+    assert (database, time_precision) == ("db", "ms")
+    assert isinstance(points, PointBatch)
+    assert points.series == [POWER]
+    assert writes == [("db", b"power,id=sp_m2,type=m value=1i 1584000000000", "ms")]
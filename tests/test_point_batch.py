@@ -0,0 +1,150 @@
+import pickle
+import time
+
+import pytest
+
+from tests.utils import fake_writer
+from toad_influx_data.handlers.generic_handler import GenericHandler
+from toad_influx_data.handlers.handler_abc import PointBatch
+from toad_influx_data.series import SeriesDescriptor
+from toad_influx_data.transports import UDPTransport
+from toad_influx_data.writer import InfluxWriter
+
+POWER = SeriesDescriptor("power", {"id": "sp_m2", "unit": "W"}, "power,id=sp_m2,unit=W")
+
+
+def test_point_batch_lines_and_points():
+    batch = PointBatch("ms")
+    batch.append(POWER, 1584000000250, 120.5)
+    batch.extend([POWER, POWER], [1584000000500, 1584000000750], [True, "on"])
+    assert len(batch) == 3
+    assert batch.to_lines() == [
+        b"power,id=sp_m2,unit=W value=120.5 1584000000250",
+        b"power,id=sp_m2,unit=W value=true 1584000000500",
+        b'power,id=sp_m2,unit=W value="on" 1584000000750',
+    ]
+    assert batch.to_points()[0] == {
+        "time": 1584000000250000000,
+        "measurement": "power",
+        "tags": {"id": "sp_m2", "unit": "W"},
+        "fields": {"value": 120.5},
+    }
+
+
+def test_point_batch_take_and_time_precision():
+    batch = PointBatch("ms")
+    batch.extend([POWER] * 3, [1500, 2500, 3500], [1.0, 2.0, 3.0])
+    taken = batch.take([0, 2])
+    assert (taken.time_precision, taken.field) == ("ms", "value")
+    assert list(taken.timestamps) == [1500, 3500]
+    assert taken.values == [1.0, 3.0]
+    assert batch.with_time_precision("ms") is batch
+    assert list(batch.with_time_precision("u").timestamps) == [
+        1500000,
+        2500000,
+        3500000,
+    ]
+    assert list(batch.with_time_precision("s").timestamps) == [2, 2, 4]
+    assert batch.with_time_precision(None).values is batch.values
+
+
+def test_series_descriptor_pickles():
+    series = pickle.loads(pickle.dumps(POWER))
+    assert (series.measurement, series.series_key) == ("power", POWER.series_key)
+    assert series.tags == POWER.tags
+    with pytest.raises(TypeError):
+        series.tags["id"] = "changed"  # type: ignore
+
+
+def test_point_batch_extend_lengths():
+    with pytest.raises(ValueError):
+        PointBatch().extend([POWER], [1, 2], [1.0])
+
+
+def test_generic_handler_point_batch():
+    handler = GenericHandler()
+    pack = [
+        {"bn": "sp_w.r1.c1/", "bt": 1584000000.25, "n": "power", "u": "W", "v": 120.1},
+        {"bn": "sp_m2/", "n": "status", "t": 0.25, "v": 1},
+    ]
+    batch = handler.get_influx_point_batch(pack)
+    assert batch.time_precision == "ms"
+    assert list(batch.timestamps) == [1584000000250, 1584000000500]
+    assert batch.series[0] is handler.series_cache.get("sp_w.r1.c1/", "power", "W")
+    assert batch.to_lines() == [
+        b"power,column=1,id=sp_w.r1.c1,row=1,type=w,unit=W value=120.1 1584000000250",
+        b"status,id=sp_m2,type=m value=1i 1584000000500",
+    ]
+
+
+def test_generic_handler_point_batch_rejects_records():
+    handler = GenericHandler()
+    pack = [
+        {"n": "sp_m2/power", "t": 1584000000, "v": 1},
+        {"n": "sp_m2/power", "v": 2},
+        {"n": "sp_m2", "t": 1584000000, "v": 3},
+        {"n": "sp_m2/status", "t": 1584000000},
+        {"n": "sp_m2/power", "t": 1584000001, "v": 4},
+    ]
+    batch = handler.get_influx_point_batch(pack)
+    assert list(batch.values) == [1, 4]
+    assert [reason for _, reason in batch.rejected] == [
+        "No time specified",
+        "Name is not <id>/<measurement>: sp_m2",
+        "No value specified",
+    ]
+    assert batch.rejected[0][0] is pack[1]
+
+
+def test_generic_handler_point_batch_resolves_base_fields():
+    handler = GenericHandler()
+    pack = [
+        {"bn": "sp_m2/", "bt": 1584000000, "bu": "W", "n": "power", "t": 0, "v": 1},
+        {"n": "power", "t": 1, "v": 2},
+        {"n": "status", "t": 2, "vb": True},
+        {"bn": "sp_m3/", "bt": 1584000010, "bv": 100, "n": "power", "v": 3},
+        {"n": "status", "t": -1, "vs": "on"},
+    ]
+    assert handler.get_influx_point_batch(pack).to_lines() == [
+        b"power,id=sp_m2,type=m,unit=W value=1i 1584000000000",
+        b"power,id=sp_m2,type=m,unit=W value=2i 1584000001000",
+        b"status,id=sp_m2,type=m,unit=W value=true 1584000002000",
+        b"power,id=sp_m3,type=m,unit=W value=103i 1584000010000",
+        b'status,id=sp_m3,type=m,unit=W value="on" 1584000009000',
+    ]
+    # times without a base time below 2**28 are relative to now
+    start = time.time()
+    batch = handler.get_influx_point_batch([{"n": "sp_m2/power", "t": -1, "v": 1}])
+    assert round(start * 1000) - 1000 <= batch.timestamps[0]
+    assert batch.timestamps[0] <= round(time.time() * 1000) - 1000
+
+
+@pytest.mark.asyncio
+async def test_writer_serializes_point_batch():
+    writer, writes = fake_writer(flush_interval=60)
+    batch = PointBatch("ms")
+    batch.append(POWER, 10, 1.0)
+    await writer.start()
+    await writer.write("db", batch)
+    await writer.stop()
+    assert writes == [("db", b"power,id=sp_m2,unit=W value=1.0 10", "ms")]
+
+
+@pytest.mark.asyncio
+async def test_writer_serializes_point_batch_in_transport_precision():
+    udp = UDPTransport("127.0.0.1", 8089, precision="ns")
+    writer = InfluxWriter(
+        transports={"udp": udp}, default_transport="udp", routes={}, flush_interval=60
+    )
+    writes = []
+
+    async def write(database, body, time_precision):
+        writes.append((database, body, time_precision))
+
+    udp.write = write  # type: ignore
+    batch = PointBatch("ms")
+    batch.append(POWER, 10, 1.0)
+    await writer.start()
+    await writer.write("db", batch)
+    await writer.stop()
+    assert writes == [("db", b"power,id=sp_m2,unit=W value=1.0 10000000", "ns")]
@@ -0,0 +1,152 @@
+import time
+
+import pytest
+
+from tests.utils import fake_writer
+from toad_influx_data.handlers.handler_abc import PointBatch
+from toad_influx_data.rollup import Rollup, parse_interval
+from toad_influx_data.series import SeriesDescriptor
+from toad_influx_data.server import DataServer
+from toad_influx_data.sharding import Shard
+from toad_influx_data.utils import config
+from toad_influx_data.utils import line_protocol
+
+
+class FakeWriter:
+    def __init__(self):
+        self.writes = []
+
+    async def write(self, database, points, time_precision=None):
+        self.writes.append((database, points, time_precision))
+
+
+def test_parse_interval():
+    assert parse_interval("1m") == 60
+    assert parse_interval(" 12h") == 43200
+    with pytest.raises(ValueError):
+        parse_interval("1w")
+
+
+def test_parse_fields():
+    assert line_protocol.parse_fields(b'v=1.5,n=3i,b=true,s="a, \\"b\\""') == {
+        "v": 1.5,
+        "n": 3,
+        "b": True,
+        "s": 'a, "b"',
+    }
+
+
+@pytest.mark.asyncio
+async def test_rollup_aggregates_and_closes_buckets():
+    writer = FakeWriter()
+    rollup = Rollup(writer, intervals=["1m"], measurements=["power"], grace=30)
+    start = int(time.time()) // 60 * 60
+    rollup.add(
+        "db",
+        [
+            f"power,id=a value=2.0 {(start + 10) * 1000}".encode(),
+            f"power,id=a value=1.0 {(start + 5) * 1000}".encode(),
+            f"status,id=a value=1i {start * 1000}".encode(),
+        ],
+        "ms",
+    )
+    point = {
+        "measurement": "power",
+        "tags": {"id": "a"},
+        "fields": {"value": 6.0, "text": "ignored"},
+        "time": (start + 20) * 10 ** 9,
+    }
+    rollup.add("db", [point], None)
+    assert rollup.open_buckets == 1
+
+    await rollup.close_buckets(start + 60)
+    assert writer.writes == []
+    await rollup.close_buckets(start + 90)
+    assert rollup.open_buckets == 0
+    assert writer.writes == [
+        (
+            "db",
+            [
+                (
+                    f"power_1m,id=a min_value=1.0,max_value=6.0,mean_value=3.0,"
+                    f"count_value=3i,last_value=6.0 {start}"
+                ).encode()
+            ],
+            "s",
+        )
+    ]
+
+    # the bucket of an hour ago closed, so the point is late
+    rollup.add("db", [f"power,id=a value=1.0 {(start - 3600) * 1000}".encode()], "ms")
+    assert rollup.late == 1
+    assert rollup.open_buckets == 0
+
+
+@pytest.mark.asyncio
+async def test_rollup_discards_open_buckets_on_stop():
+    writer = FakeWriter()
+    rollup = Rollup(writer, intervals=["1m"], measurements=["power"], grace=120)
+    start = int(time.time()) // 60 * 60
+    rollup.add(
+        "db",
+        [
+            f"power,id=a value=1.0 {(start - 60) * 1000}".encode(),
+            f"power,id=a value=2.0 {start * 1000}".encode(),
+        ],
+        "ms",
+    )
+    # the bucket of the previous minute closes, and the current one is still open
+    rollup.grace = 0
+    await rollup.start()
+    await rollup.stop()
+    assert [lines for _, lines, _ in writer.writes] == [
+        [
+            (
+                f"power_1m,id=a min_value=1.0,max_value=1.0,mean_value=1.0,"
+                f"count_value=1i,last_value=1.0 {start - 60}"
+            ).encode()
+        ]
+    ]
+    assert rollup.open_buckets == 0
+
+
+@pytest.mark.asyncio
+async def test_rollup_needs_hash_sharding(monkeypatch):
+    monkeypatch.setattr(config, "ROLLUP_ENABLED", True)
+    writer, _ = fake_writer()
+    with pytest.raises(ValueError):
+        DataServer(handlers=[], writer=writer, shard=Shard(0, 2, "shared"))
+    server = DataServer(handlers=[], writer=writer, shard=Shard(0, 2, "hash"))
+    assert server.rollup is not None
+
+
+@pytest.mark.asyncio
+async def test_rollup_aggregates_point_batches():
+    writer = FakeWriter()
+    rollup = Rollup(writer, intervals=["1m"], measurements=["power"], grace=30)
+    start = int(time.time()) // 60 * 60
+    power = SeriesDescriptor("power", {"id": "a"}, "power,id=a")
+    status = SeriesDescriptor("status", {"id": "a"}, "status,id=a")
+    batch = PointBatch("ms")
+    batch.extend(
+        [power, power, power, status],
+        [(start + 5) * 1000, (start + 10) * 1000, (start + 15) * 1000, start * 1000],
+        [1.0, 3, "text", 1],
+    )
+    rollup.add("db", batch, None)
+    # the series of the batch and of the lines are the same
+    rollup.add("db", [f"power,id=a value=5.0 {(start + 20) * 1000}".encode()], "ms")
+    assert rollup.open_buckets == 1
+    await rollup.close_buckets(start + 90)
+    assert writer.writes == [
+        (
+            "db",
+            [
+                (
+                    f"power_1m,id=a min_value=1.0,max_value=5.0,mean_value=3.0,"
+                    f"count_value=3i,last_value=5.0 {start}"
+                ).encode()
+            ],
+            "s",
+        )
+    ]
@@ -0,0 +1,57 @@
+from typing import Any, List
+
+from toad_influx_data.handlers.generic_handler import GenericHandler
+from toad_influx_data.handlers.handler_abc import IHandler, InfluxPoint
+from toad_influx_data.router import TopicRouter
+
+
+class TopicsHandler(IHandler):
+    def __init__(self, *topics, handles=True):
+        self.topics = list(topics)
+        self.handles = handles
+
+    def get_topics(self) -> List[str]:
+        return self.topics
+
+    def can_handle(self, topic: str) -> bool:
+        return self.handles
+
+    def get_influx_database(self, topic: str) -> str:
+        return ""
+
+    def get_influx_power_points(self, data: Any) -> List[InfluxPoint]:
+        return []
+
+    def get_influx_status_points(self, data: Any) -> List[InfluxPoint]:
+        return []
+
+
+def test_router_wildcards():
+    exact = TopicsHandler("a/b/c")
+    single = TopicsHandler("a/+/c")
+    multi = TopicsHandler("a/#")
+    root = TopicsHandler("#")
+    router = TopicRouter([exact, single, multi, root])
+
+    assert router.match("a/b/c") == [exact, single, multi, root]
+    assert router.match("a/x/c") == [single, multi, root]
+    assert router.match("a") == [multi, root]
+    assert router.match("a/x/c/d") == [multi, root]
+    assert router.match("b/b/c") == [root]
+
+
+def test_router_filters_by_can_handle():
+    handler = TopicsHandler("a/#")
+    refusing = TopicsHandler("a/#", handles=False)
+    router = TopicRouter([handler, refusing])
+    assert router.match("a/b") == [handler]
+
+
+def test_router_add_handler():
+    router = TopicRouter()
+    assert router.match("data/sp/influx_data/db") == []
+    handler = GenericHandler()
+    router.add_handler(handler)
+    assert router.match("data/sp/influx_data/db") == [handler]
+    assert router.match("data/sp/influx_data") == [handler]
+    assert router.match("data/sp/other") == []
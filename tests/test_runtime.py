@@ -0,0 +1,102 @@
+import asyncio
+import collections
+import gc
+import os
+import threading
+import time
+
+import pytest
+
+from toad_influx_data import metrics
+from toad_influx_data import runtime
+
+
+def test_install_event_loop_policy():
+    assert runtime.install_event_loop_policy("asyncio") == runtime.EVENT_LOOP_ASYNCIO
+    with pytest.raises(ValueError):
+        runtime.install_event_loop_policy("trio")
+
+
+def test_tune_gc_observes_pauses():
+    thresholds = gc.get_threshold()
+    try:
+        runtime.tune_gc((50000, 20, 20))
+        runtime.tune_gc((50000, 20, 20))
+        assert gc.get_threshold() == (50000, 20, 20)
+        assert gc.callbacks.count(runtime._observe_gc_pause) == 1
+        count, _ = metrics.GC_PAUSE_SECONDS.get_totals().get(("2",), (0, 0.0))
+        gc.collect()
+        assert metrics.GC_PAUSE_SECONDS.get_totals()[("2",)][0] == count + 1
+    finally:
+        gc.set_threshold(*thresholds)
+        gc.callbacks.remove(runtime._observe_gc_pause)
+
+
+@pytest.mark.asyncio
+async def test_watchdog_detects_stall():
+    watchdog = runtime.LoopWatchdog(interval=0.01, threshold=0.1)
+    stalls = metrics.EVENT_LOOP_STALLS.labels().value
+    watchdog.start()
+    try:
+        await asyncio.sleep(0.1)
+        assert watchdog.stalls == 0
+        time.sleep(0.3)  # blocks the loop
+        await asyncio.sleep(0.1)
+    finally:
+        watchdog.stop()
+    assert watchdog.stalls == 1
+    assert metrics.EVENT_LOOP_STALLS.labels().value == stalls + 1
+    assert not watchdog.running
+
+
+def _mqtt_response_handler(event: threading.Event):
+    event.wait()
+
+
+def test_profiler_samples_profiled_functions():
+    event = threading.Event()
+    thread = threading.Thread(target=_mqtt_response_handler, args=(event,))
+    thread.start()
+    profiler = runtime.SamplingProfiler()
+    samples = collections.Counter()
+    try:
+        assert profiler.sample(thread.ident, samples)
+        assert not profiler.sample(threading.get_ident(), samples)
+    finally:
+        event.set()
+        thread.join()
+    (stack,) = samples
+    assert stack[0] == "tests.test_runtime:_mqtt_response_handler"
+    assert stack[-1] == "threading:wait"
+
+
+def test_format_stage_timings():
+    histogram = metrics.Histogram("stage_seconds", "Stage.", ["handler"], registry=None)
+    stages = {"stage": histogram}
+    histogram.labels("a").observe(0.5)
+    previous_stages, runtime.STAGE_HISTOGRAMS = runtime.STAGE_HISTOGRAMS, stages
+    try:
+        timings, totals = runtime.format_stage_timings()
+        assert "stage[a]: 1 in 0.500 s, mean 500.000 ms" in timings
+        histogram.labels("a").observe(1.5)
+        histogram.labels("a").observe(0.5)
+        timings, totals = runtime.format_stage_timings(totals)
+        assert "stage[a]: 2 in 2.000 s, mean 1000.000 ms" in timings
+        timings, _ = runtime.format_stage_timings(totals)
+        assert timings == "Stage timings:"
+    finally:
+        runtime.STAGE_HISTOGRAMS = previous_stages
+
+
+def test_profile_hook_writes_profile(tmp_path):
+    profiler = runtime.SamplingProfiler(
+        duration=0.05, interval=0.001, directory=str(tmp_path)
+    )
+    hook = runtime.ProfileHook(signum=0, profiler=profiler)
+    hook.trigger()
+    assert profiler.running
+    assert not profiler.start()
+    while profiler.running:
+        time.sleep(0.01)
+    (name,) = os.listdir(tmp_path)
+    assert name.startswith("profile-")
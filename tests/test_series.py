@@ -0,0 +1,70 @@
+import pytest
+
+from toad_influx_data.handlers.generic_handler import GenericHandler
+from toad_influx_data.series import SeriesCache, SeriesDescriptor
+
+
+def test_series_cache_stats():
+    built = []
+
+    def factory(base_name, name, unit):
+        built.append((base_name, name, unit))
+        return SeriesDescriptor(name, {}, name)
+
+    cache = SeriesCache(factory, maxsize=2)
+    assert cache.get(None, "a", None) is cache.get("", "a", None)
+    cache.get("", "b", "W")
+    cache.get("", "c", "W")  # evicts a
+    cache.get("", "a", None)
+    assert built == [("", "a", None), ("", "b", "W"), ("", "c", "W"), ("", "a", None)]
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 4, 2)
+
+
+def test_series_cache_does_not_count_failures_as_evictions():
+    def factory(base_name, name, unit):
+        if not name:
+            raise ValueError("No Name specified")
+        return SeriesDescriptor(name, {}, name)
+
+    cache = SeriesCache(factory, maxsize=2)
+    cache.get("", "a", None)
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            cache.get("", "", None)
+    assert (cache.misses, cache.evictions) == (4, 0)
+    cache.get("", "b", None)
+    cache.get("", "c", None)  # evicts a
+    assert cache.evictions == 1
+
+
+def test_generic_handler_caches_series():
+    handler = GenericHandler(series_cache_size=16)
+    data = [
+        {"bn": "sp_w.r1.c1/", "n": "power", "t": 1584000000, "u": "W", "v": 1.0},
+        {"n": "status", "t": 1584000000, "v": 1},
+    ]
+    handler.get_influx_point_batch(data)
+    power_points = handler.get_influx_power_points(data)
+    assert power_points[0]["measurement"] == "power"
+    assert power_points[0]["tags"] == {
+        "id": "sp_w.r1.c1",
+        "unit": "W",
+        "type": "w",
+        "row": "1",
+        "column": "1",
+    }
+    power_points[0]["tags"]["id"] = "changed"
+    series = handler.series_cache.get("sp_w.r1.c1/", "power", "W")
+    assert series.tags["id"] == "sp_w.r1.c1"
+    with pytest.raises(TypeError):
+        series.tags["id"] = "changed"  # type: ignore
+    assert handler.series_cache.misses == 2
+
+
+def test_generic_handler_requires_name():
+    handler = GenericHandler(series_cache_size=16)
+    with pytest.raises(ValueError, match="No Name specified"):
+        handler.get_influx_power_points([{"t": 1584000000, "v": 1}])
+    batch = handler.get_influx_point_batch([{"t": 1584000000, "v": 1}])
+    assert len(batch) == 0
+    assert batch.rejected == [({"t": 1584000000, "v": 1}, "No Name specified")]
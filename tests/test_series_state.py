@@ -0,0 +1,63 @@
+from toad_influx_data.handlers.handler_abc import PointBatch
+from toad_influx_data.series import SeriesDescriptor
+from toad_influx_data.series_state import SeriesStateTable
+from toad_influx_data.utils import line_protocol
+
+
+def test_split_line():
+    assert line_protocol.split_line(b"power,id=a\\ b value=1.0 1500") == (
+        b"power,id=a\\ b",
+        b"value=1.0",
+        b"1500",
+    )
+    assert line_protocol.split_line(b'log text="a 12"') == (
+        b"log",
+        b'text="a 12"',
+        None,
+    )
+    assert line_protocol.get_measurement(b"power\\ usage,id=a") == "power usage"
+
+
+def test_suppresses_unchanged_status_until_heartbeat():
+    table = SeriesStateTable(["status"], heartbeat=60, coalesce_window=0)
+    assert table.filter("db", [b"status,id=a value=1i 1000"]) != []
+    assert table.filter("db", [b"status,id=a value=1i 2000"]) == []
+    assert table.filter("db", [b"status,id=a value=0i 3000"]) != []
+    # other series, databases and measurements are not suppressed
+    assert table.filter("db", [b"status,id=b value=0i 3000"]) != []
+    assert table.filter("other", [b"status,id=a value=0i 4000"]) != []
+    assert table.filter("db", [b"power,id=a value=1.0 1000"]) != []
+    assert table.filter("db", [b"power,id=a value=1.0 2000"]) != []
+
+    table.heartbeat = 0
+    assert table.filter("db", [b"status,id=a value=0i 5000"]) != []
+
+
+def test_coalesces_duplicates_last_write_wins():
+    table = SeriesStateTable([], heartbeat=0, coalesce_window=60)
+    point = {"measurement": "power", "tags": {"id": "a"}, "fields": {"value": 1.0}}
+    point["time"] = 1000
+    assert table.filter("db", [point, dict(point)]) == [point]
+    # a point with other fields overwrites the previous one in InfluxDB
+    changed = dict(point, fields={"value": 2.0})
+    assert table.filter("db", [changed]) == [changed]
+    assert table.filter("db", [dict(point, time=2000)]) != []
+
+
+def test_filters_point_batches():
+    table = SeriesStateTable(["status"], heartbeat=60, coalesce_window=0)
+    status = SeriesDescriptor("status", {"id": "a"}, "status,id=a")
+    batch = PointBatch("ms")
+    batch.extend([status] * 3, [1000, 2000, 3000], [1, 1, 0])
+    kept = table.filter("db", batch)
+    assert isinstance(kept, PointBatch)
+    assert kept.to_lines() == [
+        b"status,id=a value=1i 1000",
+        b"status,id=a value=0i 3000",
+    ]
+    batch = PointBatch("ms")
+    batch.extend([status] * 2, [4000, 5000], [0, 1])
+    assert table.filter("db", batch).to_lines() == [b"status,id=a value=1i 5000"]
+    batch = PointBatch("ms")
+    batch.append(SeriesDescriptor("status", {"id": "b"}, "status,id=b"), 5000, 1)
+    assert table.filter("db", batch) is batch
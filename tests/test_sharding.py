@@ -0,0 +1,26 @@
+import pytest
+
+from toad_influx_data.sharding import Shard, SHARDING_HASH, SHARDING_SHARED
+
+
+def test_shared_shard():
+    shard = Shard(0, 2, mode=SHARDING_SHARED, group="group")
+    assert shard.subscription("data/+/influx_data") == "$share/group/data/+/influx_data"
+    assert shard.owns("data/sp_m2/influx_data/db")
+
+
+def test_hash_shards_split_devices():
+    shards = [Shard(index, 3, mode=SHARDING_HASH, topic_level=1) for index in range(3)]
+    assert shards[0].subscription("data/+/influx_data") == "data/+/influx_data"
+    for device in range(100):
+        for database in ("db1", "db2"):
+            topic = f"data/sp_{device}/influx_data/{database}"
+            owners = [shard.index for shard in shards if shard.owns(topic)]
+            assert len(owners) == 1
+            # the messages of a device always go to the same shard
+            assert shards[owners[0]].owns(f"data/sp_{device}/influx_data/other")
+
+
+def test_unknown_sharding_mode():
+    with pytest.raises(ValueError):
+        Shard(0, 2, mode="unknown")
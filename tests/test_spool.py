@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from toad_influx_data.spool import Spool
+from toad_influx_data.write_policy import WritePolicy
+from toad_influx_data.writer import InfluxWriter
+
+
+def test_spool_append_rotate_read(tmp_path):
+    spool = Spool(str(tmp_path), segment_size=64)
+    spool.open()
+    spool.append("db", "ms", b"power value=1 1")
+    assert spool.closed_segments() == []
+    spool.append("db", None, b"power value=2 2" * 4)  # rotates the segment
+    spool.append("other", None, b"power value=3 3", "v2")
+    spool.close()
+
+    spool = Spool(str(tmp_path), segment_size=64)
+    spool.open()
+    segments = spool.closed_segments()
+    assert len(segments) == 2
+    records = [record for path in segments for record in spool.read_segment(path)]
+    assert records == [
+        ("db", "ms", b"power value=1 1", None),
+        ("db", None, b"power value=2 2" * 4, None),
+        ("other", None, b"power value=3 3", "v2"),
+    ]
+    spool.close()
+
+
+def test_spool_stops_at_corrupted_record(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.open()
+    spool.append("db", None, b"power value=1 1")
+    spool.append("db", None, b"power value=2 2")
+    spool.rotate()
+    path = spool.closed_segments()[0]
+    with open(path, "r+b") as segment:
+        segment.seek(-1, 2)
+        segment.write(b"3")
+    assert list(spool.read_segment(path)) == [("db", None, b"power value=1 1", None)]
+    spool.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("replay_rate", [1000, 0])
+async def test_writer_spools_and_replays(tmp_path, replay_rate):
+    spool = Spool(str(tmp_path))
+    policy = WritePolicy(max_retries=0, failure_threshold=1, reset_timeout=0.01)
+    writer = InfluxWriter(
+        flush_interval=0.01,
+        spool=spool,
+        replay_rate=replay_rate,
+        policies={"http": policy},
+    )
+    writes = []
+    influxdb_up = False
+
+    async def post(database, body, time_precision):
+        if not influxdb_up:
+            raise ConnectionError("InfluxDB is down")
+        writes.append(body)
+
+    writer.transports["http"].write = post  # type: ignore
+    await writer.start()
+    await writer.write("db", [b"power value=1 1"])
+    await writer.flush()
+    assert not writer.healthy
+    await writer.write("db", [b"power value=2 2"])
+    await writer.flush()
+    assert writes == []
+
+    influxdb_up = True
+    await asyncio.sleep(0.1)
+    assert writer.healthy
+    assert writes == [b"power value=1 1", b"power value=2 2"]
+    await writer.stop()
+    assert list(tmp_path.iterdir()) == []
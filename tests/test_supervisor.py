@@ -0,0 +1,31 @@
+import time
+
+from toad_influx_data.supervisor import RESTART_DELAY, Supervisor
+
+
+class ExitedWorker:
+    name = "toad_influx_data-0"
+    exitcode = 1
+
+    def is_alive(self):
+        return False
+
+
+def test_supervisor_restarts_workers_without_blocking():
+    supervisor = Supervisor(processes=2)
+    supervisor.running = True
+    started = []
+    supervisor._start_worker = started.append  # type: ignore
+    supervisor._workers = [ExitedWorker(), ExitedWorker()]  # type: ignore
+    supervisor._started_at = [time.monotonic()] * 2
+    start = time.monotonic()
+    supervisor._check_workers()
+    # both exits are detected at once, and the restarts wait for their delay
+    assert time.monotonic() - start < RESTART_DELAY
+    assert started == []
+    assert all(restart_at is not None for restart_at in supervisor._restart_at)
+    assert supervisor._restart_delays == [RESTART_DELAY * 2] * 2
+    supervisor._restart_at[1] = time.monotonic()
+    supervisor._check_workers()
+    assert started == [1]
+    assert supervisor._restart_at[1] is None
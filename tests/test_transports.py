@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from toad_influx_data.transports import HTTPTransport, InfluxDB2Transport, UDPTransport
+
+
+async def start_influxdb():
+    requests = []
+
+    async def write(request):
+        body = await request.read()
+        requests.append((request.path, dict(request.query), request.headers, body))
+        return web.Response(status=204)
+
+    app = web.Application()
+    app.router.add_post("/write", write)
+    app.router.add_post("/api/v2/write", write)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner, runner.addresses[0][1], requests
+
+
+@pytest.mark.asyncio
+async def test_http_transport_gzip():
+    runner, port, requests = await start_influxdb()
+    transport = HTTPTransport("127.0.0.1", port, compress=True, offload_size=10)
+    await transport.start()
+    await transport.write("db", b"power value=1 1", "ms")
+    await transport.write("db", b"power value=1 1" * 10, None)
+    await transport.stop()
+    await runner.cleanup()
+    assert [request[1] for request in requests] == [
+        {"db": "db", "precision": "ms"},
+        {"db": "db"},
+    ]
+    for _, _, headers, body in requests:
+        assert headers["Content-Encoding"] == "gzip"
+    # aiohttp decompresses the bodies it receives
+    assert requests[1][3] == b"power value=1 1" * 10
+
+
+@pytest.mark.asyncio
+async def test_transports_stop_without_starting():
+    transport = HTTPTransport("127.0.0.1", 8086)
+    await transport.stop()
+    await transport.start()
+    await transport.stop()
+    await transport.stop()
+    udp_transport = UDPTransport("127.0.0.1", 8089)
+    await udp_transport.stop()
+
+
+@pytest.mark.asyncio
+async def test_influxdb2_transport():
+    runner, port, requests = await start_influxdb()
+    transport = InfluxDB2Transport("127.0.0.1", port, org="toad", token="secret")
+    await transport.start()
+    await transport.write("db/autogen", b"power value=1 1", "u")
+    await transport.stop()
+    await runner.cleanup()
+    path, query, headers, body = requests[0]
+    assert path == "/api/v2/write"
+    assert query == {"org": "toad", "bucket": "db/autogen", "precision": "us"}
+    assert headers["Authorization"] == "Token secret"
+    assert body == b"power value=1 1"
+
+
+@pytest.mark.asyncio
+async def test_udp_transport_splits_and_converts_precision():
+    datagrams = []
+
+    class Listener(asyncio.DatagramProtocol):
+        def datagram_received(self, data, addr):
+            datagrams.append(data)
+
+    loop = asyncio.get_running_loop()
+    listener, _ = await loop.create_datagram_endpoint(
+        Listener, local_addr=("127.0.0.1", 0)
+    )
+    port = listener.get_extra_info("sockname")[1]
+    transport = UDPTransport("127.0.0.1", port, precision="ns", datagram_size=40)
+    await transport.start()
+    await transport.write("db", b"power value=1 1500\npower value=2 1501", "ms")
+    await asyncio.sleep(0.1)
+    await transport.stop()
+    listener.close()
+    assert datagrams == [
+        b"power value=1 1500000000",
+        b"power value=2 1501000000",
+    ]
@@ -0,0 +1,155 @@
+import asyncio
+from unittest import mock
+
+import pytest
+from aioinflux.client import InfluxDBWriteError
+
+from toad_influx_data.write_policy import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    WritePolicy,
+    is_retryable,
+)
+from toad_influx_data.writer import InfluxWriter
+
+
+def write_error(status):
+    return InfluxDBWriteError(mock.Mock(status=status, headers={}))
+
+
+def test_is_retryable():
+    assert is_retryable(write_error(500))
+    assert is_retryable(write_error(503))
+    assert is_retryable(write_error(429))
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(ConnectionRefusedError())
+    assert is_retryable(CircuitOpenError())
+    assert not is_retryable(write_error(400))
+    assert not is_retryable(write_error(404))
+    assert not is_retryable(ValueError())
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    breaker.reset_timeout = 0
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_circuit_breaker_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    with mock.patch("time.monotonic", return_value=breaker._opened_at + 1):
+        assert breaker.allow()
+        assert not breaker.allow()
+
+
+def test_backoff_is_jittered_and_capped():
+    policy = WritePolicy(backoff=1, max_backoff=5)
+    delays = [policy.get_backoff(retry) for retry in range(10) for _ in range(20)]
+    assert all(0 <= delay <= 5 for delay in delays)
+    assert len(set(delays)) > 1
+    assert all(policy.get_backoff(0) <= 1 for _ in range(20))
+
+
+@pytest.mark.asyncio
+async def test_execute_retries_retryable_errors():
+    policy = WritePolicy(max_retries=3, backoff=0.001, failure_threshold=10)
+    errors = [write_error(503), asyncio.TimeoutError()]
+    calls = []
+
+    async def write():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+
+    await policy.execute(write)
+    assert len(calls) == 3
+    assert policy.breaker.closed and policy.breaker.failures == 0
+
+
+@pytest.mark.asyncio
+async def test_execute_does_not_retry_permanent_errors():
+    policy = WritePolicy(max_retries=3, backoff=0.001)
+    calls = []
+
+    async def write():
+        calls.append(1)
+        raise write_error(400)
+
+    with pytest.raises(InfluxDBWriteError):
+        await policy.execute(write)
+    assert len(calls) == 1
+    assert policy.breaker.closed
+
+
+@pytest.mark.asyncio
+async def test_execute_stops_retrying_when_circuit_opens():
+    policy = WritePolicy(
+        max_retries=10, backoff=0.001, failure_threshold=2, reset_timeout=60
+    )
+    calls = []
+
+    async def write():
+        calls.append(1)
+        raise ConnectionError("InfluxDB is down")
+
+    with pytest.raises(ConnectionError):
+        await policy.execute(write)
+    assert len(calls) == 2
+    with pytest.raises(CircuitOpenError):
+        await policy.execute(write)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_execute_limits_writes_in_flight():
+    policy = WritePolicy(max_in_flight=2)
+    in_flight = []
+    peak = 0
+
+    async def write():
+        nonlocal peak
+        in_flight.append(1)
+        peak = max(peak, len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.pop()
+
+    await asyncio.gather(*(policy.execute(write) for _ in range(6)))
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_writer_drops_failed_writes_without_spool():
+    policy = WritePolicy(max_retries=0, failure_threshold=1, reset_timeout=60)
+    writer = InfluxWriter(policies={"http": policy})
+    calls = []
+
+    async def post(database, body, time_precision):
+        calls.append(body)
+        raise ConnectionError("InfluxDB is down")
+
+    writer.transports["http"].write = post  # type: ignore
+    await writer.write("db", [b"power value=1 1"])
+    await writer.flush()
+    assert not writer.healthy
+    await writer.write("db", [b"power value=2 2"])
+    await writer.flush()
+    assert calls == [b"power value=1 1"]
+    assert writer.pending() == 0
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from tests.utils import fake_writer
+
+
+def point(value):
+    return {
+        "time": 10 + value,
+        "measurement": "power",
+        "tags": {},
+        "fields": {"value": value},
+    }
+
+
+@pytest.mark.asyncio
+async def test_writer_flushes_on_batch_size():
+    writer, writes = fake_writer(batch_size=3, flush_interval=60)
+    await writer.start()
+    await writer.write("db", [point(0), point(1)])
+    assert writes == []
+    await writer.write("db", [b"power value=2i 12"])
+    assert writes == [
+        ("db", b"power value=0i 10\npower value=1i 11\npower value=2i 12", None)
+    ]
+    assert writer.pending() == 0
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_writer_drops_points_it_cannot_serialize():
+    writer, writes = fake_writer(batch_size=100, flush_interval=0.01)
+    await writer.start()
+    await writer.write("db", [{"measurement": "power"}])
+    await asyncio.sleep(0.05)
+    assert writer.dropped == 1
+    await writer.write("db", [point(0)])
+    await writer.stop()
+    assert writes == [("db", b"power value=0i 10", None)]
+
+
+@pytest.mark.asyncio
+async def test_writer_flushes_on_stop():
+    writer, writes = fake_writer(batch_size=100, flush_interval=60)
+    await writer.start()
+    await writer.write("db", [point(0)])
+    await writer.write("db", [b"power value=1i 1"], "s")
+    await writer.stop()
+    assert sorted(writes, key=lambda w: str(w[2])) == [
+        ("db", b"power value=0i 10", None),
+        ("db", b"power value=1i 1", "s"),
+    ]
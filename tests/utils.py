@@ -1,8 +1,13 @@
+from typing import List, Optional, Tuple
+
 import pytest
 
 from toad_influx_data.mqtt import MQTT
 from toad_influx_data.server import DataServer
 from toad_influx_data.utils.config import MQTT_BROKER_HOST
+from toad_influx_data.writer import InfluxWriter
+
+Write = Tuple[str, bytes, Optional[str]]
 
 
 @pytest.fixture
@@ -24,3 +29,14 @@ async def mqtt_client_fixture():
     await mqtt_client.start(MQTT_BROKER_HOST, message_handler, [])
     yield mqtt_client
     await mqtt_client.stop()
+
+
+def fake_writer(**kwargs) -> Tuple[InfluxWriter, List[Write]]:
+    writer = InfluxWriter(**kwargs)
+    writes: List[Write] = []
+
+    async def post(database, body, time_precision):
+        writes.append((database, body, time_precision))
+
+    writer.transports["http"].write = post  # type: ignore
+    return writer, writes
@@ -0,0 +1,404 @@
+import argparse
+import asyncio
+import collections
+import json
+import mmap
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import toad_influx_data.utils.protocol as prot
+from toad_influx_data.codecs import JSONCodec
+from toad_influx_data.handlers.handler_abc import PointBatch, get_points
+from toad_influx_data.handlers.registry import HandlerRegistry
+from toad_influx_data.router import TopicRouter
+from toad_influx_data.utils import config
+from toad_influx_data.utils import logger
+from toad_influx_data.writer import InfluxWriter, Points, WritablePoint
+
+# suffixes of the files that are read from the directories
+FILE_SUFFIXES = (".jsonl", ".ndjson", ".json")
+# optional payload field with the topic of the payload
+PAYLOAD_TOPIC_FIELD = "topic"
+
+Chunk = Tuple[str, int, int]  # (path, start offset, end offset)
+PointsKey = Tuple[str, Optional[str], str]  # (database, time precision, handler)
+ChunkResult = Tuple[Dict[PointsKey, Points], int, int, int]
+
+
+def find_files(paths: Iterable[str]) -> List[str]:
+    """
+
+    :param paths: JSON lines files, or directories of them.
+    :return: the files, and those in the directories and their subdirectories with
+        one of the ~`FILE_SUFFIXES`, sorted.
+    """
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for directory, _, names in os.walk(path):
+            files.extend(
+                os.path.join(directory, name)
+                for name in names
+                if name.endswith(FILE_SUFFIXES)
+            )
+    return sorted(files)
+
+
+def split_chunks(path: str, start: int, chunk_size: int) -> Iterator[Chunk]:
+    """
+
+    :param path: JSON lines file.
+    :param start: offset from which the file is split.
+    :param chunk_size: approximate bytes of a chunk.
+    :return: chunks of the file of whole lines, in order.
+    """
+    size = os.path.getsize(path)
+    if start >= size:
+        return
+    with open(path, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        while start < size:
+            newline = data.find(b"\n", min(start + chunk_size, size) - 1)
+            end = size if newline == -1 else newline + 1
+            yield path, start, end
+            start = end
+
+
+class _Converter:
+    """
+    Converter of the payloads in the worker processes, with the same handlers as
+    the server.
+    """
+
+    def __init__(self):
+        self.registry = HandlerRegistry()
+        self.router = TopicRouter(self.registry.load_enabled())
+        self.codec = JSONCodec()
+
+    def convert(self, chunk: Chunk, default_topic: Optional[str]) -> ChunkResult:
+        """
+
+        :param chunk: chunk of a JSON lines file of payloads.
+        :param default_topic: topic of the payloads without a topic field.
+        :return: the points of the payloads by database, time precision and
+            handler, the number of payloads, the number of invalid ones, and the
+            number of records that could not be converted.
+        """
+        path, start, end = chunk
+        points: Dict[PointsKey, Points] = {}
+        payloads = errors = rejected = 0
+        with open(path, "rb") as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            for line in data[start:end].splitlines():
+                if not line.strip():
+                    continue
+                payloads += 1
+                try:
+                    rejected += self._convert_payload(line, default_topic, points)
+                except Exception as e:
+                    errors += 1
+                    logger.log_info_sampled("backfill.error", "Invalid payload: %s", e)
+        return points, payloads, errors, rejected
+
+    def _convert_payload(
+        self,
+        line: bytes,
+        default_topic: Optional[str],
+        points: Dict[PointsKey, Points],
+    ) -> int:
+        payload = self.codec.decode(line)
+        topic = payload.get(PAYLOAD_TOPIC_FIELD, default_topic)
+        if topic is None:
+            raise ValueError("No topic specified")
+        for handler in self.registry.load_for(topic):
+            self.router.add_handler(handler)
+        data = payload[prot.PAYLOAD_DATA_FIELD]
+        rejected = 0
+        for handler in self.router.match(topic):
+            database = handler.get_influx_database(topic)
+            handler_points, time_precision, handler_rejected = get_points(handler, data)
+            key = (database, time_precision, handler.__class__.__name__)
+            _merge_points(points, key, handler_points)
+            for _, reason in handler_rejected:
+                logger.log_info_sampled(
+                    "backfill.rejected", "Invalid record: %s", reason
+                )
+            rejected += len(handler_rejected)
+        return rejected
+
+
+def _merge_points(points: Dict[PointsKey, Points], key: PointsKey, new: Points):
+    """
+    Adds points to those of a key; point batches of the same field are merged,
+    other points are merged as lines and data points.
+
+    :param points: points by database, time precision and handler.
+    :param key: database, time precision and handler of the new points.
+    :param new: points to add.
+    :return:
+    """
+    current = points.get(key)
+    if current is None:
+        points[key] = new
+    elif (
+        isinstance(current, PointBatch)
+        and isinstance(new, PointBatch)
+        and current.field == new.field
+    ):
+        current.extend(new.series, new.timestamps, new.values)
+    else:
+        merged: List[WritablePoint] = []
+        for chunk in (current, new):
+            merged.extend(chunk.to_lines() if isinstance(chunk, PointBatch) else chunk)
+        points[key] = merged
+
+
+_converter: Optional[_Converter] = None
+
+
+def _init_worker():
+    global _converter
+    _converter = _Converter()
+
+
+def _convert_chunk(chunk: Chunk, default_topic: Optional[str]) -> ChunkResult:
+    return _converter.convert(chunk, default_topic)  # type: ignore
+
+
+class Checkpoint:
+    """
+    Offsets up to which every file was backfilled, saved as JSON so that an
+    interrupted backfill resumes from them.
+
+    :ivar path: checkpoint file.
+    :ivar offsets: offsets by file.
+    """
+
+    path: str
+    offsets: Dict[str, int]
+
+    def __init__(self, path: str):
+        """
+        Checkpoint initializer; loads the checkpoint if it exists.
+
+        :param path: checkpoint file.
+        """
+        self.path = path
+        self.offsets = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.offsets = json.load(file)
+
+    def save(self):
+        """
+        Writes the checkpoint atomically.
+
+        :return:
+        """
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(self.offsets, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.path)
+
+
+class Backfill:
+    """
+    Bulk loader of historical payloads, like the MQTT ones, from JSON lines files.
+
+    The files are split in chunks of whole lines, which a pool of `workers`
+    processes read through mmap, decode and convert with the configured handlers.
+    The points are written in order, in batches of the writer's batch size and at
+    most `rate` points per second. The offsets of the written chunks are saved to
+    the `checkpoint` every `checkpoint_interval` chunks, once they are flushed, so
+    that an interrupted backfill resumes after the last saved chunk.
+
+    :ivar writer: ~`toad_influx_data.writer.InfluxWriter` of the points.
+    :ivar topic: topic of the payloads without a ``topic`` field.
+    :ivar workers: number of conversion processes.
+    :ivar chunk_size: approximate bytes of a chunk.
+    :ivar rate: maximum points written per second; unlimited if 0.
+    :ivar checkpoint: ~`Checkpoint` of the backfill.
+    :ivar checkpoint_interval: chunks between checkpoints.
+    """
+
+    writer: InfluxWriter
+    topic: Optional[str]
+    workers: int
+    chunk_size: int
+    rate: float
+    checkpoint: Checkpoint
+    checkpoint_interval: int
+
+    def __init__(
+        self,
+        writer: Optional[InfluxWriter] = None,
+        topic: Optional[str] = None,
+        workers: int = config.BACKFILL_WORKERS,
+        chunk_size: int = config.BACKFILL_CHUNK_SIZE,
+        rate: float = config.BACKFILL_RATE,
+        checkpoint: str = config.BACKFILL_CHECKPOINT,
+        checkpoint_interval: int = config.BACKFILL_CHECKPOINT_INTERVAL,
+    ):
+        """
+        Backfill initializer.
+
+        :param writer: InfluxDB writer; one with the backfill batch size if not
+            given.
+        :param topic: topic of the payloads without a ``topic`` field.
+        :param workers: number of conversion processes; one per CPU if 0.
+        :param chunk_size: approximate bytes of a chunk.
+        :param rate: maximum points written per second; unlimited if 0.
+        :param checkpoint: checkpoint file.
+        :param checkpoint_interval: chunks between checkpoints.
+        """
+        self.writer = writer or InfluxWriter(batch_size=config.BACKFILL_BATCH_SIZE)
+        self.topic = topic
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.rate = rate
+        self.checkpoint = Checkpoint(checkpoint)
+        self.checkpoint_interval = checkpoint_interval
+        self._written = 0
+        self._start = 0.0
+
+    async def run(self, paths: Iterable[str]) -> Dict[str, int]:
+        """
+        Backfills the payloads of the files, from the checkpoint.
+
+        :param paths: JSON lines files, or directories of them.
+        :return: the number of payloads, invalid payloads, invalid records and
+            written points.
+        """
+        stats = {"payloads": 0, "errors": 0, "rejected": 0, "points": 0}
+        loop = asyncio.get_running_loop()
+        executor = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        # submitted ahead, so that the workers are busy while the points are written
+        pending: Deque[Tuple[Chunk, Future]] = collections.deque()
+        checkpoint = os.path.abspath(self.checkpoint.path)
+        files = [
+            path for path in find_files(paths) if os.path.abspath(path) != checkpoint
+        ]
+        chunks = self._get_chunks(files)
+        await self.writer.start()
+        self._written, self._start = 0, time.monotonic()
+        try:
+            unsaved = 0
+            # points dropped before the chunks since the last checkpoint were written
+            dropped = self.writer.dropped
+            while True:
+                while len(pending) < self.workers * 2:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    future = executor.submit(_convert_chunk, chunk, self.topic)
+                    pending.append((chunk, future))
+                if not pending:
+                    break
+                chunk, future = pending.popleft()
+                points, payloads, errors, rejected = await asyncio.wrap_future(
+                    future, loop=loop
+                )
+                for (database, time_precision, handler), batch in points.items():
+                    await self._throttle(len(batch))
+                    transport = self.writer.route(database, handler)
+                    await self.writer.write(database, batch, time_precision, transport)
+                    stats["points"] += len(batch)
+                stats["payloads"] += payloads
+                stats["errors"] += errors
+                stats["rejected"] += rejected
+                path, _, end = chunk
+                self.checkpoint.offsets[path] = end
+                unsaved += 1
+                if unsaved >= self.checkpoint_interval:
+                    await self._save_checkpoint(dropped)
+                    unsaved = 0
+                    dropped = self.writer.dropped
+                    logger.log_info(f"Backfilled {stats['payloads']} payloads...")
+            await self._save_checkpoint(dropped)
+        finally:
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown()
+            await self.writer.stop()
+        logger.log_info(
+            f"Backfilled {stats['payloads']} payloads, {stats['points']} points, "
+            f"{stats['errors']} invalid payloads, {stats['rejected']} invalid records"
+        )
+        return stats
+
+    def _get_chunks(self, files: List[str]) -> Iterator[Chunk]:
+        """
+
+        :param files: JSON lines files.
+        :return: the chunks of the files after their checkpoint offsets.
+        """
+        for path in files:
+            yield from split_chunks(
+                path, self.checkpoint.offsets.get(path, 0), self.chunk_size
+            )
+
+    async def _save_checkpoint(self, dropped: int):
+        """
+        Flushes the writer and saves the checkpoint, unless a write of the chunks
+        since the last checkpoint failed, either when its batch was full or now.
+
+        :param dropped: points the writer had dropped before those chunks.
+        :return:
+        """
+        await self.writer.flush()
+        if self.writer.dropped > dropped:
+            raise RuntimeError(
+                "Backfill writes failed; run it again to resume from the checkpoint"
+            )
+        self.checkpoint.save()
+
+    async def _throttle(self, points: int):
+        """
+        Waits until the points can be written within the rate limit.
+
+        :param points: number of points to write.
+        :return:
+        """
+        if self.rate > 0:
+            ahead = self._written / self.rate - (time.monotonic() - self._start)
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+        self._written += points
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m toad_influx_data.backfill",
+        description="Backfills JSON lines files of payloads to InfluxDB.",
+    )
+    parser.add_argument("paths", nargs="+", help="JSON lines files or directories")
+    parser.add_argument("--topic", help="topic of the payloads without a topic field")
+    parser.add_argument("--workers", type=int, default=config.BACKFILL_WORKERS)
+    parser.add_argument("--rate", type=float, default=config.BACKFILL_RATE)
+    parser.add_argument("--checkpoint", default=config.BACKFILL_CHECKPOINT)
+    args = parser.parse_args()
+    logger.configure()
+    backfill = Backfill(
+        topic=args.topic,
+        workers=args.workers,
+        rate=args.rate,
+        checkpoint=args.checkpoint,
+    )
+    asyncio.run(backfill.run(args.paths))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+import hashlib
+import math
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+from toad_influx_data import metrics
+from toad_influx_data.handlers.handler_abc import PointBatch
+from toad_influx_data.utils import config
+from toad_influx_data.utils import line_protocol
+from toad_influx_data.utils import logger
+from toad_influx_data.writer import Points, WritablePoint
+
+# actions on the new series of a measurement over its limit
+WARN = "warn"
+DROP = "drop"
+FOLD = "fold"
+ACTIONS = (WARN, DROP, FOLD)
+# measurement of the sketch shared by the measurements over `max_measurements`
+OTHER_MEASUREMENTS = "*"
+
+SketchKey = Tuple[str, str]  # (database, measurement)
+
+
+def hash_series(series_key: bytes) -> Tuple[int, int]:
+    """
+
+    :param series_key: encoded series key.
+    :return: two independent 64-bit hashes of the series key.
+    """
+    digest = hashlib.blake2b(series_key, digest_size=16).digest()
+    return int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch, which estimates the number of distinct items added to it
+    in ``2 ** precision`` bytes, with a standard error of about
+    ``1.04 / sqrt(2 ** precision)``; 1.6 % with the default precision.
+
+    :ivar precision: bits of the hash that select a register.
+    :ivar registers: maximum rank seen by every register.
+    """
+
+    precision: int
+    registers: bytearray
+
+    def __init__(self, precision: int = config.CARDINALITY_PRECISION):
+        """
+        HyperLogLog initializer.
+
+        :param precision: bits of the hash that select a register, from 4 to 16.
+        """
+        if not 4 <= precision <= 16:
+            raise ValueError(f"Invalid HyperLogLog precision: {precision}")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        size = len(self.registers)
+        self._alpha = 0.7213 / (1 + 1.079 / size)
+        # kept up to date, so that the estimate does not sum the registers
+        self._sum = float(size)
+        self._zeros = size
+
+    def locate(self, item_hash: int) -> Tuple[int, int]:
+        """
+
+        :param item_hash: 64-bit hash of an item.
+        :return: the register of the item and its rank; the item was certainly not
+            added if its rank is higher than the register.
+        """
+        bits = 64 - self.precision
+        rest = item_hash & ((1 << bits) - 1)
+        return item_hash >> bits, bits - rest.bit_length() + 1
+
+    def add(self, item_hash: int) -> bool:
+        """
+
+        :param item_hash: 64-bit hash of an item.
+        :return: if a register changed, which means that the item is new.
+        """
+        index, rank = self.locate(item_hash)
+        old_rank = self.registers[index]
+        if rank <= old_rank:
+            return False
+        self.registers[index] = rank
+        self._sum += 2.0 ** -rank - 2.0 ** -old_rank
+        if old_rank == 0:
+            self._zeros -= 1
+        return True
+
+    def estimate(self) -> float:
+        """
+
+        :return: the estimated number of distinct items added.
+        """
+        size = len(self.registers)
+        estimate = self._alpha * size * size / self._sum
+        if estimate <= 2.5 * size and self._zeros:
+            # linear counting, which is more accurate for few items
+            return size * math.log(size / self._zeros)
+        return estimate
+
+
+class BloomFilter:
+    """
+    Bloom filter, which tells if an item was added to it with a false positive
+    rate of about `error_rate` once `capacity` items are added.
+
+    :ivar capacity: items for which the filter is sized.
+    :ivar error_rate: false positive rate at capacity.
+    """
+
+    capacity: int
+    error_rate: float
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """
+        BloomFilter initializer.
+
+        :param capacity: items for which the filter is sized.
+        :param error_rate: false positive rate at capacity.
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        bits = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._bits = bytearray((bits + 7) // 8)
+        self._size = len(self._bits) * 8
+        self._hashes = max(1, round(self._size / capacity * math.log(2)))
+
+    def _get_bits(self, item_hashes: Tuple[int, int]) -> List[int]:
+        first, second = item_hashes
+        # an odd step visits every bit of the power of two sized filter
+        second |= 1
+        return [(first + i * second) % self._size for i in range(self._hashes)]
+
+    def __contains__(self, item_hashes: Tuple[int, int]) -> bool:
+        bits = self._bits
+        return all(
+            bits[bit >> 3] & (1 << (bit & 7)) for bit in self._get_bits(item_hashes)
+        )
+
+    def add(self, item_hashes: Tuple[int, int]):
+        """
+
+        :param item_hashes: two independent 64-bit hashes of an item.
+        :return:
+        """
+        for bit in self._get_bits(item_hashes):
+            self._bits[bit >> 3] |= 1 << (bit & 7)
+
+
+class _Measurement:
+    """
+    Series of a database and measurement.
+
+    :ivar name: ``<database>.<measurement>`` of the series.
+    :ivar sketch: distinct series seen.
+    :ivar admitted: series that were admitted; only kept by the ~`DROP` and
+        ~`FOLD` actions, which must tell new series from the admitted ones.
+    :ivar over_limit: if the limit of the measurement was exceeded.
+    """
+
+    __slots__ = ("name", "sketch", "admitted", "over_limit")
+
+    def __init__(self, name: str, sketch: HyperLogLog, admitted: Optional[BloomFilter]):
+        self.name = name
+        self.sketch = sketch
+        self.admitted = admitted
+        self.over_limit = False
+
+
+class CardinalityGuard:
+    """
+    Guardrail of the series cardinality, so that a misbehaving device, e.g. one
+    that sends a new ``id`` in every message, cannot degrade InfluxDB.
+
+    The distinct series of every database and measurement are estimated with a
+    fixed-memory ~`HyperLogLog`, exposed as the ``toad_series_cardinality``
+    metric. Once a measurement has more than `limit` series, the points of new
+    series are handled by the `action`:
+
+    - ~`WARN`: they are written, and a warning is logged.
+    - ~`DROP`: they are dropped.
+    - ~`FOLD`: the `fold_tags` are moved from their tags to their fields, so that
+      they are written to a series of the measurement without them; those without
+      any of the tags are dropped.
+
+    The series admitted before the limit are kept in a ~`BloomFilter`, so a few
+    new series, at its `error_rate`, are taken for admitted ones and written.
+    The measurements of a database after the first `max_measurements` share the
+    ~`OTHER_MEASUREMENTS` estimate and limit.
+
+    :ivar limit: series of a measurement after which the action is taken.
+    :ivar action: ~`WARN`, ~`DROP` or ~`FOLD`.
+    :ivar fold_tags: tags moved to the fields by the ~`FOLD` action.
+    :ivar precision: precision of the ~`HyperLogLog` sketches.
+    :ivar max_measurements: measurements of a database with their own limit.
+    :ivar error_rate: false positive rate of the admitted series filter.
+    """
+
+    limit: int
+    action: str
+    fold_tags: Collection[str]
+    precision: int
+    max_measurements: int
+    error_rate: float
+
+    def __init__(
+        self,
+        limit: int = config.CARDINALITY_LIMIT,
+        action: str = config.CARDINALITY_ACTION,
+        fold_tags: Collection[str] = tuple(config.CARDINALITY_FOLD_TAGS),
+        precision: int = config.CARDINALITY_PRECISION,
+        max_measurements: int = config.CARDINALITY_MAX_MEASUREMENTS,
+        error_rate: float = config.CARDINALITY_ERROR_RATE,
+    ):
+        """
+        CardinalityGuard initializer.
+
+        :param limit: series of a measurement after which the action is taken.
+        :param action: ~`WARN`, ~`DROP` or ~`FOLD`.
+        :param fold_tags: tags moved to the fields by the ~`FOLD` action.
+        :param precision: precision of the ~`HyperLogLog` sketches.
+        :param max_measurements: measurements of a database with their own limit.
+        :param error_rate: false positive rate of the admitted series filter.
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"Invalid cardinality action: {action}")
+        self.limit = limit
+        self.action = action
+        self.fold_tags = frozenset(fold_tags)
+        self.precision = precision
+        self.max_measurements = max_measurements
+        self.error_rate = error_rate
+        self._measurements: Dict[SketchKey, _Measurement] = {}
+        self._counts: Dict[str, int] = {}
+        self._limited = metrics.SERIES_LIMITED_POINTS.labels(action)
+
+    def estimate(self, database: str, measurement: str) -> float:
+        """
+
+        :param database: InfluxDB database.
+        :param measurement: measurement of the database.
+        :return: the estimated number of distinct series of the measurement.
+        """
+        state = self._measurements.get((database, measurement))
+        return state.sketch.estimate() if state is not None else 0.0
+
+    def filter(self, database: str, points: Points) -> Points:
+        """
+        Counts the series of the points, and takes the action on those of new
+        series of the measurements over the limit.
+
+        :param database: InfluxDB database to which the points will be written.
+        :param points: point batch, data points or line protocol lines to write.
+        :return: the points to write, in the same order; a point batch, unless some
+            of its points were folded.
+        """
+        if isinstance(points, PointBatch):
+            return self._filter_batch(database, points)
+        kept = []
+        limited = 0
+        for point in points:
+            series_key, measurement = self._get_series(point)
+            action = self._check(database, series_key, measurement)
+            if action is None or action == WARN:
+                kept.append(point)
+            elif action == FOLD:
+                folded = self._fold(point)
+                if folded is not None:
+                    kept.append(folded)
+            limited += action is not None
+        if limited:
+            self._limited.inc(limited)
+        return kept
+
+    def _filter_batch(self, database: str, batch: PointBatch) -> Points:
+        """
+
+        :param database: InfluxDB database to which the points will be written.
+        :param batch: point batch to write.
+        :return: the points of the batch to write, in the same order.
+        """
+        kept = []
+        folded = set()
+        limited = 0
+        for index, series in enumerate(batch.series):
+            action = self._check(
+                database, series.series_key.encode(), series.measurement
+            )
+            if action is None or action == WARN:
+                kept.append(index)
+            elif action == FOLD:
+                folded.add(index)
+            limited += action is not None
+        if limited:
+            self._limited.inc(limited)
+        if not folded:
+            return batch if len(kept) == len(batch) else batch.take(kept)
+        # the folded points have other fields than the batch, so they are lines
+        lines = batch.to_lines()
+        points = []
+        for index in sorted(folded.union(kept)):
+            line = self._fold(lines[index]) if index in folded else lines[index]
+            if line is not None:
+                points.append(line)
+        return points
+
+    def _check(
+        self, database: str, series_key: bytes, measurement: str
+    ) -> Optional[str]:
+        """
+        Counts the series of a point.
+
+        :param database: InfluxDB database to which the point will be written.
+        :param series_key: encoded series key of the point.
+        :param measurement: measurement of the point.
+        :return: None if the point is written as it is; else the action to take on
+            it, because it is of a new series of a measurement over the limit.
+        """
+        state = self._get_measurement(database, measurement)
+        item_hashes = hash_series(series_key)
+        if not state.over_limit:
+            if state.admitted is not None:
+                state.admitted.add(item_hashes)
+            # the estimate only grows when a register changes
+            if state.sketch.add(item_hashes[0]):
+                state.over_limit = round(state.sketch.estimate()) > self.limit
+            if state.over_limit:
+                logger.log_error(
+                    f"{state.name} has over {self.limit} series; "
+                    f"{self.action} the points of new series"
+                )
+            return None
+        if state.admitted is not None and item_hashes in state.admitted:
+            return None
+        if not state.sketch.add(item_hashes[0]) and self.action == WARN:
+            # most likely a series that was already written
+            return None
+        if self.action == WARN:
+            logger.log_info_sampled(
+                "cardinality.limit",
+                "New series over the limit of %s: %r",
+                state.name,
+                series_key,
+            )
+        return self.action
+
+    def _get_measurement(self, database: str, measurement: str) -> _Measurement:
+        """
+
+        :param database: InfluxDB database.
+        :param measurement: measurement of the database.
+        :return: the series of the measurement; those of ~`OTHER_MEASUREMENTS`
+            once the database has `max_measurements`.
+        """
+        state = self._measurements.get((database, measurement))
+        if state is not None:
+            return state
+        count = self._counts.get(database, 0)
+        if count >= self.max_measurements:
+            measurement = OTHER_MEASUREMENTS
+            state = self._measurements.get((database, measurement))
+            if state is not None:
+                return state
+        self._counts[database] = count + 1
+        state = self._measurements[(database, measurement)] = _Measurement(
+            f"{database}.{measurement}",
+            HyperLogLog(self.precision),
+            BloomFilter(self.limit, self.error_rate) if self.action != WARN else None,
+        )
+        metrics.SERIES_CARDINALITY.labels(database, measurement).set_function(
+            state.sketch.estimate
+        )
+        return state
+
+    def _get_series(self, point: WritablePoint) -> Tuple[bytes, str]:
+        """
+
+        :param point: data point or line protocol line.
+        :return: the series key and the measurement of the point.
+        """
+        if isinstance(point, bytes):
+            series_key, _, _ = line_protocol.split_line(point)
+            return series_key, line_protocol.get_measurement(series_key)
+        series_key = line_protocol.encode_series_key(
+            point["measurement"], point.get("tags", {}).items()
+        ).encode()
+        return series_key, point["measurement"]
+
+    def _fold(self, point: WritablePoint) -> Optional[WritablePoint]:
+        """
+
+        :param point: data point or line protocol line.
+        :return: the point with the `fold_tags` moved to its fields; None if it has
+            none of them.
+        """
+        if isinstance(point, bytes):
+            series_key, fields, timestamp = line_protocol.split_line(point)
+            measurement, encoded_tags = line_protocol.split_series_key(series_key)
+            tags = line_protocol.parse_tags(encoded_tags)
+            folded = self._fold_tags(tags)
+            if not folded:
+                return None
+            encoded_fields = fields.decode() + "," + line_protocol.encode_fields(folded)
+            return line_protocol.encode_line(
+                line_protocol.encode_series_key(measurement, tags.items()),
+                encoded_fields,
+                int(timestamp) if timestamp is not None else None,
+            )
+        tags = dict(point.get("tags", {}))
+        folded = self._fold_tags(tags)
+        if not folded:
+            return None
+        return {**point, "tags": tags, "fields": {**point["fields"], **folded}}
+
+    def _fold_tags(self, tags: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Removes the `fold_tags` from the tags.
+
+        :param tags: tags of a point.
+        :return: the removed tags.
+        """
+        return {tag: tags.pop(tag) for tag in self.fold_tags if tag in tags}
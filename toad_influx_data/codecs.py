@@ -0,0 +1,185 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+
+import cbor
+
+import toad_influx_data.utils.protocol as prot
+from toad_influx_data.router import topic_matches
+from toad_influx_data.utils import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+Payload = Union[bytes, memoryview]
+
+# SenML-CBOR integer labels (RFC 8428, section 6) and their SenML-JSON names
+SENML_CBOR_LABELS = {
+    -1: "bver",
+    -2: "bn",
+    -3: "bt",
+    -4: "bu",
+    -5: "bv",
+    -6: "bs",
+    0: "n",
+    1: "u",
+    2: "v",
+    3: "vs",
+    4: "vb",
+    5: "s",
+    6: "t",
+    7: "ut",
+    8: "vd",
+}
+
+# maximum number of topics whose codec is memoized
+CODEC_CACHE_SIZE = 4096
+
+
+class ICodec(ABC):
+    """
+    Interface that the payload codecs need to implement.
+    Codecs decode MQTT payloads into the structure that the DataServer reads the
+    ~`toad_influx_data.utils.protocol.PAYLOAD_DATA_FIELD` from.
+    """
+
+    name: str
+    content_types: Tuple[str, ...]
+
+    @abstractmethod
+    def decode(self, payload: Payload) -> Any:
+        """
+
+        :param payload: MQTT message payload.
+        :return: the decoded payload.
+        """
+        pass
+
+
+class JSONCodec(ICodec):
+    """
+    JSON codec, which decodes the payload bytes without copying them into a string
+    first; with orjson if it is installed and enabled.
+    """
+
+    name = "json"
+    content_types = ("application/json", "application/senml+json")
+
+    def __init__(self, backend: str = config.CODECS_JSON_BACKEND):
+        """
+        JSONCodec initializer.
+
+        :param backend: ``json``, ``orjson``, or ``auto`` to use orjson if installed.
+        """
+        if backend == "orjson" and orjson is None:
+            raise ValueError("orjson JSON backend is not installed")
+        self._use_orjson = orjson is not None and backend in ("orjson", "auto")
+
+    def decode(self, payload: Payload) -> Any:
+        if self._use_orjson:
+            return orjson.loads(payload)
+        if isinstance(payload, memoryview):
+            payload = payload.tobytes()
+        return json.loads(payload)
+
+
+class CBORCodec(ICodec):
+    """
+    CBOR codec; SenML-CBOR records have their integer labels renamed to the
+    SenML-JSON ones, and a bare SenML pack is wrapped in the payload data field, so
+    that the handlers get the same records as from JSON payloads.
+    """
+
+    name = "cbor"
+    content_types = ("application/cbor", "application/senml+cbor")
+
+    def decode(self, payload: Payload) -> Any:
+        if isinstance(payload, memoryview):
+            payload = payload.tobytes()
+        decoded = cbor.loads(payload)
+        if isinstance(decoded, list):
+            decoded = {prot.PAYLOAD_DATA_FIELD: decoded}
+        data = decoded.get(prot.PAYLOAD_DATA_FIELD)
+        if isinstance(data, list):
+            decoded[prot.PAYLOAD_DATA_FIELD] = [
+                self._rename_labels(record) for record in data
+            ]
+        return decoded
+
+    def _rename_labels(self, record: Any) -> Any:
+        if not isinstance(record, dict):
+            return record
+        return {SENML_CBOR_LABELS.get(key, key): value for key, value in record.items()}
+
+
+class CodecRegistry:
+    """
+    Chooses the codec of every MQTT message: by its MQTT 5 content type property if
+    it has one, else by the first topic pattern that matches its topic, else JSON.
+    """
+
+    def __init__(
+        self,
+        codecs: Optional[List[ICodec]] = None,
+        topic_codecs: Optional[List[Tuple[str, str]]] = None,
+    ):
+        """
+        CodecRegistry initializer.
+
+        :param codecs: available codecs; JSON and CBOR if not given.
+        :param topic_codecs: (topic pattern, codec name) pairs; from the
+            configuration if not given.
+        """
+        codecs = codecs or [JSONCodec(), CBORCodec()]
+        self._by_name: Dict[str, ICodec] = {codec.name: codec for codec in codecs}
+        self._by_content_type: Dict[str, ICodec] = {
+            content_type: codec
+            for codec in codecs
+            for content_type in codec.content_types
+        }
+        if topic_codecs is None:
+            topic_codecs = config.CODECS_TOPICS
+        self._topic_codecs = [
+            (pattern, self._by_name[name]) for pattern, name in topic_codecs
+        ]
+        self._default = self._by_name[JSONCodec.name]
+        self._cache: Dict[str, ICodec] = {}
+
+    def decode(self, topic: str, payload: Payload, properties: Mapping) -> Any:
+        """
+
+        :param topic: MQTT topic the message was received in.
+        :param payload: MQTT message payload.
+        :param properties: MQTT message properties.
+        :return: the decoded payload.
+        """
+        return self.get_codec(topic, properties).decode(payload)
+
+    def get_codec(self, topic: str, properties: Optional[Mapping] = None) -> ICodec:
+        """
+
+        :param topic: MQTT topic the message was received in.
+        :param properties: MQTT message properties.
+        :return: the codec of the message.
+        """
+        content_type = (properties or {}).get("content_type")
+        if content_type:
+            # gmqtt gives the values of the properties as lists
+            if isinstance(content_type, list):
+                content_type = content_type[0]
+            codec = self._by_content_type.get(content_type.split(";")[0].strip())
+            if codec is not None:
+                return codec
+        codec = self._cache.get(topic)
+        if codec is None:
+            codec = self._default
+            for pattern, topic_codec in self._topic_codecs:
+                if topic_matches(pattern, topic):
+                    codec = topic_codec
+                    break
+            if len(self._cache) >= CODEC_CACHE_SIZE:
+                self._cache.clear()
+            self._cache[topic] = codec
+        return codec
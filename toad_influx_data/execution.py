@@ -0,0 +1,313 @@
+import asyncio
+import multiprocessing
+import time
+import zlib
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple, Type
+
+from toad_influx_data import metrics
+from toad_influx_data.handlers.handler_abc import (
+    EXECUTION_MODES,
+    INLINE,
+    PROCESS,
+    IHandler,
+    get_points,
+)
+from toad_influx_data.utils import config
+from toad_influx_data.utils import logger
+from toad_influx_data.writer import Points
+
+Message = Tuple[str, Any]  # (topic, decoded data)
+# (database, points, time precision, rejected records)
+Conversion = Tuple[str, Points, Optional[str], List[Tuple[Any, str]]]
+# (conversion, error, seconds); the conversion is None if it raised the error
+ConversionResult = Tuple[Optional[Conversion], Optional[str], float]
+ResultHandler = Callable[
+    [IHandler, str, Any, Optional[Conversion], Optional[str]], Awaitable[None]
+]
+
+
+def convert_message(handler: IHandler, topic: str, data: Any) -> Conversion:
+    """
+
+    :param handler: handler of the message.
+    :param topic: MQTT topic the message was received in.
+    :param data: decoded MQTT message data.
+    :return: the database of the message, its points and their time precision,
+        and the records that could not be converted and why.
+    """
+    database = handler.get_influx_database(topic)
+    points, time_precision, rejected = get_points(handler, data)
+    return database, points, time_precision, rejected
+
+
+def convert_batch(handler: IHandler, messages: List[Message]) -> List[ConversionResult]:
+    """
+
+    :param handler: handler of the messages.
+    :param messages: topics and decoded data of the messages.
+    :return: the conversion of every message, or the error that it raised, and the
+        seconds it took.
+    """
+    results: List[ConversionResult] = []
+    for topic, data in messages:
+        start = time.perf_counter()
+        try:
+            conversion = convert_message(handler, topic, data)
+        except Exception as e:
+            results.append((None, str(e), time.perf_counter() - start))
+            continue
+        results.append((conversion, None, time.perf_counter() - start))
+    return results
+
+
+_handlers: Dict[Type[IHandler], IHandler] = {}
+
+
+def _convert_batch_in_process(
+    handler_class: Type[IHandler], messages: List[Message]
+) -> List[ConversionResult]:
+    # every process has its own instance of the handler
+    handler = _handlers.get(handler_class)
+    if handler is None:
+        handler = _handlers[handler_class] = handler_class()
+    return convert_batch(handler, messages)
+
+
+class _Lane:
+    """
+    Queue of the messages of a handler whose topics hash to the same lane, which
+    are converted in order.
+
+    :ivar handler: handler of the messages.
+    :ivar mode: ~`toad_influx_data.handlers.handler_abc.THREAD` or
+        ~`toad_influx_data.handlers.handler_abc.PROCESS`.
+    :ivar queue: queued messages.
+    :ivar task: task that converts the queued messages.
+    """
+
+    __slots__ = ("handler", "mode", "queue", "task")
+
+    def __init__(self, handler: IHandler, mode: str, maxsize: int):
+        self.handler = handler
+        self.mode = mode
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.task: Optional[asyncio.Task] = None
+
+
+class HandlerExecutor:
+    """
+    Runs the conversion of the handlers that are not ~`INLINE` in a thread or
+    process pool, so that a slow handler does not stall the event loop, the MQTT
+    keepalives, and the messages of other topics.
+
+    The messages of every handler are split in `lanes` by the hash of their topic,
+    so that the messages of a topic are converted, and their results handled, in
+    the order they were submitted, while the lanes run concurrently. A lane sends
+    the messages queued in it to the pool in batches of up to `batch_size`, and its
+    queue holds up to `queue_size` messages, after which `submit` waits, which
+    applies backpressure to the ingest queue.
+
+    The execution mode of a handler is the one it declares with
+    ~`toad_influx_data.handlers.handler_abc.IHandler.get_execution_mode`, unless
+    `modes` overrides it by the handler's class name.
+
+    :ivar result_handler: async function that handles the conversion of every
+        message, or the error that it raised.
+    :ivar lanes: lanes of every handler.
+    :ivar batch_size: maximum messages converted at once by a lane.
+    :ivar queue_size: maximum messages queued in a lane.
+    :ivar thread_workers: threads of the thread pool.
+    :ivar process_workers: processes of the process pool.
+    :ivar modes: execution modes by handler class name, overriding the handlers'.
+    """
+
+    result_handler: ResultHandler
+    lanes: int
+    batch_size: int
+    queue_size: int
+    thread_workers: int
+    process_workers: int
+    modes: Mapping[str, str]
+
+    def __init__(
+        self,
+        result_handler: ResultHandler,
+        lanes: int = config.EXECUTION_LANES,
+        batch_size: int = config.EXECUTION_BATCH_SIZE,
+        queue_size: int = config.EXECUTION_QUEUE_SIZE,
+        thread_workers: int = config.EXECUTION_THREAD_WORKERS,
+        process_workers: int = config.EXECUTION_PROCESS_WORKERS,
+        modes: Mapping[str, str] = config.EXECUTION_MODES,
+    ):
+        """
+        HandlerExecutor initializer.
+
+        :param result_handler: async function that handles the conversion of every
+            message, or the error that it raised.
+        :param lanes: lanes of every handler.
+        :param batch_size: maximum messages converted at once by a lane.
+        :param queue_size: maximum messages queued in a lane.
+        :param thread_workers: threads of the thread pool.
+        :param process_workers: processes of the process pool; one per CPU if 0.
+        :param modes: execution modes by handler class name, overriding the
+            handlers'.
+        """
+        for mode in modes.values():
+            if mode not in EXECUTION_MODES:
+                raise ValueError(f"Unknown execution mode: {mode}")
+        self.result_handler = result_handler
+        self.lanes = max(lanes, 1)
+        self.batch_size = max(batch_size, 1)
+        self.queue_size = queue_size
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self.modes = dict(modes)
+        self._modes: Dict[IHandler, str] = {}
+        self._lanes: Dict[IHandler, List[_Lane]] = {}
+        self._pools: Dict[str, Executor] = {}
+
+    @property
+    def pending(self) -> int:
+        """
+
+        :return: number of messages queued in the lanes.
+        """
+        return sum(
+            lane.queue.qsize() for lanes in self._lanes.values() for lane in lanes
+        )
+
+    def get_mode(self, handler: IHandler) -> str:
+        """
+
+        :param handler: a handler.
+        :return: the execution mode of the handler.
+        """
+        mode = self._modes.get(handler)
+        if mode is None:
+            mode = self.modes.get(
+                handler.__class__.__name__, handler.get_execution_mode()
+            )
+            if mode not in EXECUTION_MODES:
+                raise ValueError(f"Unknown execution mode: {mode}")
+            self._modes[handler] = mode
+        return mode
+
+    async def submit(self, handler: IHandler, topic: str, data: Any):
+        """
+        Queues a message to be converted by a handler that is not ~`INLINE`; it
+        waits while the lane of the topic is full.
+
+        :param handler: handler of the message.
+        :param topic: MQTT topic the message was received in.
+        :param data: decoded MQTT message data.
+        :return:
+        """
+        lanes = self._lanes.get(handler)
+        if lanes is None:
+            lanes = self._start_lanes(handler)
+        lane = lanes[zlib.crc32(topic.encode()) % self.lanes]
+        await lane.queue.put((topic, data))
+
+    async def stop(self):
+        """
+        Waits for the queued messages to be converted and handled, and stops the
+        lanes and the pools.
+
+        :return:
+        """
+        lanes = [
+            lane for handler_lanes in self._lanes.values() for lane in handler_lanes
+        ]
+        for lane in lanes:
+            await lane.queue.join()
+        for lane in lanes:
+            lane.task.cancel()  # type: ignore
+        await asyncio.gather(*(lane.task for lane in lanes), return_exceptions=True)
+        self._lanes = {}
+        for pool in self._pools.values():
+            pool.shutdown()
+        self._pools = {}
+
+    def _start_lanes(self, handler: IHandler) -> List[_Lane]:
+        """
+
+        :param handler: a handler that is not ~`INLINE`.
+        :return: the lanes of the handler, which are started.
+        """
+        mode = self.get_mode(handler)
+        if mode == INLINE:
+            raise ValueError(f"{handler.__class__.__name__} runs inline")
+        lanes = self._lanes[handler] = [
+            _Lane(handler, mode, self.queue_size) for _ in range(self.lanes)
+        ]
+        for lane in lanes:
+            lane.task = asyncio.create_task(self._run_lane(lane))
+        logger.log_info(
+            f"Converting the messages of {handler.__class__.__name__} in a {mode} pool"
+        )
+        return lanes
+
+    def _get_pool(self, mode: str) -> Executor:
+        """
+
+        :param mode: ~`toad_influx_data.handlers.handler_abc.THREAD` or
+            ~`toad_influx_data.handlers.handler_abc.PROCESS`.
+        :return: the pool of the mode, which is created when it is first used.
+        """
+        pool = self._pools.get(mode)
+        if pool is None:
+            if mode == PROCESS:
+                pool = ProcessPoolExecutor(
+                    self.process_workers or None,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                pool = ThreadPoolExecutor(
+                    self.thread_workers, thread_name_prefix="toad_handler"
+                )
+            self._pools[mode] = pool
+        return pool
+
+    async def _run_lane(self, lane: _Lane):
+        """
+        Converts the messages of a lane in batches, and handles their results in
+        order, until it is cancelled.
+
+        :param lane: the lane.
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        handler_name = lane.handler.__class__.__name__
+        conversion_seconds = metrics.CONVERSION_SECONDS.labels(handler_name)
+        while True:
+            messages = [await lane.queue.get()]
+            while len(messages) < self.batch_size and not lane.queue.empty():
+                messages.append(lane.queue.get_nowait())
+            try:
+                if lane.mode == PROCESS:
+                    results = await loop.run_in_executor(
+                        self._get_pool(lane.mode),
+                        _convert_batch_in_process,
+                        lane.handler.__class__,
+                        messages,
+                    )
+                else:
+                    results = await loop.run_in_executor(
+                        self._get_pool(lane.mode), convert_batch, lane.handler, messages
+                    )
+                for (topic, data), (conversion, error, seconds) in zip(
+                    messages, results
+                ):
+                    conversion_seconds.observe(seconds)
+                    await self.result_handler(
+                        lane.handler, topic, data, conversion, error
+                    )
+            except Exception as e:
+                logger.log_error(
+                    f"Error converting {len(messages)} messages of {handler_name}: "
+                    f"{e!r}"
+                )
+            finally:
+                for _ in messages:
+                    lane.queue.task_done()
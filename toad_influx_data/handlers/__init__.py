@@ -1,5 +1,16 @@
-from typing import List
-from toad_influx_data.handlers.generic_handler import GenericHandler
+from typing import Any, List
+
 from toad_influx_data.handlers.handler_abc import IHandler
 
-HANDLERS: List[IHandler] = [GenericHandler()]
+_handlers: List[IHandler] = []
+
+
+def __getattr__(name: str) -> Any:
+    # HANDLERS, the enabled handlers, are only imported when they are first used
+    if name == "HANDLERS":
+        if not _handlers:
+            from toad_influx_data.handlers.registry import HandlerRegistry
+
+            _handlers.extend(HandlerRegistry().load_enabled())
+        return _handlers
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
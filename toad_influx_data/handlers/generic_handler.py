@@ -1,24 +1,40 @@
+import math
 import re
-from typing import Dict, Union, Any, Optional
+import time
+from types import MappingProxyType
+from typing import Dict, Union, Any, Optional, Tuple, TYPE_CHECKING
 from typing import List
 
-import strict_rfc3339
-from senml.senml import SenMLDocument, SenMLMeasurement
+from toad_influx_data.handlers.handler_abc import IHandler, InfluxPoint, PointBatch
+from toad_influx_data.series import SeriesCache, SeriesDescriptor
+from toad_influx_data.utils import config
+from toad_influx_data.utils import line_protocol
 
-from toad_influx_data.handlers.handler_abc import IHandler, InfluxPoint
+if TYPE_CHECKING:
+    from senml.senml import SenMLDocument, SenMLMeasurement
+
+# base fields of a SenML record, which apply to it and the records after it
+SENML_BASE_FIELDS = ("bn", "bt", "bu", "bv")
+# SenML times below it are relative to the current time
+SENML_RELATIVE_TIME_LIMIT = 2 ** 28
 
 
 class GenericHandler(IHandler):
     LISTEN_TOPIC = "data/+/influx_data"
+    _LISTEN_TOPIC_REGEX = re.compile(
+        LISTEN_TOPIC.replace("+", "[^/]+").replace("#", ".+")
+    )
+
+    def __init__(self, series_cache_size: int = config.INGEST_SERIES_CACHE_SIZE):
+        self.series_cache = SeriesCache(
+            self._get_series, series_cache_size, name=self.__class__.__name__
+        )
 
     def get_topics(self) -> List[str]:
         return [GenericHandler.LISTEN_TOPIC, GenericHandler.LISTEN_TOPIC + "/#"]
 
     def can_handle(self, topic: str) -> bool:
-        regex_topic = GenericHandler.LISTEN_TOPIC.replace("+", "[^/]+").replace(
-            "#", ".+"
-        )
-        return True if re.match(regex_topic, topic) else False
+        return True if GenericHandler._LISTEN_TOPIC_REGEX.match(topic) else False
 
     def get_influx_database(self, topic: str) -> str:
         return topic.split("/")[3]
@@ -39,47 +55,136 @@ class GenericHandler(IHandler):
         return influx_points
 
     def get_influx_power_points(self, senml_data_points: Any) -> List[InfluxPoint]:
+        # senml is only imported by the dict points path
+        from senml.senml import SenMLDocument
+
         influx_points = []
         senml_power_document = SenMLDocument.from_json([senml_data_points[0]])
         return self.get_influx_points(influx_points, senml_power_document)
 
     def get_influx_status_points(self, senml_data_points: Any) -> List[InfluxPoint]:
+        from senml.senml import SenMLDocument
+
         influx_points = []
         senml_status_document = SenMLDocument.from_json([senml_data_points[1]])
         return self.get_influx_points(influx_points, senml_status_document)
 
     def get_time_precision(self) -> Optional[str]:
-        return "s"
+        return "ms"
+
+    def get_influx_point_batch(self, senml_pack: Any) -> PointBatch:
+        batch = PointBatch(self.get_time_precision())
+        multiplier = line_protocol.PRECISION_MULTIPLIERS[batch.time_precision]
+        # the base fields of the records so far, as SenML resolves them
+        base: Dict[str, Any] = {}
+        now = time.time()
+        for senml_record in senml_pack:
+            # a malformed record is rejected, and the rest are still converted
+            try:
+                for field in SENML_BASE_FIELDS:
+                    if field in senml_record:
+                        base[field] = senml_record[field]
+                series, timestamp, value = self._get_columns_from_senml(
+                    senml_record, base, now
+                )
+            except Exception as e:
+                batch.reject(senml_record, str(e))
+                continue
+            batch.append(series, int(round(timestamp * multiplier)), value)
+        return batch
+
+    def _get_columns_from_senml(
+            self, senml_record: Dict[str, Any], base: Dict[str, Any], now: float
+    ) -> Tuple[SeriesDescriptor, float, Any]:
+        # same measurement, tags and fields as get_influx_points, without building
+        # a SenMLDocument; the base fields are the ones in effect for the record,
+        # and its time is the base time plus its own, relative to now if small
+        if "t" not in senml_record and "bt" not in base:
+            raise ValueError("No time specified")
+        timestamp = (base.get("bt") or 0) + (senml_record.get("t") or 0)
+        if timestamp < SENML_RELATIVE_TIME_LIMIT:
+            timestamp += now
+        series = self.series_cache.get(
+            base.get("bn"),
+            senml_record.get("n"),
+            senml_record.get("u") or base.get("bu"),
+        )
+        value = self._get_value_from_senml_record(senml_record)
+        if value is None:
+            raise ValueError("No value specified")
+        base_value = base.get("bv")
+        if base_value and not isinstance(value, (bool, str)):
+            value += base_value
+        # InfluxDB rejects the whole write if a line has a NaN or infinite value
+        if isinstance(value, float) and not math.isfinite(value):
+            raise ValueError(f"Value is not finite: {value}")
+        return series, timestamp, value
+
+    def _get_series(
+            self, base_name: str, name: str, unit: Optional[str]
+    ) -> SeriesDescriptor:
+        if not base_name + name:
+            raise ValueError("No Name specified")
+        if "/" not in base_name + name:
+            raise ValueError(f"Name is not <id>/<measurement>: {base_name + name}")
+        sp_id, measurement = (base_name + name).split(
+            "/"
+        )  # the name is <id>/<measurement>; e.g. sp_w.r1.c1/power
+        # the tags of the series key, so that the descriptor has the same ones
+        tags = {
+            key: str(value)
+            for key, value in self._get_tags(sp_id, unit).items()
+            if value is not None and value != ""
+        }
+        return SeriesDescriptor(
+            measurement,
+            MappingProxyType(tags),
+            line_protocol.encode_series_key(measurement, tags.items()),
+        )
+
+    def _get_series_from_senml(
+            self, senml_document: "SenMLDocument", senml_measurement: "SenMLMeasurement"
+    ) -> SeriesDescriptor:
+        return self.series_cache.get(
+            senml_document.base.name,
+            senml_measurement.name,
+            senml_measurement.unit or senml_document.base.unit,
+        )
+
+    def _get_value_from_senml_record(self, senml_record: Dict[str, Any]) -> Any:
+        # the same value as SenMLMeasurement.from_json
+        value = senml_record.get("v")
+        if value is None:
+            if "vs" in senml_record:
+                value = str(senml_record["vs"])
+            elif "vb" in senml_record:
+                value = str(senml_record["vb"]).casefold() not in ("false", "0")
+        return value
 
     def _get_time_from_senml(
-            self, senml_document: SenMLDocument, senml_measurement: SenMLMeasurement
+            self, senml_document: "SenMLDocument", senml_measurement: "SenMLMeasurement"
     ) -> str:
         time = senml_measurement.time or senml_document.base.time
         if not time:
             raise ValueError("No time specified")
+        import strict_rfc3339
+
         return strict_rfc3339.timestamp_to_rfc3339_utcoffset(time)
 
     def _get_measurement_from_senml(
-            self, senml_document: SenMLDocument, senml_measurement: SenMLMeasurement
+            self, senml_document: "SenMLDocument", senml_measurement: "SenMLMeasurement"
     ) -> str:
-        name = self._get_name(senml_document, senml_measurement)
-        if not name:
-            raise ValueError("No Name specified")
-        sp_id, measurement = name.split(
-            "/"
-        )  # the name is <id>/<measurement>; e.g. sp_w.r1.c1/power
-        return measurement
+        series = self._get_series_from_senml(senml_document, senml_measurement)
+        return series.measurement
 
     def _get_tags_from_senml(
-            self, senml_document: SenMLDocument, senml_measurement: SenMLMeasurement
+            self, senml_document: "SenMLDocument", senml_measurement: "SenMLMeasurement"
     ) -> Dict[str, Union[str, int]]:
-        name = self._get_name(senml_document, senml_measurement)
-        if not name:
-            raise ValueError("No Name specified")
-        sp_id, measurement = name.split(
-            "/"
-        )  # the name is <id>/<measurement>; e.g. sp_w.r1.c1/power
-        unit = senml_measurement.unit or senml_document.base.unit
+        series = self._get_series_from_senml(senml_document, senml_measurement)
+        # a copy, so that the points do not share the cached tags
+        return dict(series.tags)
+
+    def _get_tags(self, sp_id: str, unit: Optional[str]) -> Dict[str, Union[str, int]]:
         type = sp_id[3]  # sp_w.r0.c1
         tags = {"id": sp_id, "unit": unit, "type": type}
         if type == "w":
@@ -89,13 +194,6 @@ class GenericHandler(IHandler):
         return tags
 
     def _get_fields_from_senml(
-            self, senml_document: SenMLDocument, senml_measurement: SenMLMeasurement
+            self, senml_document: "SenMLDocument", senml_measurement: "SenMLMeasurement"
     ) -> Dict[str, Union[str, int, float]]:
         return {"value": senml_measurement.value}
-
-    def _get_name(
-            self, senml_document: SenMLDocument, senml_measurement: SenMLMeasurement
-    ) -> str:
-        base_name = senml_document.base.name or ""
-        name = senml_measurement.name or ""
-        return base_name + name
@@ -1,8 +1,184 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from toad_influx_data.series import SeriesDescriptor
+from toad_influx_data.utils import line_protocol
 
 InfluxPoint = Dict[str, Any]
 
+# execution modes of the conversion of a handler
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+EXECUTION_MODES = (INLINE, THREAD, PROCESS)
+
+
+class PointBatch:
+    """
+    Compact batch of points of a single field, stored as parallel arrays: the
+    interned ~`toad_influx_data.series.SeriesDescriptor` of every point, its integer
+    timestamp and its value; so that no dict is allocated per point.
+
+    Values are floats, or the integers, booleans and strings that SenML records can
+    also have. The records that could not be converted are kept apart, with the
+    reason, so that a malformed record does not discard the rest of the batch.
+
+    A batch goes through the server pipeline as it is; the stages work on its
+    series descriptors, timestamps and values, and only the writer serializes it.
+
+    :ivar time_precision: precision of the timestamps.
+    :ivar field: field key of the values.
+    :ivar series: series of every point.
+    :ivar timestamps: timestamp of every point.
+    :ivar values: field value of every point.
+    :ivar rejected: records that could not be converted, and why.
+    """
+
+    __slots__ = (
+        "time_precision",
+        "field",
+        "series",
+        "timestamps",
+        "values",
+        "rejected",
+    )
+
+    time_precision: Optional[str]
+    field: str
+    series: List[SeriesDescriptor]
+    timestamps: "array[int]"
+    values: List[Any]
+    rejected: List[Tuple[Any, str]]
+
+    def __init__(self, time_precision: Optional[str] = None, field: str = "value"):
+        """
+        PointBatch initializer.
+
+        :param time_precision: precision of the timestamps.
+        :param field: field key of the values.
+        """
+        self.time_precision = time_precision
+        self.field = field
+        self.series = []
+        self.timestamps = array("q")
+        self.values = []
+        self.rejected = []
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def append(self, series: SeriesDescriptor, timestamp: int, value: Any):
+        """
+        Adds a point.
+
+        :param series: series of the point.
+        :param timestamp: timestamp of the point, in the batch time precision.
+        :param value: field value of the point.
+        :return:
+        """
+        self.series.append(series)
+        self.timestamps.append(timestamp)
+        self.values.append(value)
+
+    def reject(self, record: Any, reason: str):
+        """
+        Adds a record that could not be converted.
+
+        :param record: the record.
+        :param reason: why it could not be converted.
+        :return:
+        """
+        self.rejected.append((record, reason))
+
+    def extend(
+        self,
+        series: Iterable[SeriesDescriptor],
+        timestamps: Iterable[int],
+        values: Iterable[Any],
+    ):
+        """
+        Adds points, from parallel iterables.
+
+        :param series: series of every point.
+        :param timestamps: timestamp of every point, in the batch time precision.
+        :param values: field value of every point.
+        :return:
+        """
+        self.series.extend(series)
+        self.timestamps.extend(timestamps)
+        self.values.extend(values)
+        if not len(self.series) == len(self.timestamps) == len(self.values):
+            raise ValueError("Series, timestamps and values of different lengths")
+
+    def take(self, indices: Sequence[int]) -> "PointBatch":
+        """
+
+        :param indices: indices of the points to take, in order.
+        :return: a new batch with the points at the indices, with the same time
+            precision and field, and without the rejected records.
+        """
+        batch = PointBatch(self.time_precision, self.field)
+        batch.series = [self.series[index] for index in indices]
+        batch.timestamps = array("q", (self.timestamps[index] for index in indices))
+        batch.values = [self.values[index] for index in indices]
+        return batch
+
+    def with_time_precision(self, time_precision: Optional[str]) -> "PointBatch":
+        """
+
+        :param time_precision: precision of the timestamps of the new batch.
+        :return: a batch with the timestamps in the given precision, which shares
+            the series and values of this one; this one if it has the precision.
+        """
+        if time_precision == self.time_precision:
+            return self
+        source = line_protocol.PRECISION_MULTIPLIERS[self.time_precision]
+        target = line_protocol.PRECISION_MULTIPLIERS[time_precision]
+        batch = PointBatch(time_precision, self.field)
+        batch.series = self.series
+        # integer arithmetic, so that the timestamps are exact
+        if isinstance(source, int) and isinstance(target, int) and target >= source:
+            scale = target // source
+            batch.timestamps = array("q", (t * scale for t in self.timestamps))
+        else:
+            batch.timestamps = array(
+                "q", (int(round(t * target / source)) for t in self.timestamps)
+            )
+        batch.values = self.values
+        return batch
+
+    def to_lines(self) -> List[bytes]:
+        """
+
+        :return: line protocol lines of the points, with the batch time precision.
+        """
+        field = line_protocol.escape_key(self.field)
+        encode = line_protocol.encode_field_value
+        return [
+            f"{series.series_key} {field}={encode(value)} {timestamp}".encode()
+            for series, timestamp, value in zip(
+                self.series, self.timestamps, self.values
+            )
+        ]
+
+    def to_points(self) -> List[InfluxPoint]:
+        """
+        Compatibility adapter to dict points.
+
+        :return: data points of the points, with nanosecond timestamps.
+        """
+        times = self.with_time_precision(None).timestamps
+        return [
+            {
+                "time": time,
+                "measurement": series.measurement,
+                "tags": dict(series.tags),
+                "fields": {self.field: value},
+            }
+            for series, time, value in zip(self.series, times, self.values)
+        ]
+
 
 class IHandler(ABC):
     """
@@ -15,7 +191,8 @@ class IHandler(ABC):
     def get_topics(self) -> List[str]:
         """
 
-        :return: topics that the handler need to listen.
+        :return: topics that the handler need to listen; MQTT wildcards are allowed
+            and the messages received in them are routed to the handler.
         """
         pass
 
@@ -53,6 +230,32 @@ class IHandler(ABC):
         """
         return None
 
+    def get_execution_mode(self) -> str:
+        """
+        Where the messages are converted: ~`INLINE` on the event loop, which is the
+        fastest for cheap conversions; in a ~`THREAD` pool, for conversions that
+        release the GIL or block; or in a ~`PROCESS` pool, for CPU-heavy ones, so
+        that they do not delay the messages of other topics. A handler that runs in
+        a thread pool must be thread-safe, and one that runs in a process pool is
+        instantiated with no arguments in every process.
+
+        :return: ~`INLINE`, ~`THREAD` or ~`PROCESS`.
+        """
+        return INLINE
+
+    def get_influx_point_batch(self, data: Any) -> Optional[PointBatch]:
+        """
+        Fast path that converts a whole pack of records of any length to a compact
+        ~`PointBatch`, instead of generating dict points; the batch goes through
+        the server pipeline, and is only serialized by the writer.
+
+        :param data: MQTT message data.
+        :return: the points of every record, with integer timestamps in the
+            ~`get_time_precision` precision; or None if the handler only generates
+            dict points.
+        """
+        return None
+
     @abstractmethod
     def get_influx_status_points(self, data: Any) -> List[InfluxPoint]:
         """
@@ -61,3 +264,24 @@ class IHandler(ABC):
         :return: list of InfluxDB data points that are generated from the MQTT message data.
         """
         pass
+
+
+def get_points(
+    handler: IHandler, data: Any
+) -> Tuple[Union[List[InfluxPoint], PointBatch], Optional[str], List[Tuple[Any, str]]]:
+    """
+    Converts the MQTT message data with the fastest path the handler supports.
+
+    :param handler: handler of the message.
+    :param data: MQTT message data.
+    :return: the point batch or the dict points, their time precision, and the
+        records that could not be converted and why; only point batches convert
+        each record on its own, dict points raise if any record is malformed.
+    """
+    batch = handler.get_influx_point_batch(data)
+    if batch is not None:
+        return batch, batch.time_precision, batch.rejected
+    power_data_points = handler.get_influx_power_points(data)
+    status_data_points = handler.get_influx_status_points(data)
+    # dict points are serialized with nanosecond timestamps
+    return power_data_points + status_data_points, None, []
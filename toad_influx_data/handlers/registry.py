@@ -0,0 +1,144 @@
+import importlib
+from importlib import metadata
+from typing import Collection, Dict, List, Mapping, Set
+
+from toad_influx_data.handlers.handler_abc import IHandler
+from toad_influx_data.router import MATCH_CACHE_SIZE, topic_matches
+from toad_influx_data.utils import config
+from toad_influx_data.utils import logger
+
+# entry point group in which the installed packages advertise their handlers
+ENTRY_POINT_GROUP = "toad_influx_data.handlers"
+# handlers of this package, as "<module>:<class>" import paths
+BUILTIN_HANDLERS = {
+    "generic": "toad_influx_data.handlers.generic_handler:GenericHandler",
+}
+
+
+def discover_handlers() -> Dict[str, str]:
+    """
+
+    :return: import paths of the built-in handlers and the ones advertised in the
+        ~`ENTRY_POINT_GROUP` entry points, by name; entry points can override the
+        built-in handlers.
+    """
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        group = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        group = entry_points.get(ENTRY_POINT_GROUP, [])
+    handlers = dict(BUILTIN_HANDLERS)
+    handlers.update((entry_point.name, entry_point.value) for entry_point in group)
+    return handlers
+
+
+def import_handler(path: str) -> IHandler:
+    """
+
+    :param path: ``<module>:<attribute>`` import path of a handler class, or of a
+        handler instance.
+    :return: the handler; the class is instantiated with no arguments.
+    """
+    module_name, _, attribute = path.partition(":")
+    if not attribute:
+        raise ValueError(f"Invalid handler import path: {path}")
+    handler = getattr(importlib.import_module(module_name), attribute)
+    if isinstance(handler, type):
+        handler = handler()
+    if not isinstance(handler, IHandler):
+        raise TypeError(f"{path} is not an IHandler")
+    return handler
+
+
+class HandlerRegistry:
+    """
+    Registry of the available handlers, which only imports the handlers that are
+    used.
+
+    Handlers are named by the built-in ~`BUILTIN_HANDLERS`, the
+    ~`ENTRY_POINT_GROUP` entry points of the installed packages, or by their
+    ``<module>:<class>`` import path. The `enabled` handlers are loaded at start,
+    and the `lazy` ones when a message is first received in one of their topics,
+    so that a deployment does not import the handlers, and their dependencies, that
+    it does not use.
+
+    :ivar available: import paths of the discovered handlers, by name.
+    :ivar enabled: handlers loaded at start.
+    :ivar lazy: topic patterns of the handlers loaded on their first message.
+    :ivar loaded: loaded handlers, by name.
+    """
+
+    available: Dict[str, str]
+    enabled: List[str]
+    lazy: Dict[str, List[str]]
+    loaded: Dict[str, IHandler]
+
+    def __init__(
+        self,
+        enabled: Collection[str] = tuple(config.HANDLERS_ENABLED),
+        lazy: Mapping[str, Collection[str]] = config.HANDLERS_LAZY,
+    ):
+        """
+        HandlerRegistry initializer.
+
+        :param enabled: names of the handlers loaded at start.
+        :param lazy: topic patterns of the handlers loaded on their first message,
+            by name.
+        """
+        self.available = discover_handlers()
+        self.enabled = list(enabled)
+        self.lazy = {name: list(topics) for name, topics in lazy.items()}
+        self.loaded = {}
+        self._pending = dict(self.lazy)
+        self._seen: Set[str] = set()
+
+    def get_lazy_topics(self) -> List[str]:
+        """
+
+        :return: topic patterns of the lazy handlers, to subscribe to before they
+            are loaded.
+        """
+        return [topic for topics in self.lazy.values() for topic in topics]
+
+    def load(self, name: str) -> IHandler:
+        """
+
+        :param name: name or import path of a handler.
+        :return: the handler, which is imported and instantiated only once.
+        """
+        handler = self.loaded.get(name)
+        if handler is None:
+            path = self.available.get(name, name)
+            handler = import_handler(path)
+            self.loaded[name] = handler
+            self._pending.pop(name, None)
+            logger.log_info(f"Loaded handler {name} ({path})")
+        return handler
+
+    def load_enabled(self) -> List[IHandler]:
+        """
+
+        :return: the enabled handlers, in order.
+        """
+        return [self.load(name) for name in self.enabled]
+
+    def load_for(self, topic: str) -> List[IHandler]:
+        """
+        Loads the lazy handlers that listen to a topic, the first time that it is
+        seen.
+
+        :param topic: the topic that a message was received from.
+        :return: the handlers that were loaded for the topic; empty once they are
+            loaded, so that it is cheap to call for every message.
+        """
+        if not self._pending or topic in self._seen:
+            return []
+        if len(self._seen) >= MATCH_CACHE_SIZE:
+            self._seen.clear()
+        self._seen.add(topic)
+        names = [
+            name
+            for name, topics in self._pending.items()
+            if any(topic_matches(pattern, topic) for pattern in topics)
+        ]
+        return [self.load(name) for name in names]
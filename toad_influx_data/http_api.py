@@ -0,0 +1,82 @@
+from typing import Awaitable, Callable, Optional
+
+from aiohttp import web
+
+from toad_influx_data import metrics
+from toad_influx_data.utils import config
+from toad_influx_data.utils import logger
+
+RequestHandler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class HTTPServer:
+    """
+    HTTP server of the service's local endpoints; ``/metrics`` exposes the
+    ~`toad_influx_data.metrics` in the Prometheus text format.
+
+    :ivar host: IP the server listens on.
+    :ivar port: port the server listens on.
+    :ivar app: aiohttp application, to which routes can be added before starting.
+    :ivar running: boolean that represents if the server is running.
+    """
+
+    host: str
+    port: int
+    app: web.Application
+    running: bool
+
+    def __init__(self, host: str = config.SERVER_IP, port: int = config.SERVER_PORT):
+        """
+        HTTPServer initializer.
+
+        :param host: IP the server listens on.
+        :param port: port the server listens on.
+        """
+        self.host = host
+        self.port = port
+        self.app = web.Application()
+        self.app.router.add_get("/metrics", self._get_metrics)
+        self.running = False
+        self._runner: Optional[web.AppRunner] = None
+
+    def add_get(self, path: str, handler: RequestHandler):
+        """
+        Adds a GET route.
+
+        :param path: route path.
+        :param handler: async function that handles the requests.
+        :return:
+        """
+        self.app.router.add_get(path, handler)
+
+    async def start(self):
+        """
+        Starts listening.
+
+        :return:
+        """
+        if self.running:
+            raise RuntimeError("HTTP server already running")
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.running = True
+        logger.log_info(f"HTTP server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        """
+        Stops listening.
+
+        :return:
+        """
+        if self.running:
+            await self._runner.cleanup()
+            self.running = False
+
+    async def _get_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=metrics.REGISTRY.expose().encode(),
+            headers={"Content-Type": PROMETHEUS_CONTENT_TYPE},
+        )
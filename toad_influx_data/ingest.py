@@ -0,0 +1,193 @@
+import asyncio
+from typing import Any, Callable, List, Optional, Tuple
+
+from toad_influx_data.utils import config
+from toad_influx_data.utils import logger
+
+# overflow policies
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+IngestMessage = Tuple[str, bytes, Any]  # (topic, payload, properties)
+
+
+class IngestQueue:
+    """
+    Bounded queue between the MQTT client and the message handler, drained by a
+    pool of workers.
+
+    When the queue is full, the overflow policy decides what happens with a new
+    message:
+
+    - ``block``: the message is queued and `pause` is called, so that the MQTT
+      client stops reading from the broker until the queue is half empty and
+      `resume` is called.
+    - ``drop_oldest``: the oldest queued message is dropped.
+    - ``drop_newest``: the new message is dropped.
+
+    :ivar message_handler: async function that handles the queued messages.
+    :ivar maxsize: maximum number of queued messages.
+    :ivar workers: number of workers draining the queue.
+    :ivar overflow_policy: what to do with new messages when the queue is full.
+    :ivar received: number of messages put in the queue.
+    :ivar processed: number of messages handled by the workers.
+    :ivar failed: number of messages whose handler raised an exception.
+    :ivar dropped: number of messages dropped by the overflow policy.
+    :ivar running: boolean that represents if the workers are running.
+    """
+
+    message_handler: Callable
+    maxsize: int
+    workers: int
+    overflow_policy: str
+    received: int
+    processed: int
+    failed: int
+    dropped: int
+    running: bool
+
+    def __init__(
+        self,
+        message_handler: Callable,
+        maxsize: int = config.INGEST_QUEUE_SIZE,
+        workers: int = config.INGEST_WORKERS,
+        overflow_policy: str = config.INGEST_OVERFLOW_POLICY,
+        pause: Optional[Callable[[], None]] = None,
+        resume: Optional[Callable[[], None]] = None,
+    ):
+        """
+        IngestQueue initializer.
+
+        :param message_handler: async function that handles the queued messages.
+        :param maxsize: maximum number of queued messages.
+        :param workers: number of workers draining the queue.
+        :param overflow_policy: one of ~`OVERFLOW_POLICIES`.
+        :param pause: function that stops the message source; used by ``block``.
+        :param resume: function that resumes the message source; used by ``block``.
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.message_handler = message_handler
+        self.maxsize = maxsize
+        self.workers = workers
+        self.overflow_policy = overflow_policy
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.running = False
+        self._pause = pause
+        self._resume = resume
+        self._paused = False
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        """
+
+        :return: number of queued messages.
+        """
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        """
+        Starts the workers.
+
+        :return:
+        """
+        if self.running:
+            raise RuntimeError("Ingest queue already running")
+        # the bound is enforced by put_nowait, so the asyncio queue is unbounded
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+        self.running = True
+
+    async def stop(self):
+        """
+        Waits for the queued messages to be handled and stops the workers.
+
+        :return:
+        """
+        if not self.running:
+            return
+        self.running = False
+        self._set_paused(False)
+        await self._queue.join()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def put_nowait(self, topic: str, payload: bytes, properties: Any) -> bool:
+        """
+        Queues a message, applying the overflow policy if the queue is full.
+
+        :param topic: MQTT topic the message was received in.
+        :param payload: MQTT message payload.
+        :param properties: MQTT message properties.
+        :return: if the message was queued.
+        """
+        self.received += 1
+        if self._queue.qsize() >= self.maxsize:
+            if self.overflow_policy == OVERFLOW_DROP_NEWEST:
+                self._drop()
+                return False
+            if self.overflow_policy == OVERFLOW_DROP_OLDEST:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self._drop()
+            else:
+                self._set_paused(True)
+        self._queue.put_nowait((topic, payload, properties))
+        return True
+
+    def _drop(self):
+        """
+        Counts a dropped message, logging the first one of every thousand.
+
+        :return:
+        """
+        if self.dropped % 1000 == 0:
+            logger.log_error(
+                f"Ingest queue full ({self.maxsize}); {self.dropped + 1} messages "
+                f"dropped so far"
+            )
+        self.dropped += 1
+
+    def _set_paused(self, paused: bool):
+        """
+        Pauses or resumes the message source, if it is not already.
+
+        :param paused: if the message source has to be paused.
+        :return:
+        """
+        if paused == self._paused:
+            return
+        self._paused = paused
+        callback = self._pause if paused else self._resume
+        if callback is not None:
+            callback()
+
+    async def _worker(self):
+        """
+        Handles queued messages until it is cancelled.
+
+        :return:
+        """
+        while True:
+            topic, payload, properties = await self._queue.get()
+            try:
+                await self.message_handler(topic, payload, properties)
+            except Exception as e:
+                self.failed += 1
+                logger.log_error(f"Error handling message from {topic}: {e!r}")
+            finally:
+                self.processed += 1
+                self._queue.task_done()
+            if self._paused and self._queue.qsize() <= self.maxsize // 2:
+                self._set_paused(False)
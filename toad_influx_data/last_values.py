@@ -0,0 +1,343 @@
+import asyncio
+import time
+from typing import Any, Collection, Dict, List, Mapping, Optional, Set, Tuple, Union
+
+import aiohttp
+from aiohttp import web
+
+from toad_influx_data.handlers.handler_abc import PointBatch
+from toad_influx_data.series import SeriesDescriptor
+from toad_influx_data.utils import config
+from toad_influx_data.utils import line_protocol
+from toad_influx_data.writer import Points
+
+# route of the last values in the HTTP server
+LAST_VALUES_PATH = "/last_values"
+# query parameters of the HTTP API that are not tags
+DATABASE_PARAMETER = "database"
+MEASUREMENT_PARAMETER = "measurement"
+# only queries the store of the server, not its peers
+LOCAL_PARAMETER = "local"
+QUERY_PARAMETERS = (DATABASE_PARAMETER, MEASUREMENT_PARAMETER, LOCAL_PARAMETER)
+# seconds after which a query to a peer fails
+PEER_TIMEOUT = 2.0
+
+SeriesId = Tuple[str, str]  # (database, series key)
+# encoded field set of a line, fields of a data point, or the field key and value
+# of a point of a batch; only parsed when it is queried
+Fields = Union[bytes, Dict[str, Any], Tuple[str, Any]]
+
+
+class _LastValue:
+    """
+    Last point of a series.
+
+    :ivar database: InfluxDB database of the series.
+    :ivar measurement: measurement of the series.
+    :ivar tags: tags of the series.
+    :ivar timestamp: epoch timestamp of the point, in nanoseconds.
+    :ivar fields: fields of the point.
+    """
+
+    __slots__ = ("database", "measurement", "tags", "timestamp", "fields")
+
+    def __init__(self, database: str, measurement: str, tags: Dict[str, str]):
+        self.database = database
+        self.measurement = measurement
+        self.tags = tags
+        self.timestamp = 0
+        self.fields: Fields = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        fields = self.fields
+        if isinstance(fields, bytes):
+            fields = line_protocol.parse_fields(fields)
+        elif isinstance(fields, tuple):
+            fields = dict([fields])
+        return {
+            "database": self.database,
+            "measurement": self.measurement,
+            "tags": self.tags,
+            "time": self.timestamp / line_protocol.PRECISION_MULTIPLIERS[None],
+            "fields": fields,
+        }
+
+
+class LastValueStore:
+    """
+    In-memory store of the last point of every series that the server writes, so
+    that the current value of a device is served without querying InfluxDB.
+
+    The series are indexed by the values of the `index_tags`, e.g. the ``id``,
+    ``row``, ``column`` and ``type`` of the smart plugs, and queried through the
+    ``/last_values`` route of the HTTP server, e.g.
+    ``/last_values?measurement=power&row=1``.
+
+    When several servers share the ingest, a series can be written by any of them,
+    so every server's store is queried through the `peers`, the HTTP servers of
+    the others, and the newest point of every series is served.
+
+    :ivar measurements: measurements whose last values are stored; every one if
+        empty.
+    :ivar index_tags: tags by which the series can be queried.
+    :ivar max_series: series kept in the store; it is reset when it is full.
+    :ivar peers: base URLs of the HTTP servers of the other servers.
+    """
+
+    measurements: Collection[str]
+    index_tags: Collection[str]
+    max_series: int
+    peers: List[str]
+
+    def __init__(
+        self,
+        measurements: Collection[str] = tuple(config.LAST_VALUES_MEASUREMENTS),
+        index_tags: Collection[str] = tuple(config.LAST_VALUES_INDEX_TAGS),
+        max_series: int = config.LAST_VALUES_MAX_SERIES,
+        peers: Collection[str] = (),
+    ):
+        """
+        LastValueStore initializer.
+
+        :param measurements: measurements whose last values are stored; every one
+            if empty.
+        :param index_tags: tags by which the series can be queried.
+        :param max_series: series kept in the store.
+        :param peers: base URLs of the HTTP servers of the other servers, e.g.
+            ``http://127.0.0.1:6667``.
+        """
+        self.measurements = frozenset(measurements)
+        self.index_tags = tuple(index_tags)
+        self.max_series = max_series
+        self.peers = list(peers)
+        self._values: Dict[SeriesId, _LastValue] = {}
+        self._ignored: Set[SeriesId] = set()
+        self._indexes: Dict[str, Dict[str, Set[SeriesId]]] = {
+            tag: {} for tag in self.index_tags
+        }
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def update(self, database: str, points: Points, time_precision: Optional[str]):
+        """
+        Stores the points that are newer than the last ones of their series.
+
+        :param database: InfluxDB database to which the points are written.
+        :param points: point batch, data points or line protocol lines.
+        :param time_precision: the precision of the timestamps of the lines.
+        :return:
+        """
+        if isinstance(points, PointBatch):
+            field = points.field
+            batch = points.with_time_precision(None)
+            for series, timestamp, value in zip(
+                batch.series, batch.timestamps, batch.values
+            ):
+                self._update(
+                    (database, series.series_key), timestamp, (field, value), series
+                )
+            return
+        nanoseconds = line_protocol.PRECISION_MULTIPLIERS[None]
+        for point in points:
+            fields: Fields
+            if isinstance(point, bytes):
+                encoded_key, fields, line_timestamp = line_protocol.split_line(point)
+                if line_timestamp is None:
+                    timestamp = time.time_ns()
+                else:
+                    timestamp = line_protocol.to_nanoseconds(
+                        int(line_timestamp), time_precision
+                    )
+                self._update((database, encoded_key.decode()), timestamp, fields)
+                continue
+            point_time = point.get("time")
+            timestamp = (
+                point_time
+                if isinstance(point_time, int)
+                else int(line_protocol.to_seconds(point_time) * nanoseconds)
+            )
+            series_key = line_protocol.encode_series_key(
+                point["measurement"], point.get("tags", {}).items()
+            )
+            self._update((database, series_key), timestamp, point["fields"])
+
+    def _update(
+        self,
+        series_id: SeriesId,
+        timestamp: int,
+        fields: Fields,
+        series: Optional[SeriesDescriptor] = None,
+    ):
+        """
+        Stores a point if it is newer than the last one of its series.
+
+        :param series_id: database and series key of the point.
+        :param timestamp: epoch timestamp of the point, in nanoseconds.
+        :param fields: fields of the point.
+        :param series: descriptor of the series, if the point is from a batch.
+        :return:
+        """
+        value = self._values.get(series_id)
+        if value is None:
+            if series_id in self._ignored:
+                return
+            value = self._add(series_id, series)
+            if value is None:
+                return
+        elif timestamp < value.timestamp:
+            return
+        value.timestamp = timestamp
+        value.fields = fields
+
+    def query(
+        self,
+        database: Optional[str] = None,
+        measurement: Optional[str] = None,
+        tags: Optional[Mapping[str, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+
+        :param database: database of the series; any if None.
+        :param measurement: measurement of the series; any if None.
+        :param tags: values of index tags that the series have.
+        :return: the last point of every matching series, with its database,
+            measurement, tags, epoch time in seconds and fields.
+        """
+        series_ids: Optional[Set[SeriesId]] = None
+        for tag, tag_value in (tags or {}).items():
+            index = self._indexes.get(tag)
+            if index is None:
+                raise ValueError(f"Tag not indexed: {tag}")
+            matched = index.get(tag_value, set())
+            series_ids = matched if series_ids is None else series_ids & matched
+        values = (
+            self._values.values()
+            if series_ids is None
+            else (self._values[series_id] for series_id in series_ids)
+        )
+        return [
+            value.to_dict()
+            for value in values
+            if (database is None or value.database == database)
+            and (measurement is None or value.measurement == measurement)
+        ]
+
+    async def handle_request(self, request: web.Request) -> web.Response:
+        """
+        Handles the queries of the HTTP API; the ``database`` and ``measurement``
+        query parameters, and those of the index tags, filter the series. The
+        peers are queried too, unless the ``local`` parameter is given.
+
+        :param request: HTTP request.
+        :return: a JSON list of the last points of the matching series; service
+            unavailable if a peer could not be queried.
+        """
+        tags = {
+            key: value
+            for key, value in request.query.items()
+            if key not in QUERY_PARAMETERS
+        }
+        try:
+            values = self.query(
+                request.query.get(DATABASE_PARAMETER),
+                request.query.get(MEASUREMENT_PARAMETER),
+                tags,
+            )
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        if self.peers and LOCAL_PARAMETER not in request.query:
+            values = _get_newest(values, *await self._query_peers(request.query))
+        return web.json_response(values)
+
+    async def _query_peers(self, query: Mapping[str, str]) -> List[List[Any]]:
+        """
+
+        :param query: query parameters of a request.
+        :return: the last points that every peer returns for the query.
+        """
+        params = {**query, LOCAL_PARAMETER: "1"}
+        timeout = aiohttp.ClientTimeout(total=PEER_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            return await asyncio.gather(
+                *(self._query_peer(session, peer, params) for peer in self.peers)
+            )
+
+    async def _query_peer(
+        self, session: aiohttp.ClientSession, peer: str, params: Dict[str, str]
+    ) -> List[Any]:
+        try:
+            async with session.get(peer + LAST_VALUES_PATH, params=params) as response:
+                if response.status == web.HTTPBadRequest.status_code:
+                    raise web.HTTPBadRequest(text=await response.text())
+                response.raise_for_status()
+                return await response.json()
+        except web.HTTPException:
+            raise
+        except Exception as e:
+            raise web.HTTPServiceUnavailable(text=f"Could not query {peer}: {e!r}")
+
+    def clear(self):
+        """
+        Removes every series.
+
+        :return:
+        """
+        self._values.clear()
+        self._ignored.clear()
+        for index in self._indexes.values():
+            index.clear()
+
+    def _add(
+        self, series_id: SeriesId, series: Optional[SeriesDescriptor] = None
+    ) -> Optional[_LastValue]:
+        """
+        Adds a series, and indexes it.
+
+        :param series_id: database and series key.
+        :param series: descriptor of the series; parsed from the key if not given.
+        :return: the last value of the series; None if its measurement is not
+            stored.
+        """
+        if len(self._values) + len(self._ignored) >= self.max_series:
+            self.clear()
+        database, series_key = series_id
+        if series is None:
+            measurement, encoded_tags = line_protocol.split_series_key(
+                series_key.encode()
+            )
+        else:
+            measurement = series.measurement
+        if self.measurements and measurement not in self.measurements:
+            self._ignored.add(series_id)
+            return None
+        tags = (
+            line_protocol.parse_tags(encoded_tags)
+            if series is None
+            else dict(series.tags)
+        )
+        value = self._values[series_id] = _LastValue(database, measurement, tags)
+        for tag, index in self._indexes.items():
+            if tag in tags:
+                index.setdefault(tags[tag], set()).add(series_id)
+        return value
+
+
+def _get_newest(*results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+
+    :param results: last points of the series, as queried from several servers.
+    :return: the newest point of every series.
+    """
+    newest: Dict[Tuple[str, str, Tuple[Tuple[str, str], ...]], Dict[str, Any]] = {}
+    for values in results:
+        for value in values:
+            series = (
+                value["database"],
+                value["measurement"],
+                tuple(sorted(value["tags"].items())),
+            )
+            current = newest.get(series)
+            if current is None or value["time"] > current["time"]:
+                newest[series] = value
+    return list(newest.values())
@@ -1,9 +1,59 @@
 import asyncio
+import signal
+from typing import Callable
+
+from toad_influx_data import runtime
 from toad_influx_data.server import DataServer
+from toad_influx_data.supervisor import Supervisor
+from toad_influx_data.utils import config
+from toad_influx_data.utils import logger
 
 
-if __name__ == "__main__":
-    data_server = DataServer()
+async def shutdown(
+    data_server: DataServer,
+    loop: asyncio.AbstractEventLoop,
+    watchdog: runtime.LoopWatchdog,
+):
+    watchdog.stop()
+    # stopping the server writes the buffered points, or spools them
+    await data_server.stop()
+    loop.stop()
+
+
+def run_server(create_server: Callable[[], DataServer]):
+    """
+    Runs a server until SIGINT or SIGTERM is received.
+
+    The server is created once the event loop policy is installed, because on
+    Python 3.8 its asyncio primitives bind to the current loop when they are
+    created.
+
+    :param create_server: function that creates the server to run.
+    :return:
+    """
+    logger.configure()
+    event_loop = runtime.install_event_loop_policy()
+    runtime.tune_gc()
+    data_server = create_server()
     loop = asyncio.get_event_loop()
+    watchdog = runtime.LoopWatchdog()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(
+            signum,
+            lambda: asyncio.ensure_future(shutdown(data_server, loop, watchdog)),
+        )
+    runtime.ProfileHook().install(loop)
     loop.run_until_complete(data_server.start())
+    if watchdog.threshold > 0:
+        loop.call_soon(watchdog.start)
+    if config.RUNTIME_GC_FREEZE:
+        runtime.freeze_gc()
+    logger.log_info(f"Running on the {event_loop} event loop")
     loop.run_forever()
+
+
+if __name__ == "__main__":
+    if config.INGEST_PROCESSES > 1:
+        Supervisor().run()
+    else:
+        run_server(DataServer)
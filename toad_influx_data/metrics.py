@@ -0,0 +1,427 @@
+import asyncio
+import math
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# default histogram buckets, in seconds
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# batch size histogram buckets, in points
+SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 2500, 5000, 10000, 50000)
+
+
+class Registry:
+    """
+    Collection of metrics, exposed in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+
+    def register(self, metric: "_Metric"):
+        self._metrics.append(metric)
+
+    def expose(self) -> str:
+        """
+
+        :return: every metric in the Prometheus text exposition format.
+        """
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    labels = ",".join(
+        f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + labels + "}"
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """
+    Base class of the metrics; a metric has one child per combination of label
+    values, which is what gets updated.
+
+    :ivar name: metric name.
+    :ivar documentation: help text of the metric.
+    :ivar label_names: names of the labels of the metric.
+    """
+
+    type = ""
+    name: str
+    documentation: str
+    label_names: Tuple[str, ...]
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        """
+        Metric initializer.
+
+        :param name: metric name.
+        :param documentation: help text of the metric.
+        :param label_names: names of the labels of the metric.
+        :param registry: registry to expose the metric in.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._children: Dict[LabelValues, object] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *label_values: str):
+        """
+
+        :param label_values: values of the labels, in the `label_names` order.
+        :return: the child of the label values, to be updated.
+        """
+        child = self._children.get(label_values)
+        if child is None:
+            if len(label_values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}")
+            child = self._children[label_values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def expose(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing value.
+    """
+
+    type = "counter"
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def expose(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, values)} "
+            f"{_format_value(child.value)}"  # type: ignore
+            for values, child in self._children.items()
+        ]
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """
+        Makes the gauge be read from a function when it is exposed.
+
+        :param function: function returning the current value.
+        :return:
+        """
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    """
+    Value that can go up and down, or that is read from a function.
+    """
+
+    type = "gauge"
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self.labels().set_function(function)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def expose(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, values)} "
+            f"{_format_value(child.get())}"  # type: ignore
+            for values, child in self._children.items()
+        ]
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, in cumulative buckets.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        """
+        Histogram initializer.
+
+        :param name: metric name.
+        :param documentation: help text of the metric.
+        :param label_names: names of the labels of the metric.
+        :param buckets: upper bounds of the buckets, in increasing order.
+        :param registry: registry to expose the metric in.
+        """
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, label_names, registry)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def get_totals(self) -> Dict[LabelValues, Tuple[int, float]]:
+        """
+
+        :return: the number and the sum of the observed values, by label values.
+        """
+        return {
+            values: (child.count, child.sum)  # type: ignore
+            for values, child in self._children.items()
+        }
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def expose(self) -> List[str]:
+        lines = []
+        bucket_label_names = self.label_names + ("le",)
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, child.counts):  # type: ignore
+                cumulative += count
+                labels = _format_labels(
+                    bucket_label_names, values + (_format_value(bound),)
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(bucket_label_names, values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {child.count}")  # type: ignore
+            labels = _format_labels(self.label_names, values)
+            total = _format_value(child.sum)  # type: ignore
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {child.count}")  # type: ignore
+        return lines
+
+
+# ingest metrics
+# by handler, since the topics of the devices are unbounded
+MESSAGES_RECEIVED = Counter(
+    "toad_messages_received_total",
+    "MQTT messages received, by the handlers that match their topic.",
+    ["handler"],
+)
+DECODE_SECONDS = Histogram("toad_decode_seconds", "Payload decoding latency.")
+CONVERSION_SECONDS = Histogram(
+    "toad_conversion_seconds", "Conversion latency of a message.", ["handler"]
+)
+POINTS_PRODUCED = Counter(
+    "toad_points_produced_total", "Points produced by the handlers.", ["handler"]
+)
+RECORDS_REJECTED = Counter(
+    "toad_records_rejected_total",
+    "Records that could not be decoded or converted.",
+    ["handler"],
+)
+INGEST_QUEUE_DEPTH = Gauge("toad_ingest_queue_depth", "Messages in the ingest queue.")
+INGEST_DROPPED = Gauge(
+    "toad_ingest_dropped", "Messages dropped by the ingest queue overflow policy."
+)
+INGEST_FAILED = Gauge(
+    "toad_ingest_failed", "Messages whose handling raised an exception."
+)
+EXECUTOR_PENDING = Gauge(
+    "toad_executor_pending",
+    "Messages waiting to be converted in a thread or process pool.",
+)
+GC_PAUSE_SECONDS = Histogram(
+    "toad_gc_pause_seconds", "Garbage collection pauses.", ["generation"]
+)
+EVENT_LOOP_STALLS = Counter(
+    "toad_event_loop_stalls_total",
+    "Times the event loop did not run for longer than the watchdog threshold.",
+)
+PENDING_TASKS = Gauge("toad_pending_tasks", "asyncio tasks not done yet.")
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "toad_event_loop_lag_seconds", "Delay of the event loop in running a callback."
+)
+SERIES_CACHE_HITS = Gauge(
+    "toad_series_cache_hits", "Series descriptor cache hits.", ["cache"]
+)
+SERIES_CACHE_MISSES = Gauge(
+    "toad_series_cache_misses", "Series descriptor cache misses.", ["cache"]
+)
+SERIES_CACHE_EVICTIONS = Gauge(
+    "toad_series_cache_evictions",
+    "Series descriptors evicted from the cache.",
+    ["cache"],
+)
+POINTS_SUPPRESSED = Counter(
+    "toad_points_suppressed_total",
+    "Points dropped because they would not change a series.",
+    ["reason"],
+)
+SERIES_CARDINALITY = Gauge(
+    "toad_series_cardinality",
+    "Estimated distinct series of a measurement.",
+    ["database", "measurement"],
+)
+SERIES_LIMITED_POINTS = Counter(
+    "toad_series_limited_points_total",
+    "Points of new series over the cardinality limit of their measurement.",
+    ["action"],
+)
+ROLLUP_OPEN_BUCKETS = Gauge(
+    "toad_rollup_open_buckets", "Rollup buckets of a series not written yet."
+)
+ROLLUP_LATE_POINTS = Counter(
+    "toad_rollup_late_points_total",
+    "Points not rolled up because their bucket was closed.",
+    ["interval"],
+)
+
+# write path metrics
+WRITER_PENDING_POINTS = Gauge(
+    "toad_writer_pending_points", "Points buffered by the writer."
+)
+WRITE_BATCH_POINTS = Histogram(
+    "toad_write_batch_points",
+    "Points per InfluxDB write request.",
+    buckets=SIZE_BUCKETS,
+)
+WRITE_SECONDS = Histogram(
+    "toad_write_seconds", "InfluxDB write request latency.", ["database"]
+)
+WRITE_ERRORS = Counter(
+    "toad_write_errors_total", "InfluxDB write requests that failed.", ["database"]
+)
+WRITE_RETRIES = Counter("toad_write_retries_total", "InfluxDB write request retries.")
+WRITE_DROPPED_POINTS = Counter(
+    "toad_write_dropped_points_total",
+    "Points dropped because their write failed and was not spooled.",
+    ["database"],
+)
+ARCHIVE_PENDING_ROWS = Gauge(
+    "toad_archive_pending_rows", "Rows buffered by the Parquet archive."
+)
+ARCHIVE_ROWS_WRITTEN = Counter(
+    "toad_archive_rows_written_total", "Rows written to the Parquet archive."
+)
+SINK_ERRORS = Counter(
+    "toad_sink_errors_total", "Failed writes of points to the sinks.", ["sink"]
+)
+LAST_VALUES_SERIES = Gauge(
+    "toad_last_values_series", "Series whose last point is stored."
+)
+LOG_RECORDS_DROPPED = Gauge(
+    "toad_log_records_dropped", "Log records dropped because the log queue was full."
+)
+LOG_MESSAGES_SUPPRESSED = Gauge(
+    "toad_log_messages_suppressed",
+    "Verbose log messages that were not logged by sampling.",
+)
+INFLUXDB_CIRCUIT_OPEN = Gauge(
+    "toad_influxdb_circuit_open",
+    "1 if the circuit of a transport is open or half open, else 0.",
+    ["transport"],
+)
+
+
+async def monitor_event_loop_lag(interval: float = 1.0):
+    """
+    Measures how late the event loop wakes up a task that sleeps `interval` seconds,
+    until it is cancelled.
+
+    :param interval: seconds between measures.
+    :return:
+    """
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(time.perf_counter() - start - interval, 0))
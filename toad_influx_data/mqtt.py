@@ -1,9 +1,11 @@
 from gmqtt.mqtt.constants import MQTTv311
 import asyncio
+import functools
 from typing import Dict, List, Any, Callable, Coroutine, Optional
 
 from gmqtt import Client as MQTTClient
 
+from toad_influx_data.ingest import IngestQueue
 from toad_influx_data.utils import logger
 
 MQTTTopic = str
@@ -14,15 +16,23 @@ MessageHandler = Callable[
 ]
 
 
+def _log_task_error(topic: MQTTTopic, task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.log_error(f"Error handling message from {topic}: {task.exception()!r}")
+
+
 class MQTT(MQTTClient):
     """
     MQTT client class, which sends and receives MQTT messages.
 
     :ivar message_handler: async function that handles MQTT messages
+    :ivar ingest_queue: optional ~`toad_influx_data.ingest.IngestQueue` that queues
+        the messages, instead of handling each one in a new task.
     :ivar running: boolean that represents if the server is running.
     """
 
     message_handler: MessageHandler
+    ingest_queue: Optional[IngestQueue]
     running: bool
     topics: List[MQTTTopic]
 
@@ -34,6 +44,7 @@ class MQTT(MQTTClient):
         """
         MQTTClient.__init__(self, client_id)
         self.message_handler = ...
+        self.ingest_queue = None
         self.running = False
         self.topics = []
         self._STARTED = asyncio.Event()
@@ -47,8 +58,14 @@ class MQTT(MQTTClient):
             self.subscribe(topic)
 
     def on_message(self, client, topic, payload, qos, properties):
-        asyncio.create_task(self.message_handler(topic, payload, properties))
-        logger.log_info_verbose("RECV MSG:" + payload.decode())
+        if self.ingest_queue is not None:
+            self.ingest_queue.put_nowait(topic, payload, properties)
+        else:
+            task = asyncio.create_task(self.message_handler(topic, payload, properties))
+            task.add_done_callback(functools.partial(_log_task_error, topic))
+        logger.log_info_sampled(
+            "mqtt.message", "RECV MSG: %s (%d bytes)", topic, len(payload)
+        )
 
     def on_disconnect(self, client, packet, exc=None):
         logger.log_info_verbose("DISCONNECTED")
@@ -62,6 +79,8 @@ class MQTT(MQTTClient):
         message_handler: MessageHandler,
         topics: List[MQTTTopic],
         token: str = None,
+        ingest_queue: IngestQueue = None,
+        broker_port: int = 1883,
     ):
         """
         Runs the MQTT client.
@@ -70,12 +89,15 @@ class MQTT(MQTTClient):
         :param message_handler: async function for handling incoming messages.
         :param topics: topics to which MQTT client will subscribe.
         :param token: optional token credential for MQTT security.
+        :param ingest_queue: optional queue that incoming messages are put in.
+        :param broker_port: MQTT broker port.
         :return:
         """
         if self.running:
             raise RuntimeError("MQTT already running")
         self.message_handler = message_handler  # type: ignore
-        asyncio.create_task(self._run_loop(broker_host, token, topics))
+        self.ingest_queue = ingest_queue
+        asyncio.create_task(self._run_loop(broker_host, token, topics, broker_port))
         self.running = True
         await self._STARTED.wait()
         logger.log_info_verbose(
@@ -94,8 +116,43 @@ class MQTT(MQTTClient):
             self._STOP = asyncio.Event()
             self.running = False
 
+    def pause_reading(self):
+        """
+        Stops reading messages from the broker, which applies backpressure through
+        the TCP connection.
+
+        :return:
+        """
+        transport = self._get_transport()
+        if transport is not None:
+            transport.pause_reading()
+            logger.log_info_verbose("PAUSED READING")
+
+    def resume_reading(self):
+        """
+        Resumes reading messages from the broker.
+
+        :return:
+        """
+        transport = self._get_transport()
+        if transport is not None and not transport.is_closing():
+            transport.resume_reading()
+            logger.log_info_verbose("RESUMED READING")
+
+    def _get_transport(self) -> Optional[asyncio.Transport]:
+        """
+
+        :return: the transport of the broker connection, if connected.
+        """
+        connection = getattr(self, "_connection", None)
+        return getattr(connection, "_transport", None)
+
     async def _run_loop(
-        self, broker_host: str, token: Optional[str], topics: List[MQTTTopic]
+        self,
+        broker_host: str,
+        token: Optional[str],
+        topics: List[MQTTTopic],
+        broker_port: int = 1883,
     ):
         """
         Method that starts the MQTT client and waits for it to stop.
@@ -103,13 +160,14 @@ class MQTT(MQTTClient):
         :param broker_host: MQTT broker IP.
         :param token: optional token credential for MQTT security
         :param topics: topics to which MQTT client will subscribe.
+        :param broker_port: MQTT broker port.
         :return:
         """
         if token:
             self.set_auth_credentials(token, None)
         self.topics = topics
         # connect will trigger on_connect() which will subscribe to topics
-        await self.connect(broker_host, version=MQTTv311)
+        await self.connect(broker_host, broker_port, version=MQTTv311)
         self._STARTED.set()
         await self._STOP.wait()
         await self.disconnect()
@@ -0,0 +1,577 @@
+import asyncio
+import datetime
+import os
+import time
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Set, Tuple
+from urllib.parse import quote, unquote
+
+from toad_influx_data import metrics
+from toad_influx_data.handlers.handler_abc import PointBatch
+from toad_influx_data.utils import config
+from toad_influx_data.utils import line_protocol
+from toad_influx_data.utils import logger
+from toad_influx_data.writer import ISink, Points
+
+# column of the timestamps of the points
+TIME_COLUMN = "time"
+# schema metadata key of the comma-separated tag columns
+TAGS_METADATA = b"tags"
+# file of a closed day, with every part file of the day compacted into it
+COMPACTED_FILE = "data.parquet"
+PART_PREFIX = "part-"
+DATE_PREFIX = "date="
+NANOSECONDS_PER_DAY = 86400 * line_protocol.PRECISION_MULTIPLIERS[None]
+
+PartitionKey = Tuple[str, str, int]  # (database, measurement, day number)
+
+
+def get_partition_directory(
+    directory: str, database: str, measurement: str, day: int
+) -> str:
+    """
+
+    :param directory: root directory of the archive.
+    :param database: InfluxDB database of the points.
+    :param measurement: measurement of the points.
+    :param day: days since the epoch of the points, in UTC.
+    :return: the directory of the files of the partition, e.g.
+        ``<directory>/db/power/date=2020-03-12``.
+    """
+    date = datetime.date(1970, 1, 1) + datetime.timedelta(days=day)
+    return os.path.join(
+        directory,
+        quote(database, safe=""),
+        quote(measurement, safe=""),
+        f"{DATE_PREFIX}{date.isoformat()}",
+    )
+
+
+def _concat_tables(tables: List[Any]) -> Any:
+    """
+
+    :param tables: arrow tables.
+    :return: the rows of the tables, with the union of their columns.
+    """
+    import pyarrow as pa
+
+    try:
+        return pa.concat_tables(tables, promote_options="default")
+    except TypeError:
+        # pyarrow < 14
+        return pa.concat_tables(tables, promote=True)
+
+
+class _Partition:
+    """
+    Rows of a measurement of a database in a day, buffered as columns until they
+    are written as a row group.
+
+    :ivar times: timestamps of the rows, in nanoseconds.
+    :ivar columns: values of the tags and fields of the rows, by key; None where a
+        row does not have the key.
+    :ivar tag_keys: keys of the columns that are tags.
+    :ivar rows: number of buffered rows.
+    """
+
+    __slots__ = ("times", "columns", "tag_keys", "rows")
+
+    def __init__(self):
+        self.times: List[int] = []
+        self.columns: Dict[str, List[Any]] = {}
+        self.tag_keys: Set[str] = set()
+        self.rows = 0
+
+    def append(self, timestamp: int, tags: Mapping[str, str], fields: Dict[str, Any]):
+        """
+
+        :param timestamp: timestamp of the row, in nanoseconds.
+        :param tags: tags of the row.
+        :param fields: fields of the row.
+        :return:
+        """
+        self.tag_keys.update(tags)
+        for values in (tags, fields):
+            for key, value in values.items():
+                column = self.columns.get(key)
+                if column is None:
+                    column = self.columns[key] = [None] * self.rows
+                column.append(value)
+        self.rows += 1
+        self.times.append(timestamp)
+        for column in self.columns.values():
+            if len(column) < self.rows:
+                column.append(None)
+
+    def extend(self, partition: "_Partition"):
+        """
+
+        :param partition: rows to append after the ones of this partition.
+        :return:
+        """
+        self.tag_keys.update(partition.tag_keys)
+        for key, values in partition.columns.items():
+            column = self.columns.get(key)
+            if column is None:
+                column = self.columns[key] = [None] * self.rows
+            column.extend(values)
+        self.rows += partition.rows
+        self.times.extend(partition.times)
+        for column in self.columns.values():
+            column.extend([None] * (self.rows - len(column)))
+
+
+class ParquetSink(ISink):
+    """
+    Archive of the points in local Parquet files, so that bulk analytics scan
+    files instead of querying InfluxDB.
+
+    The points are partitioned by database, measurement and UTC day, in
+    ``<directory>/<database>/<measurement>/date=<YYYY-MM-DD>/`` directories. The
+    schema of a partition is derived from its points: a ``time`` column of UTC
+    nanosecond timestamps, a string column per tag, and a column per field with
+    the type of its values, or string if they have different types.
+
+    The rows of a partition are buffered, and written as a row group of the
+    partition's open part file by the flush task, as soon as they reach
+    `row_group_size`, or when the periodic flush runs every `flush_interval`
+    seconds; the writes never wait for the files. A row group with new columns, or
+    other types, starts a new part file, and the rows of a row group that fails to
+    be written are buffered again. When a day closes, `close_after` seconds after
+    it ends, the part files of its partitions are compacted into a single
+    ``data.parquet`` file sorted by time; late points of a closed day are written
+    to a new part file and compacted into it again. The part files that were not
+    compacted before a restart are found when the sink starts.
+
+    The files are written with pyarrow, which is imported when the sink starts.
+
+    :ivar directory: root directory of the archive.
+    :ivar row_group_size: buffered rows of a partition that trigger a write.
+    :ivar flush_interval: seconds between periodic flushes of every partition.
+    :ivar close_after: seconds after the end of a day that it is compacted.
+    :ivar compression: Parquet compression codec.
+    :ivar running: boolean that represents if the sink is running.
+    """
+
+    directory: str
+    row_group_size: int
+    flush_interval: float
+    close_after: float
+    compression: str
+    running: bool
+
+    def __init__(
+        self,
+        directory: str = config.PARQUET_DIRECTORY,
+        row_group_size: int = config.PARQUET_ROW_GROUP_SIZE,
+        flush_interval: float = config.PARQUET_FLUSH_INTERVAL,
+        close_after: float = config.PARQUET_CLOSE_AFTER,
+        compression: str = config.PARQUET_COMPRESSION,
+    ):
+        """
+        ParquetSink initializer.
+
+        :param directory: root directory of the archive.
+        :param row_group_size: buffered rows of a partition that trigger a write.
+        :param flush_interval: seconds between periodic flushes of every partition.
+        :param close_after: seconds after the end of a day that it is compacted.
+        :param compression: Parquet compression codec.
+        """
+        self.directory = directory
+        self.row_group_size = row_group_size
+        self.flush_interval = flush_interval
+        self.close_after = close_after
+        self.compression = compression
+        self.running = False
+        self._partitions: Dict[PartitionKey, _Partition] = {}
+        # open part file writers, only used by the write thread
+        self._writers: Dict[PartitionKey, Any] = {}
+        # partitions written since they were last compacted
+        self._unclosed: Set[PartitionKey] = set()
+        # partitions that reached the row group size
+        self._full: Set[PartitionKey] = set()
+        # the files of a partition are written and compacted one at a time
+        self._locks: Dict[PartitionKey, asyncio.Lock] = {}
+        self._WAKE: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def pending(self) -> int:
+        """
+
+        :return: number of buffered rows waiting to be written.
+        """
+        return sum(partition.rows for partition in self._partitions.values())
+
+    async def start(self):
+        """
+        Starts the flush task, and finds the partitions with part files.
+
+        :return:
+        """
+        if self.running:
+            raise RuntimeError("Parquet sink already running")
+        # fails at start if pyarrow is not installed
+        import pyarrow.parquet  # noqa: F401
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._unclosed.update(await self._run(self._find_unclosed))
+        self._WAKE = asyncio.Event()
+        self.running = True
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """
+        Stops the periodic flush, writes every buffered row and closes the files.
+
+        :return:
+        """
+        if not self.running:
+            return
+        self.running = False
+        self._WAKE.set()
+        # the flush loop writes every buffered row before returning
+        await self._flush_task
+        await self._run(self._close_writers)
+
+    async def write(
+        self, database: str, points: Points, time_precision: Optional[str] = None
+    ):
+        """
+        Buffers points, and wakes the flush task if a partition reached the row
+        group size.
+
+        :param database: InfluxDB database of the points.
+        :param points: point batch, data points or line protocol lines.
+        :param time_precision: the precision of the timestamps of the lines; a
+            point batch has its own.
+        :return:
+        """
+        full = False
+        for measurement, tags, fields, timestamp in self._parse(points, time_precision):
+            key = (database, measurement, timestamp // NANOSECONDS_PER_DAY)
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._partitions[key] = _Partition()
+            partition.append(timestamp, tags, fields)
+            if partition.rows == self.row_group_size:
+                self._full.add(key)
+                full = True
+        if full and self._WAKE is not None:
+            self._WAKE.set()
+
+    async def flush(self):
+        """
+        Writes every buffered row, and compacts the days that closed; a partition
+        that fails is retried on the next flush, after the others are flushed.
+
+        :return:
+        """
+        error: Optional[Exception] = None
+        for key in list(self._partitions):
+            try:
+                await self._flush_partition(key)
+            except Exception as e:
+                error = e
+        now = time.time_ns()
+        closed = [
+            key
+            for key in self._unclosed
+            if (key[2] + 1) * NANOSECONDS_PER_DAY + self.close_after * 10 ** 9 <= now
+        ]
+        for key in closed:
+            self._unclosed.discard(key)
+            try:
+                async with self._get_lock(key):
+                    await self._run(self._compact, key)
+            except Exception as e:
+                self._unclosed.add(key)
+                error = e
+        if error is not None:
+            raise error
+
+    async def _flush_loop(self):
+        """
+        Writes the partitions that reached the row group size when it is woken,
+        flushes every partition each `flush_interval` seconds, and once more when
+        the sink is stopped.
+
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._WAKE.wait(), max(deadline - loop.time(), 0)
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._WAKE.clear()
+            stopped = not self.running
+            try:
+                if stopped or loop.time() >= deadline:
+                    deadline = loop.time() + self.flush_interval
+                    await self.flush()
+                else:
+                    while self._full:
+                        await self._flush_partition(self._full.pop())
+            except Exception as e:
+                metrics.SINK_ERRORS.labels(self.__class__.__name__).inc()
+                logger.log_error(f"Error writing the Parquet archive: {e!r}")
+            if stopped:
+                return
+
+    def _get_lock(self, key: PartitionKey) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    async def _flush_partition(self, key: PartitionKey):
+        """
+        Writes the buffered rows of a partition as a row group; they are buffered
+        again if the write fails.
+
+        :param key: database, measurement and day of the partition.
+        :return:
+        """
+        self._full.discard(key)
+        partition = self._partitions.pop(key, None)
+        if partition is None or not partition.rows:
+            return
+        self._unclosed.add(key)
+        try:
+            async with self._get_lock(key):
+                await self._run(self._write_row_group, key, partition)
+        except Exception:
+            # before the rows that were buffered while it was written
+            buffered = self._partitions.get(key)
+            if buffered is not None:
+                partition.extend(buffered)
+            self._partitions[key] = partition
+            raise
+        metrics.ARCHIVE_ROWS_WRITTEN.inc(partition.rows)
+        logger.log_info_sampled(
+            "parquet.write", "Archived %d rows of %s", partition.rows, key
+        )
+
+    async def _run(self, function, *args):
+        # the files are written in a thread, so that they do not block the loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, function, *args)
+
+    def _parse(
+        self, points: Points, time_precision: Optional[str]
+    ) -> Iterator[Tuple[str, Mapping[str, str], Dict[str, Any], int]]:
+        """
+
+        :param points: point batch, data points or line protocol lines.
+        :param time_precision: the precision of the timestamps of the lines.
+        :return: the measurement, tags, fields and nanosecond timestamp of every
+            point.
+        """
+        if isinstance(points, PointBatch):
+            field = points.field
+            batch = points.with_time_precision(None)
+            for series, timestamp, value in zip(
+                batch.series, batch.timestamps, batch.values
+            ):
+                yield series.measurement, series.tags, {field: value}, int(timestamp)
+            return
+        for point in points:
+            if isinstance(point, bytes):
+                series_key, fields, line_timestamp = line_protocol.split_line(point)
+                measurement, tags = line_protocol.split_series_key(series_key)
+                yield (
+                    measurement,
+                    line_protocol.parse_tags(tags),
+                    line_protocol.parse_fields(fields),
+                    time.time_ns()
+                    if line_timestamp is None
+                    else line_protocol.to_nanoseconds(
+                        int(line_timestamp), time_precision
+                    ),
+                )
+                continue
+            point_time = point.get("time")
+            yield (
+                point["measurement"],
+                {key: str(value) for key, value in point.get("tags", {}).items()},
+                point["fields"],
+                point_time
+                if isinstance(point_time, int)
+                else int(line_protocol.to_seconds(point_time) * 10 ** 9),
+            )
+
+    def _get_directory(self, key: PartitionKey) -> str:
+        database, measurement, day = key
+        return get_partition_directory(self.directory, database, measurement, day)
+
+    def _find_unclosed(self) -> Set[PartitionKey]:
+        """
+
+        :return: the partitions of the archive that have part files.
+        """
+        epoch = datetime.date(1970, 1, 1)
+        unclosed = set()
+        for directory, _, names in os.walk(self.directory):
+            if not any(name.startswith(PART_PREFIX) for name in names):
+                continue
+            relative_path = os.path.relpath(directory, self.directory)
+            parts = relative_path.split(os.sep)
+            if len(parts) != 3 or not parts[2].startswith(DATE_PREFIX):
+                continue
+            database, measurement, date = parts
+            try:
+                day = datetime.date.fromisoformat(date.replace(DATE_PREFIX, "", 1))
+            except ValueError:
+                continue
+            unclosed.add((unquote(database), unquote(measurement), (day - epoch).days))
+        return unclosed
+
+    def _write_row_group(self, key: PartitionKey, partition: _Partition):
+        """
+        Writes the rows of a partition to its open part file, or to a new one if
+        the schema of the rows does not fit in it.
+
+        :param key: database, measurement and day of the partition.
+        :param partition: the rows.
+        :return:
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        arrays = [pa.array(partition.times, pa.timestamp("ns", tz="UTC"))]
+        names = [TIME_COLUMN]
+        for name in sorted(partition.columns):
+            arrays.append(
+                self._to_array(partition.columns[name], name in partition.tag_keys)
+            )
+            names.append(name)
+        tags = ",".join(sorted(partition.tag_keys)).encode()
+        table = pa.Table.from_arrays(arrays, names, metadata={TAGS_METADATA: tags})
+        writer = self._writers.get(key)
+        if writer is not None:
+            conformed = self._conform(table, writer.schema)
+            if conformed is None:
+                writer.close()
+                writer = None
+            else:
+                table = conformed
+        if writer is None:
+            directory = self._get_directory(key)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{PART_PREFIX}{time.time_ns()}.parquet")
+            writer = self._writers[key] = pq.ParquetWriter(
+                path, table.schema, compression=self.compression
+            )
+        try:
+            writer.write_table(table, row_group_size=self.row_group_size)
+        except Exception:
+            # the rows are written again to a new part file
+            self._writers.pop(key, None)
+            try:
+                writer.close()
+            except Exception:
+                pass
+            raise
+
+    def _to_array(self, values: List[Any], tag: bool) -> Any:
+        """
+
+        :param values: values of a column.
+        :param tag: if the column is a tag.
+        :return: the column as an arrow array; string if it is a tag, or if its
+            values have different types.
+        """
+        import pyarrow as pa
+
+        if not tag:
+            try:
+                return pa.array(values)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                pass
+        return pa.array(
+            [None if value is None else str(value) for value in values], pa.string()
+        )
+
+    def _conform(self, table: Any, schema: Any) -> Optional[Any]:
+        """
+
+        :param table: row group of a partition.
+        :param schema: schema of the open part file of the partition.
+        :return: the table with the columns of the schema, which are null if the
+            table does not have them; None if it has other columns, or other types.
+        """
+        import pyarrow as pa
+
+        if not set(table.column_names) <= set(schema.names):
+            return None
+        columns = []
+        for field in schema:
+            if field.name not in table.column_names:
+                columns.append(pa.nulls(len(table), field.type))
+                continue
+            column = table.column(field.name)
+            if column.type == pa.null():
+                column = column.cast(field.type)
+            elif column.type != field.type:
+                return None
+            columns.append(column)
+        return pa.Table.from_arrays(columns, schema=schema)
+
+    def _close_writers(self, keys: Optional[List[PartitionKey]] = None):
+        """
+        Closes the open part files.
+
+        :param keys: partitions whose files are closed; every one if None.
+        :return:
+        """
+        for key in list(self._writers) if keys is None else keys:
+            writer = self._writers.pop(key, None)
+            if writer is not None:
+                writer.close()
+
+    def _compact(self, key: PartitionKey):
+        """
+        Compacts the files of a partition into a single file sorted by time.
+
+        :param key: database, measurement and day of the partition.
+        :return:
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._close_writers([key])
+        directory = self._get_directory(key)
+        names = sorted(
+            name for name in os.listdir(directory) if name.endswith(".parquet")
+        )
+        if names == [COMPACTED_FILE]:
+            return
+        tables = [pq.read_table(os.path.join(directory, name)) for name in names]
+        tags = set()
+        for table in tables:
+            metadata = table.schema.metadata or {}
+            tags.update(metadata.get(TAGS_METADATA, b"").split(b","))
+        try:
+            table = _concat_tables(tables).sort_by(TIME_COLUMN)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            logger.log_error(f"Could not compact {directory}: {e!r}")
+            return
+        table = table.replace_schema_metadata(
+            {TAGS_METADATA: b",".join(sorted(tag for tag in tags if tag))}
+        )
+        # the compacted file replaces the previous one before the parts are removed,
+        # so that an interruption can duplicate rows but never lose them
+        temporary_path = os.path.join(directory, COMPACTED_FILE + ".tmp")
+        pq.write_table(
+            table,
+            temporary_path,
+            row_group_size=self.row_group_size,
+            compression=self.compression,
+        )
+        os.replace(temporary_path, os.path.join(directory, COMPACTED_FILE))
+        for name in names:
+            if name.startswith(PART_PREFIX):
+                os.remove(os.path.join(directory, name))
+        logger.log_info(f"Compacted {len(names)} files into {directory}")
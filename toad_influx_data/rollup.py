@@ -0,0 +1,335 @@
+import asyncio
+import time
+from typing import Any, Collection, Dict, Iterator, List, Optional, Tuple
+
+from toad_influx_data import metrics
+from toad_influx_data.handlers.handler_abc import PointBatch
+from toad_influx_data.utils import config
+from toad_influx_data.utils import line_protocol
+from toad_influx_data.utils import logger
+from toad_influx_data.writer import InfluxWriter, Points
+
+# seconds of every interval unit
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+# seconds between the checks for buckets to close
+CLOSE_INTERVAL = 1.0
+# maximum number of series whose measurement and tag set are memoized
+SERIES_CACHE_SIZE = 4096
+
+BucketKey = Tuple[str, str, int]  # (database, interval, bucket start)
+Series = Tuple[str, bytes]  # (measurement, encoded tag set)
+
+
+def parse_interval(interval: str) -> int:
+    """
+
+    :param interval: number of ~`INTERVAL_UNITS`, e.g. ``1m`` or ``12h``.
+    :return: the interval in seconds.
+    """
+    interval = interval.strip()
+    unit = INTERVAL_UNITS.get(interval[-1:])
+    if unit is None or not interval[:-1].isdigit() or int(interval[:-1]) <= 0:
+        raise ValueError(f"Invalid rollup interval: {interval}")
+    return int(interval[:-1]) * unit
+
+
+class _Aggregate:
+    """
+    Streaming aggregate of the values of a field in a bucket.
+    """
+
+    __slots__ = ("min", "max", "sum", "count", "last", "last_time")
+
+    def __init__(self, value: float, timestamp: float):
+        self.min = self.max = self.sum = self.last = value
+        self.count = 1
+        self.last_time = timestamp
+
+    def add(self, value: float, timestamp: float):
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.sum += value
+        self.count += 1
+        if timestamp >= self.last_time:
+            self.last = value
+            self.last_time = timestamp
+
+    def fields(self, field: str) -> Dict[str, Any]:
+        return {
+            f"min_{field}": float(self.min),
+            f"max_{field}": float(self.max),
+            f"mean_{field}": self.sum / self.count,
+            f"count_{field}": self.count,
+            f"last_{field}": float(self.last),
+        }
+
+
+class Rollup:
+    """
+    Downsampling stage, which aggregates the numeric fields of the points of the
+    `measurements` into the min, max, mean, count and last value per series and
+    interval, and writes every bucket once it closes.
+
+    The rollup of a measurement is written to the ``<measurement>_<interval>``
+    measurement of the same database, with the same tags and with the bucket start
+    as timestamp; e.g. the ``mean_value`` field of ``power_1m``.
+
+    A bucket closes `grace` seconds after its interval ends, so that late points
+    are still aggregated; points of already closed buckets are dropped. An open
+    bucket only has a partial aggregate, which would overwrite the complete one of
+    the same series and timestamp, so the open buckets are discarded when the
+    stage is stopped. For the same reason, all the points of a series have to be
+    rolled up by the same server; with several server processes, it needs the
+    ``hash`` sharding (see ~`toad_influx_data.sharding.Shard`).
+
+    :ivar writer: ~`toad_influx_data.writer.InfluxWriter` of the rollups.
+    :ivar intervals: rollup intervals, as configured, and their seconds.
+    :ivar measurements: measurements that are rolled up.
+    :ivar grace: seconds after the end of a bucket in which it accepts points.
+    :ivar late: number of points dropped because their buckets were closed.
+    :ivar running: boolean that represents if the stage is running.
+    """
+
+    writer: InfluxWriter
+    intervals: Dict[str, int]
+    measurements: Collection[str]
+    grace: float
+    late: int
+    running: bool
+
+    def __init__(
+        self,
+        writer: InfluxWriter,
+        intervals: Collection[str] = tuple(config.ROLLUP_INTERVALS),
+        measurements: Collection[str] = tuple(config.ROLLUP_MEASUREMENTS),
+        grace: float = config.ROLLUP_GRACE,
+    ):
+        """
+        Rollup initializer.
+
+        :param writer: InfluxDB writer of the rollups.
+        :param intervals: rollup intervals, e.g. ``1m`` and ``1h``.
+        :param measurements: measurements that are rolled up.
+        :param grace: seconds after the end of a bucket in which it accepts points.
+        """
+        self.writer = writer
+        self.intervals = {interval: parse_interval(interval) for interval in intervals}
+        self.measurements = frozenset(measurements)
+        self.grace = grace
+        self.late = 0
+        self.running = False
+        self._buckets: Dict[BucketKey, Dict[Series, Dict[str, _Aggregate]]] = {}
+        self._series: Dict[bytes, Series] = {}
+        self._close_task: Optional[asyncio.Task] = None
+
+    @property
+    def open_buckets(self) -> int:
+        """
+
+        :return: number of series buckets that were not written yet.
+        """
+        return sum(len(series) for series in self._buckets.values())
+
+    async def start(self):
+        """
+        Starts closing the buckets.
+
+        :return:
+        """
+        if self.running:
+            raise RuntimeError("Rollup already running")
+        self._close_task = asyncio.create_task(self._close_loop())
+        self.running = True
+
+    async def stop(self):
+        """
+        Stops closing the buckets, writes the ones that closed, and discards the
+        open ones.
+
+        :return:
+        """
+        if not self.running:
+            return
+        self.running = False
+        self._close_task.cancel()
+        await asyncio.gather(self._close_task, return_exceptions=True)
+        await self.close_buckets(time.time())
+        if self._buckets:
+            logger.log_info(f"Discarding {self.open_buckets} open rollup buckets")
+            self._buckets = {}
+
+    def add(self, database: str, points: Points, time_precision: Optional[str]):
+        """
+        Aggregates the points of the rolled up measurements.
+
+        :param database: InfluxDB database to which the points are written.
+        :param points: point batch, data points or line protocol lines.
+        :param time_precision: the precision of the timestamps of the lines.
+        :return:
+        """
+        now = time.time()
+        if isinstance(points, PointBatch):
+            parsed_points = self._parse_batch(points)
+        else:
+            parsed_points = (
+                self._parse_line(point, time_precision)
+                if isinstance(point, bytes)
+                else self._parse_point(point)
+                for point in points
+            )
+        for parsed in parsed_points:
+            if parsed is None:
+                continue
+            series, fields, timestamp = parsed
+            for interval, seconds in self.intervals.items():
+                start = int(timestamp // seconds * seconds)
+                if start + seconds + self.grace <= now:
+                    self.late += 1
+                    metrics.ROLLUP_LATE_POINTS.labels(interval).inc()
+                    continue
+                bucket = self._buckets.setdefault((database, interval, start), {})
+                aggregates = bucket.setdefault(series, {})
+                for field, value in fields.items():
+                    aggregate = aggregates.get(field)
+                    if aggregate is None:
+                        aggregates[field] = _Aggregate(value, timestamp)
+                    else:
+                        aggregate.add(value, timestamp)
+
+    async def close_buckets(self, now: float):
+        """
+        Writes the buckets that closed at a given time, and forgets them.
+
+        :param now: epoch time in seconds.
+        :return:
+        """
+        lines: Dict[str, List[bytes]] = {}
+        for key in list(self._buckets):
+            database, interval, start = key
+            if start + self.intervals[interval] + self.grace > now:
+                continue
+            for (measurement, tags), aggregates in self._buckets.pop(key).items():
+                rollup_key = (
+                    line_protocol.escape_measurement(f"{measurement}_{interval}")
+                    + tags.decode()
+                )
+                fields: Dict[str, Any] = {}
+                for field, aggregate in aggregates.items():
+                    fields.update(aggregate.fields(field))
+                lines.setdefault(database, []).append(
+                    line_protocol.encode_line(
+                        rollup_key, line_protocol.encode_fields(fields), start
+                    )
+                )
+        for database, database_lines in lines.items():
+            logger.log_info_verbose(
+                f"Writing {len(database_lines)} rollups to influx {database}..."
+            )
+            await self.writer.write(database, database_lines, "s")
+
+    async def _close_loop(self):
+        """
+        Writes the closed buckets every ~`CLOSE_INTERVAL` seconds.
+
+        :return:
+        """
+        while True:
+            await asyncio.sleep(CLOSE_INTERVAL)
+            try:
+                await self.close_buckets(time.time())
+            except Exception as e:
+                logger.log_error(f"Error writing rollups: {e}")
+
+    def _parse_batch(
+        self, batch: PointBatch
+    ) -> Iterator[Optional[Tuple[Series, Dict[str, float], float]]]:
+        """
+
+        :param batch: point batch.
+        :return: the series, numeric field and epoch time in seconds of every point
+            of the rolled up measurements.
+        """
+        multiplier = line_protocol.PRECISION_MULTIPLIERS[batch.time_precision]
+        for series, timestamp, value in zip(
+            batch.series, batch.timestamps, batch.values
+        ):
+            if series.measurement not in self.measurements:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            yield (
+                self._get_series(series.series_key.encode()),
+                {batch.field: value},
+                timestamp / multiplier,
+            )
+
+    def _parse_line(
+        self, line: bytes, time_precision: Optional[str]
+    ) -> Optional[Tuple[Series, Dict[str, float], float]]:
+        """
+
+        :param line: line protocol line.
+        :param time_precision: the precision of the timestamp of the line.
+        :return: the series, numeric fields and epoch time in seconds of the line;
+            None if it is not rolled up.
+        """
+        series_key, fields, timestamp = line_protocol.split_line(line)
+        series = self._get_series(series_key)
+        if series[0] not in self.measurements:
+            return None
+        seconds = (
+            int(timestamp) / line_protocol.PRECISION_MULTIPLIERS[time_precision]
+            if timestamp is not None
+            else time.time()
+        )
+        return series, _numeric(line_protocol.parse_fields(fields)), seconds
+
+    def _parse_point(
+        self, point: Dict[str, Any]
+    ) -> Optional[Tuple[Series, Dict[str, float], float]]:
+        """
+
+        :param point: data point.
+        :return: the series, numeric fields and epoch time in seconds of the point;
+            None if it is not rolled up.
+        """
+        if point["measurement"] not in self.measurements:
+            return None
+        series_key = line_protocol.encode_series_key(
+            point["measurement"], point.get("tags", {}).items()
+        )
+        series = self._get_series(series_key.encode())
+        return (
+            series,
+            _numeric(point["fields"]),
+            line_protocol.to_seconds(point.get("time")),
+        )
+
+    def _get_series(self, series_key: bytes) -> Series:
+        """
+
+        :param series_key: encoded series key.
+        :return: the measurement and encoded tag set of the series.
+        """
+        series = self._series.get(series_key)
+        if series is None:
+            if len(self._series) >= SERIES_CACHE_SIZE:
+                self._series.clear()
+            series = line_protocol.split_series_key(series_key)
+            self._series[series_key] = series
+        return series
+
+
+def _numeric(fields: Dict[str, Any]) -> Dict[str, float]:
+    """
+
+    :param fields: field keys and values.
+    :return: the fields with integer or float values.
+    """
+    return {
+        key: value
+        for key, value in fields.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
@@ -0,0 +1,131 @@
+from typing import Dict, Iterable, List
+
+from toad_influx_data.handlers.handler_abc import IHandler
+
+SINGLE_LEVEL_WILDCARD = "+"
+MULTI_LEVEL_WILDCARD = "#"
+TOPIC_SEPARATOR = "/"
+
+# maximum number of topics whose matching handlers are memoized
+MATCH_CACHE_SIZE = 4096
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """
+
+    :param pattern: topic pattern, which can have ``+`` and ``#`` wildcards.
+    :param topic: the topic that the message was received from.
+    :return: if the topic matches the pattern.
+    """
+    topic_levels = topic.split(TOPIC_SEPARATOR)
+    for index, level in enumerate(pattern.split(TOPIC_SEPARATOR)):
+        if level == MULTI_LEVEL_WILDCARD:
+            return True
+        if index >= len(topic_levels):
+            return False
+        if level != SINGLE_LEVEL_WILDCARD and level != topic_levels[index]:
+            return False
+    return len(pattern.split(TOPIC_SEPARATOR)) == len(topic_levels)
+
+
+class _TopicNode:
+    """
+    Node of the topic trie; one per topic level.
+
+    :ivar children: child nodes by topic level, including the wildcards.
+    :ivar handlers: handlers whose topic pattern ends in this node.
+    """
+
+    __slots__ = ("children", "handlers")
+
+    def __init__(self):
+        self.children: Dict[str, _TopicNode] = {}
+        self.handlers: List[IHandler] = []
+
+
+class TopicRouter:
+    """
+    Routes MQTT topics to the handlers that listen to them.
+
+    The handlers' topic patterns (~`IHandler.get_topics`) are stored in a trie over
+    topic levels, with ``+`` and ``#`` wildcard nodes, so that a topic is matched
+    against every pattern in a single lookup, and the matched handlers are then
+    filtered by `IHandler.can_handle`. The matches of the last seen topics are
+    memoized.
+    """
+
+    def __init__(self, handlers: Iterable[IHandler] = ()):
+        """
+        TopicRouter initializer.
+
+        :param handlers: handlers to route to.
+        """
+        self._root = _TopicNode()
+        self._order: Dict[int, int] = {}  # handler id -> registration order
+        self._cache: Dict[str, List[IHandler]] = {}
+        for handler in handlers:
+            self.add_handler(handler)
+
+    def add_handler(self, handler: IHandler):
+        """
+        Adds a handler to the routing trie.
+
+        :param handler: handler to route its topics to.
+        :return:
+        """
+        self._order.setdefault(id(handler), len(self._order))
+        for pattern in handler.get_topics():
+            node = self._root
+            for level in pattern.split(TOPIC_SEPARATOR):
+                node = node.children.setdefault(level, _TopicNode())
+            if handler not in node.handlers:
+                node.handlers.append(handler)
+        self._cache.clear()
+
+    def match(self, topic: str) -> List[IHandler]:
+        """
+
+        :param topic: the topic that the message was received from.
+        :return: handlers listening to the topic that can handle it, in registration
+            order.
+        """
+        handlers = self._cache.get(topic)
+        if handlers is None:
+            handlers = self._match(topic)
+            if len(self._cache) >= MATCH_CACHE_SIZE:
+                self._cache.clear()
+            self._cache[topic] = handlers
+        return handlers
+
+    def _match(self, topic: str) -> List[IHandler]:
+        """
+
+        :param topic: the topic that the message was received from.
+        :return: handlers listening to the topic that can handle it, in registration
+            order.
+        """
+        levels = topic.split(TOPIC_SEPARATOR)
+        matched: Dict[int, IHandler] = {}
+        nodes = [self._root]
+        for level in levels:
+            next_nodes = []
+            for node in nodes:
+                # '#' also matches the parent level, e.g. 'a/#' matches 'a'
+                wildcard = node.children.get(MULTI_LEVEL_WILDCARD)
+                if wildcard is not None:
+                    matched.update((id(h), h) for h in wildcard.handlers)
+                for key in (level, SINGLE_LEVEL_WILDCARD):
+                    child = node.children.get(key)
+                    if child is not None:
+                        next_nodes.append(child)
+            nodes = next_nodes
+            if not nodes:
+                break
+        for node in nodes:
+            matched.update((id(h), h) for h in node.handlers)
+            wildcard = node.children.get(MULTI_LEVEL_WILDCARD)
+            if wildcard is not None:
+                matched.update((id(h), h) for h in wildcard.handlers)
+        # the handlers get the final say on the topics their patterns matched
+        handlers = (h for h in matched.values() if h.can_handle(topic))
+        return sorted(handlers, key=lambda h: self._order[id(h)])
@@ -0,0 +1,419 @@
+import asyncio
+import collections
+import gc
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from typing import Counter, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from toad_influx_data import metrics
+from toad_influx_data.utils import config
+from toad_influx_data.utils import logger
+
+# event loop implementations
+EVENT_LOOP_AUTO = "auto"
+EVENT_LOOP_UVLOOP = "uvloop"
+EVENT_LOOP_ASYNCIO = "asyncio"
+EVENT_LOOPS = (EVENT_LOOP_AUTO, EVENT_LOOP_UVLOOP, EVENT_LOOP_ASYNCIO)
+# functions of the ingest path whose samples are profiled
+PROFILED_FUNCTIONS = ("_mqtt_response_handler", "_write_to_influx")
+# histograms of the ingest stages, dumped with the profile
+STAGE_HISTOGRAMS = {
+    "decode": metrics.DECODE_SECONDS,
+    "conversion": metrics.CONVERSION_SECONDS,
+    "write": metrics.WRITE_SECONDS,
+    "event_loop_lag": metrics.EVENT_LOOP_LAG_SECONDS,
+    "gc_pause": metrics.GC_PAUSE_SECONDS,
+}
+
+
+def install_event_loop_policy(event_loop: str = config.RUNTIME_EVENT_LOOP) -> str:
+    """
+    Installs the event loop policy; it must be called before the loop is created.
+
+    :param event_loop: ~`EVENT_LOOP_UVLOOP`, ~`EVENT_LOOP_ASYNCIO`, or
+        ~`EVENT_LOOP_AUTO` for uvloop if it is installed.
+    :return: the event loop implementation that is used.
+    """
+    if event_loop not in EVENT_LOOPS:
+        raise ValueError(f"Unknown event loop: {event_loop}")
+    if event_loop == EVENT_LOOP_ASYNCIO:
+        return EVENT_LOOP_ASYNCIO
+    try:
+        import uvloop
+    except ImportError:
+        if event_loop == EVENT_LOOP_UVLOOP:
+            raise
+        return EVENT_LOOP_ASYNCIO
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return EVENT_LOOP_UVLOOP
+
+
+def tune_gc(thresholds: Sequence[int] = tuple(config.RUNTIME_GC_THRESHOLDS)):
+    """
+    Sets the garbage collection thresholds, and measures the collection pauses.
+
+    The conversion allocates many short-lived objects, which trigger a young
+    generation collection every 700 allocations with Python's default thresholds;
+    a higher first threshold collects less often, with longer but fewer pauses.
+
+    :param thresholds: thresholds of the generations; Python's if empty.
+    :return:
+    """
+    if thresholds:
+        gc.set_threshold(*thresholds)
+    if _observe_gc_pause not in gc.callbacks:
+        gc.callbacks.append(_observe_gc_pause)
+
+
+_gc_start = 0.0
+
+
+def _observe_gc_pause(phase: str, info: Dict[str, int]):
+    global _gc_start
+    if phase == "start":
+        _gc_start = time.perf_counter()
+    else:
+        metrics.GC_PAUSE_SECONDS.labels(str(info["generation"])).observe(
+            time.perf_counter() - _gc_start
+        )
+
+
+def freeze_gc():
+    """
+    Moves every object allocated until now, like the modules and handlers loaded at
+    start, to the permanent generation, so that the collections do not traverse
+    them again.
+
+    :return:
+    """
+    gc.collect()
+    gc.freeze()
+
+
+class LoopWatchdog:
+    """
+    Watchdog of the event loop: a task in the loop updates a heartbeat every
+    `interval` seconds, and a thread checks it; when the loop does not run the
+    task for longer than `threshold` seconds, e.g. because a callback blocks it,
+    the thread logs the stack of the loop thread, once per stall, which shows the
+    code that stalls it.
+
+    :ivar interval: seconds between heartbeats.
+    :ivar threshold: seconds of delay of a heartbeat after which the loop is
+        stalled.
+    :ivar stalls: number of stalls.
+    :ivar running: boolean that represents if the watchdog is running.
+    """
+
+    interval: float
+    threshold: float
+    stalls: int
+    running: bool
+
+    def __init__(
+        self,
+        interval: float = config.RUNTIME_WATCHDOG_INTERVAL,
+        threshold: float = config.RUNTIME_WATCHDOG_THRESHOLD,
+    ):
+        """
+        LoopWatchdog initializer.
+
+        :param interval: seconds between heartbeats.
+        :param threshold: seconds of delay of a heartbeat after which the loop is
+            stalled.
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = 0
+        self.running = False
+        self._heartbeat = 0.0
+        self._loop_thread_id = 0
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """
+        Starts the watchdog of the running loop.
+
+        :return:
+        """
+        if self.running:
+            raise RuntimeError("Watchdog already running")
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_event_loop().create_task(self._beat())
+        self._thread = threading.Thread(
+            target=self._watch, name="toad_watchdog", daemon=True
+        )
+        self._thread.start()
+        self.running = True
+
+    def stop(self):
+        """
+        Stops the watchdog.
+
+        :return:
+        """
+        if not self.running:
+            return
+        self.running = False
+        self._task.cancel()  # type: ignore
+        self._stop.set()
+        self._thread.join()  # type: ignore
+
+    async def _beat(self):
+        while True:
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        stalled = False
+        while not self._stop.wait(self.interval):
+            delay = time.monotonic() - self._heartbeat - self.interval
+            if delay <= self.threshold:
+                stalled = False
+                continue
+            if stalled:
+                continue
+            stalled = True
+            self.stalls += 1
+            metrics.EVENT_LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            logger.log_error(
+                f"Event loop stalled for over {delay:.3f} seconds in:\n{stack}"
+            )
+
+
+def _get_stack(frame) -> List[str]:
+    """
+
+    :param frame: innermost frame of a thread.
+    :return: the ``<module>:<function>`` of the frames of the thread, from the
+        outermost.
+    """
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+        stack.append(f"{module}:{code.co_name}")
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class SamplingProfiler:
+    """
+    Sampling profiler of the event loop thread: for `duration` seconds, a thread
+    samples the stack of the loop every `interval` seconds, and keeps the samples
+    in the `functions`, e.g. the ingest path of the server. The profile is written
+    as collapsed stacks, which flame graph tools read, to a file of the
+    `directory`, and its hottest functions are logged.
+
+    :ivar functions: names of the functions whose samples are kept.
+    :ivar duration: seconds of a profile.
+    :ivar interval: seconds between samples.
+    :ivar directory: directory of the profiles.
+    :ivar running: boolean that represents if a profile is being taken.
+    """
+
+    functions: Tuple[str, ...]
+    duration: float
+    interval: float
+    directory: str
+    running: bool
+
+    def __init__(
+        self,
+        functions: Iterable[str] = PROFILED_FUNCTIONS,
+        duration: float = config.RUNTIME_PROFILE_SECONDS,
+        interval: float = config.RUNTIME_PROFILE_INTERVAL,
+        directory: str = config.RUNTIME_PROFILE_DIRECTORY,
+    ):
+        """
+        SamplingProfiler initializer.
+
+        :param functions: names of the functions whose samples are kept.
+        :param duration: seconds of a profile.
+        :param interval: seconds between samples.
+        :param directory: directory of the profiles.
+        """
+        self.functions = tuple(functions)
+        self.duration = duration
+        self.interval = interval
+        self.directory = directory
+        self.running = False
+
+    def start(self) -> bool:
+        """
+        Starts a profile of the calling thread, in the background.
+
+        :return: if it started; only one profile is taken at a time.
+        """
+        if self.running:
+            return False
+        self.running = True
+        threading.Thread(
+            target=self._profile,
+            args=(threading.get_ident(),),
+            name="toad_profiler",
+            daemon=True,
+        ).start()
+        return True
+
+    def sample(self, thread_id: int, samples: Counter[Tuple[str, ...]]) -> bool:
+        """
+        Samples the stack of a thread.
+
+        :param thread_id: identifier of the thread.
+        :param samples: counts of the sampled stacks, from the outermost profiled
+            function.
+        :return: if the thread was in a profiled function.
+        """
+        frame = sys._current_frames().get(thread_id)
+        stack = _get_stack(frame)
+        for index, function in enumerate(stack):
+            if function.rpartition(":")[2] in self.functions:
+                samples[tuple(stack[index:])] += 1
+                return True
+        return False
+
+    def _profile(self, thread_id: int):
+        samples: Counter[Tuple[str, ...]] = collections.Counter()
+        total = 0
+        try:
+            end = time.monotonic() + self.duration
+            while time.monotonic() < end:
+                self.sample(thread_id, samples)
+                total += 1
+                time.sleep(self.interval)
+            path = self._write(samples)
+            logger.log_info(self._format(samples, total, path))
+        except Exception as e:
+            logger.log_error(f"Error profiling: {e!r}")
+        finally:
+            self.running = False
+
+    def _write(self, samples: Counter[Tuple[str, ...]]) -> str:
+        """
+
+        :param samples: counts of the sampled stacks.
+        :return: the path of the file of the collapsed stacks.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory, time.strftime("profile-%Y%m%dT%H%M%S.txt", time.gmtime())
+        )
+        with open(path, "w") as file:
+            for stack, count in samples.most_common():
+                file.write(f"{';'.join(stack)} {count}\n")
+        return path
+
+    def _format(self, samples: Counter[Tuple[str, ...]], total: int, path: str) -> str:
+        """
+
+        :param samples: counts of the sampled stacks.
+        :param total: number of samples taken.
+        :param path: the path of the file of the collapsed stacks.
+        :return: summary of the profile: the share of the samples in the profiled
+            functions, and the functions with the most samples on top of the stack.
+        """
+        profiled = sum(samples.values())
+        leaves: Counter[str] = collections.Counter()
+        for stack, count in samples.items():
+            leaves[stack[-1]] += count
+        lines = [
+            f"Profile of {', '.join(self.functions)}: {profiled} of {total} samples "
+            f"({profiled / max(total, 1):.1%}), written to {path}"
+        ]
+        lines.extend(
+            f"  {count / profiled:6.1%} {function}"
+            for function, count in leaves.most_common(10)
+        )
+        return "\n".join(lines)
+
+
+def format_stage_timings(
+    previous: Optional[Dict[Tuple[str, Tuple[str, ...]], Tuple[int, float]]] = None,
+) -> Tuple[str, Dict[Tuple[str, Tuple[str, ...]], Tuple[int, float]]]:
+    """
+
+    :param previous: totals of a previous call, to report only what was observed
+        since then.
+    :return: the count, mean and total seconds of every stage of the ingest, and
+        the totals to pass to the next call.
+    """
+    totals = {
+        (stage, labels): total
+        for stage, histogram in STAGE_HISTOGRAMS.items()
+        for labels, total in histogram.get_totals().items()
+    }
+    lines = ["Stage timings:"]
+    for (stage, labels), (count, seconds) in sorted(totals.items()):
+        previous_count, previous_seconds = (previous or {}).get(
+            (stage, labels), (0, 0.0)
+        )
+        count -= previous_count
+        seconds -= previous_seconds
+        if not count:
+            continue
+        name = stage + (f"[{','.join(labels)}]" if labels else "")
+        mean = seconds / count * 1000
+        lines.append(f"  {name}: {count} in {seconds:.3f} s, mean {mean:.3f} ms")
+    return "\n".join(lines), totals
+
+
+class ProfileHook:
+    """
+    On-demand profiling of a running server: when the `signum` signal is received,
+    it logs the ~`STAGE_HISTOGRAMS` timings since the previous signal, and takes a
+    ~`SamplingProfiler` profile of the ingest path.
+
+    :ivar signum: the signal, e.g. ``SIGUSR1``.
+    :ivar profiler: the sampling profiler.
+    """
+
+    signum: int
+    profiler: SamplingProfiler
+
+    def __init__(
+        self,
+        signum: int = getattr(signal, config.RUNTIME_PROFILE_SIGNAL, 0),
+        profiler: Optional[SamplingProfiler] = None,
+    ):
+        """
+        ProfileHook initializer.
+
+        :param signum: the signal; disabled if 0.
+        :param profiler: the sampling profiler; the default one if not given.
+        """
+        self.signum = signum
+        self.profiler = profiler or SamplingProfiler()
+        self._totals: Optional[Dict] = None
+
+    def install(self, loop: asyncio.AbstractEventLoop):
+        """
+        Handles the signal in the loop.
+
+        :param loop: the event loop of the server.
+        :return:
+        """
+        if self.signum:
+            loop.add_signal_handler(self.signum, self.trigger)
+
+    def trigger(self):
+        """
+        Logs the stage timings and starts a profile.
+
+        :return:
+        """
+        timings, self._totals = format_stage_timings(self._totals)
+        logger.log_info(timings)
+        if self.profiler.start():
+            logger.log_info(f"Profiling for {self.profiler.duration} seconds...")
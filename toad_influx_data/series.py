@@ -0,0 +1,111 @@
+import functools
+from types import MappingProxyType
+from typing import Any, Callable, Mapping, NamedTuple, Optional
+
+from toad_influx_data import metrics
+
+
+class SeriesDescriptor(NamedTuple):
+    """
+    Precomputed, immutable description of an InfluxDB series.
+
+    :ivar measurement: measurement name.
+    :ivar tags: read-only tag keys and values; only those in the series key.
+    :ivar series_key: escaped line protocol series key; the measurement and tag set.
+    """
+
+    measurement: str
+    tags: Mapping[str, Any]
+    series_key: str
+
+    def __reduce__(self):
+        # read-only tags cannot be pickled, e.g. to return batches from a process
+        return _make_series, (self.measurement, dict(self.tags), self.series_key)
+
+
+def _make_series(
+    measurement: str, tags: Mapping[str, Any], series_key: str
+) -> SeriesDescriptor:
+    return SeriesDescriptor(measurement, MappingProxyType(tags), series_key)
+
+
+# builds the descriptor of the series of a (base name, name, unit) SenML record
+SeriesFactory = Callable[[str, str, Optional[str]], SeriesDescriptor]
+
+
+class SeriesCache:
+    """
+    Bounded LRU cache of series descriptors, keyed by the base name, name and unit
+    of the SenML records; a device always maps to the same series, so converting
+    its records does no string work once its series are cached.
+
+    :ivar maxsize: maximum number of cached series.
+    """
+
+    maxsize: int
+
+    def __init__(
+        self, factory: SeriesFactory, maxsize: int, name: Optional[str] = None
+    ):
+        """
+        SeriesCache initializer.
+
+        :param factory: function that builds the descriptor of a series that is not
+            cached; exceptions that it raises are not cached.
+        :param maxsize: maximum number of cached series.
+        :param name: name of the cache in the metrics; not exposed if not given.
+        """
+        self.maxsize = maxsize
+        self._factory = factory
+        # misses whose factory raised, which were not cached
+        self._failures = 0
+        self._get = functools.lru_cache(maxsize)(self._build)
+        if name is not None:
+            metrics.SERIES_CACHE_HITS.labels(name).set_function(lambda: self.hits)
+            metrics.SERIES_CACHE_MISSES.labels(name).set_function(lambda: self.misses)
+            metrics.SERIES_CACHE_EVICTIONS.labels(name).set_function(
+                lambda: self.evictions
+            )
+
+    def get(
+        self, base_name: Optional[str], name: Optional[str], unit: Optional[str]
+    ) -> SeriesDescriptor:
+        """
+
+        :param base_name: SenML base name in effect for the record.
+        :param name: SenML name of the record.
+        :param unit: SenML unit of the record, or the base unit in effect.
+        :return: the descriptor of the series of the record.
+        """
+        return self._get(base_name or "", name or "", unit)
+
+    @property
+    def hits(self) -> int:
+        return self._get.cache_info().hits
+
+    @property
+    def misses(self) -> int:
+        return self._get.cache_info().misses
+
+    @property
+    def evictions(self) -> int:
+        # every miss that did not fail adds a series, and the ones that are not
+        # cached were evicted
+        info = self._get.cache_info()
+        return info.misses - self._failures - info.currsize
+
+    def clear(self):
+        """
+        Removes every cached series and resets the stats.
+
+        :return:
+        """
+        self._get.cache_clear()
+        self._failures = 0
+
+    def _build(self, base_name: str, name: str, unit: Optional[str]):
+        try:
+            return self._factory(base_name, name, unit)
+        except Exception:
+            self._failures += 1
+            raise
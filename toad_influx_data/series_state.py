@@ -0,0 +1,153 @@
+import time
+from typing import Any, Collection, Dict, Iterable, List, Optional, Tuple
+
+from toad_influx_data import metrics
+from toad_influx_data.handlers.handler_abc import PointBatch
+from toad_influx_data.utils import config
+from toad_influx_data.utils import line_protocol
+from toad_influx_data.writer import Points, WritablePoint
+
+
+class _SeriesState:
+    """
+    Last written point of a series.
+
+    :ivar measurement: measurement of the series.
+    :ivar timestamp: timestamp of the point.
+    :ivar fields: field set of the point.
+    :ivar written_at: monotonic time at which the point was written.
+    """
+
+    __slots__ = ("measurement", "timestamp", "fields", "written_at")
+
+    def __init__(self, measurement: str):
+        self.measurement = measurement
+        self.timestamp: Any = None
+        self.fields: Any = None
+        self.written_at = 0.0
+
+
+class SeriesStateTable:
+    """
+    In-memory table of the last point written to every series, which drops the
+    points that would not change what InfluxDB stores:
+
+    - points of the `measurements` whose fields did not change since the last
+      point of their series, unless `heartbeat` seconds passed since it.
+    - points whose series, timestamp and fields were written less than
+      `coalesce_window` seconds ago, like a reading that a device publishes twice.
+
+    A point of the same series and timestamp with other fields is written, so that
+    it overwrites the previous one in InfluxDB; the last write wins.
+
+    :ivar measurements: measurements whose unchanged points are suppressed.
+    :ivar heartbeat: seconds after which an unchanged point is written anyway.
+    :ivar coalesce_window: seconds in which a repeated point is dropped.
+    :ivar max_series: series kept in the table; it is reset when it is full.
+    """
+
+    measurements: Collection[str]
+    heartbeat: float
+    coalesce_window: float
+    max_series: int
+
+    def __init__(
+        self,
+        measurements: Collection[str] = tuple(config.CHANGE_DETECTION_MEASUREMENTS),
+        heartbeat: float = config.CHANGE_DETECTION_HEARTBEAT,
+        coalesce_window: float = config.CHANGE_DETECTION_COALESCE_WINDOW,
+        max_series: int = config.CHANGE_DETECTION_MAX_SERIES,
+    ):
+        """
+        SeriesStateTable initializer.
+
+        :param measurements: measurements whose unchanged points are suppressed.
+        :param heartbeat: seconds after which an unchanged point is written anyway.
+        :param coalesce_window: seconds in which a repeated point is dropped.
+        :param max_series: series kept in the table.
+        """
+        self.measurements = frozenset(measurements)
+        self.heartbeat = heartbeat
+        self.coalesce_window = coalesce_window
+        self.max_series = max_series
+        self._states: Dict[Tuple[str, str], _SeriesState] = {}
+        self._unchanged = metrics.POINTS_SUPPRESSED.labels("unchanged")
+        self._duplicate = metrics.POINTS_SUPPRESSED.labels("duplicate")
+
+    def filter(self, database: str, points: Points) -> Points:
+        """
+        Drops the points that would not change what InfluxDB stores, and records
+        the rest as the last points of their series.
+
+        :param database: InfluxDB database to which the points will be written.
+        :param points: point batch, data points or line protocol lines to write.
+        :return: the points to write, in the same order; a point batch for a batch.
+        """
+        if isinstance(points, PointBatch):
+            field = points.field
+            kept = self._keep(
+                database,
+                (
+                    (series.series_key, (field, value), timestamp, series.measurement)
+                    for series, timestamp, value in zip(
+                        points.series, points.timestamps, points.values
+                    )
+                ),
+            )
+            return points if len(kept) == len(points) else points.take(kept)
+        kept = self._keep(database, (self._split(point) for point in points))
+        return [points[index] for index in kept]
+
+    def _keep(
+        self, database: str, points: Iterable[Tuple[str, Any, Any, Optional[str]]]
+    ) -> List[int]:
+        """
+
+        :param database: InfluxDB database to which the points will be written.
+        :param points: the series key, fields, timestamp and measurement of every
+            point; the measurement is parsed from the series key if None.
+        :return: the indices of the points to write.
+        """
+        now = time.monotonic()
+        kept = []
+        unchanged = duplicate = 0
+        for index, (series_key, fields, timestamp, measurement) in enumerate(points):
+            state = self._states.get((database, series_key))
+            if state is None:
+                if len(self._states) >= self.max_series:
+                    self._states.clear()
+                if measurement is None:
+                    measurement = line_protocol.get_measurement(series_key.encode())
+                state = self._states[(database, series_key)] = _SeriesState(measurement)
+            elif fields == state.fields:
+                elapsed = now - state.written_at
+                if timestamp == state.timestamp and elapsed < self.coalesce_window:
+                    duplicate += 1
+                    continue
+                if state.measurement in self.measurements and elapsed < self.heartbeat:
+                    unchanged += 1
+                    continue
+            state.timestamp = timestamp
+            state.fields = fields
+            state.written_at = now
+            kept.append(index)
+        if unchanged:
+            self._unchanged.inc(unchanged)
+        if duplicate:
+            self._duplicate.inc(duplicate)
+        return kept
+
+    def _split(self, point: WritablePoint) -> Tuple[str, Any, Any, Optional[str]]:
+        """
+
+        :param point: data point or line protocol line.
+        :return: the series key, fields and timestamp of the point, and its
+            measurement if it is a data point.
+        """
+        if isinstance(point, bytes):
+            encoded_key, fields, timestamp = line_protocol.split_line(point)
+            return encoded_key.decode(), fields, timestamp, None
+        series_key = line_protocol.encode_series_key(
+            point["measurement"], point.get("tags", {}).items()
+        )
+        return series_key, point["fields"], point.get("time"), point["measurement"]
@@ -1,16 +1,33 @@
 import asyncio
 import json
+import os
+import time
 import uuid
-from typing import List, Any, Optional
-
-from aioinflux import InfluxDBClient
+from typing import Any, List, Optional, Tuple
 
 import toad_influx_data.utils.protocol as prot
-from toad_influx_data.handlers import HANDLERS
-from toad_influx_data.handlers.handler_abc import IHandler
+from toad_influx_data import metrics
+from toad_influx_data.cardinality import CardinalityGuard
+from toad_influx_data.codecs import CodecRegistry
+from toad_influx_data.execution import Conversion, HandlerExecutor
+from toad_influx_data.handlers.handler_abc import INLINE, IHandler, get_points
+from toad_influx_data.handlers.registry import HandlerRegistry
+from toad_influx_data.http_api import HTTPServer
+from toad_influx_data.ingest import IngestQueue
+from toad_influx_data.last_values import LAST_VALUES_PATH, LastValueStore
 from toad_influx_data.mqtt import MQTT, MQTTTopic, MQTTProperties
+from toad_influx_data.parquet_sink import ParquetSink
+from toad_influx_data.rollup import Rollup
+from toad_influx_data.router import TopicRouter
+from toad_influx_data.series_state import SeriesStateTable
+from toad_influx_data.sharding import Shard
+from toad_influx_data.spool import Spool
 from toad_influx_data.utils import config
 from toad_influx_data.utils import logger
+from toad_influx_data.writer import InfluxWriter, ISink, Points
+
+# handler label of the messages received that no handler matches
+NO_HANDLER = "none"
 
 
 class DataServer:
@@ -18,48 +35,164 @@ class DataServer:
     Runs the server and handles the requests.
 
     :ivar server_id: random ID that identifies the Server.
+    :ivar shard: optional ~`toad_influx_data.sharding.Shard` of the messages that
+        the Server handles, when several Servers run in parallel.
     :ivar mqtt_client: ~`toad_influx_data.mqtt.MQTT` mqtt client.
+    :ivar ingest_queue: ~`toad_influx_data.ingest.IngestQueue` bounded queue between
+        the MQTT client and the handlers.
+    :ivar writer: ~`toad_influx_data.writer.InfluxWriter` batched InfluxDB writer.
+    :ivar http_server: ~`toad_influx_data.http_api.HTTPServer` that exposes the
+        metrics; None if it is disabled.
     :ivar running: boolean that represents if the server is running.
     :ivar handlers: list containing all the handlers that implement ~`toad_influx_data.handlers.handler_abc.IHandler`
+    :ivar registry: ~`toad_influx_data.handlers.registry.HandlerRegistry` that
+        loads the configured handlers; None if the handlers were given.
     :ivar listen_topics: topics list to which the Server listens.
+    :ivar router: ~`toad_influx_data.router.TopicRouter` that routes topics to
+        handlers.
+    :ivar codecs: ~`toad_influx_data.codecs.CodecRegistry` that decodes payloads.
+    :ivar executor: ~`toad_influx_data.execution.HandlerExecutor` that converts the
+        messages of the handlers that run in a thread or process pool.
+    :ivar sinks: ~`toad_influx_data.writer.ISink` archives that the points are also
+        written to, like the ~`toad_influx_data.parquet_sink.ParquetSink`.
+    :ivar rollup: ~`toad_influx_data.rollup.Rollup` that downsamples the points;
+        None if it is disabled.
+    :ivar cardinality: ~`toad_influx_data.cardinality.CardinalityGuard` that limits
+        the series of every measurement; None if it is disabled.
+    :ivar series_state: ~`toad_influx_data.series_state.SeriesStateTable` that drops
+        the points that do not change their series; None if it is disabled.
+    :ivar last_values: ~`toad_influx_data.last_values.LastValueStore` of the last
+        point of every series, served by the HTTP server; None if it is disabled.
     """
 
     server_id: str
+    shard: Optional[Shard]
     mqtt_client: MQTT
+    ingest_queue: IngestQueue
+    writer: InfluxWriter
+    http_server: Optional[HTTPServer]
     running: bool
     handlers: List[IHandler]
+    registry: Optional[HandlerRegistry]
     listen_topics: List[str]
+    router: TopicRouter
+    codecs: CodecRegistry
+    executor: HandlerExecutor
+    sinks: List[ISink]
+    rollup: Optional[Rollup]
+    cardinality: Optional[CardinalityGuard]
+    series_state: Optional[SeriesStateTable]
+    last_values: Optional[LastValueStore]
 
-    def __init__(self, handlers=None):
+    def __init__(self, handlers=None, writer=None, server_id=None, shard=None):
         """
         DataServer initializer
 
-        :param handlers: list of handlers that handle MQTT messages.
+        :param handlers: list of handlers that handle MQTT messages; the
+            configured ones, loaded by a ~`HandlerRegistry`, if not given.
+        :param writer: InfluxDB writer; a default ~`InfluxWriter` if not given.
+        :param server_id: ID that identifies the Server; random if not given.
+        :param shard: optional shard of the messages that the Server handles.
         """
 
-        self.server_id = uuid.uuid4().hex
-        self.handlers = handlers or HANDLERS
+        self.server_id = server_id or uuid.uuid4().hex
+        self.shard = shard
+        if handlers is None:
+            self.registry = HandlerRegistry()
+            self.handlers = self.registry.load_enabled()
+        else:
+            self.registry = None
+            self.handlers = list(handlers)
         topics = set()
         for parser in self.handlers:
             topics.update(parser.get_topics())
-        self.listen_topics = list(topics)
+        if self.registry is not None:
+            # the lazy handlers' topics, so that their first message loads them
+            topics.update(self.registry.get_lazy_topics())
+        self.listen_topics = [self._get_subscription(topic) for topic in topics]
+        self.router = TopicRouter(self.handlers)
+        self.codecs = CodecRegistry()
+        self.executor = HandlerExecutor(self._handle_conversion)
+        self.series_state = (
+            SeriesStateTable() if config.CHANGE_DETECTION_ENABLED else None
+        )
+        self.cardinality = CardinalityGuard() if config.CARDINALITY_ENABLED else None
         self.mqtt_client = MQTT(self.__class__.__name__ + "/" + self.server_id)
+        self.ingest_queue = IngestQueue(
+            self._mqtt_response_handler,
+            pause=self.mqtt_client.pause_reading,
+            resume=self.mqtt_client.resume_reading,
+        )
+        self.writer = writer or InfluxWriter(
+            spool=Spool(self._get_spool_directory()) if config.SPOOL_ENABLED else None
+        )
+        self.sinks: List[ISink] = [ParquetSink()] if config.PARQUET_ENABLED else []
+        if config.ROLLUP_ENABLED and shard is not None and not shard.owns_devices:
+            # the servers would overwrite each other's partial rollups
+            raise ValueError("The rollup needs the hash sharding with several servers")
+        self.rollup = Rollup(self.writer) if config.ROLLUP_ENABLED else None
+        self.http_server = (
+            HTTPServer(port=self._get_http_port()) if config.SERVER_ENABLED else None
+        )
+        self.last_values = (
+            LastValueStore(peers=self._get_last_value_peers())
+            if config.LAST_VALUES_ENABLED and self.http_server is not None
+            else None
+        )
+        if self.last_values is not None:
+            self.http_server.add_get(LAST_VALUES_PATH, self.last_values.handle_request)
+        self._lag_monitor: Optional[asyncio.Task] = None
+        metrics.INGEST_QUEUE_DEPTH.set_function(lambda: self.ingest_queue.depth)
+        metrics.INGEST_DROPPED.set_function(lambda: self.ingest_queue.dropped)
+        metrics.INGEST_FAILED.set_function(lambda: self.ingest_queue.failed)
+        metrics.EXECUTOR_PENDING.set_function(lambda: self.executor.pending)
+        metrics.WRITER_PENDING_POINTS.set_function(self.writer.pending)
+        for sink in self.sinks:
+            if isinstance(sink, ParquetSink):
+                metrics.ARCHIVE_PENDING_ROWS.set_function(sink.pending)
+        if self.last_values is not None:
+            metrics.LAST_VALUES_SERIES.set_function(lambda: len(self.last_values))
+        if self.rollup is not None:
+            metrics.ROLLUP_OPEN_BUCKETS.set_function(lambda: self.rollup.open_buckets)
+        metrics.LOG_RECORDS_DROPPED.set_function(logger.get_dropped)
+        metrics.LOG_MESSAGES_SUPPRESSED.set_function(
+            lambda: sum(logger.get_suppressed().values())
+        )
+        metrics.PENDING_TASKS.set_function(lambda: len(asyncio.all_tasks()))
         self.running = False
 
     async def start(
-            self, mqtt_host=config.MQTT_BROKER_HOST, mqtt_token=None,
+            self,
+            mqtt_host=config.MQTT_BROKER_HOST,
+            mqtt_token=None,
+            mqtt_port=config.MQTT_BROKER_PORT,
     ):
         """
         Runs the server.
 
         :param mqtt_host: MQTT broker IP.
         :param mqtt_token: MQTT credential token.
+        :param mqtt_port: MQTT broker port.
         :return:
         """
         if self.running:
             raise RuntimeError("Server already running")
+        await self.writer.start()
+        for sink in self.sinks:
+            await sink.start()
+        if self.rollup is not None:
+            await self.rollup.start()
+        await self.ingest_queue.start()
+        if self.http_server is not None:
+            await self.http_server.start()
+        self._lag_monitor = asyncio.create_task(metrics.monitor_event_loop_lag())
         await self.mqtt_client.start(
-            mqtt_host, self._mqtt_response_handler, self.listen_topics, mqtt_token,
+            mqtt_host,
+            self._mqtt_response_handler,
+            self.listen_topics,
+            mqtt_token,
+            self.ingest_queue,
+            mqtt_port,
         )
         self.running = True
         logger.log_info(f"toad_influx_data server running...")
@@ -72,20 +205,34 @@ class DataServer:
         """
         if self.running:
             await self.mqtt_client.stop()
+            await self.ingest_queue.stop()
+            await self.executor.stop()
+            if self.rollup is not None:
+                await self.rollup.stop()
+            await self.writer.stop()
+            for sink in self.sinks:
+                await sink.stop()
+            self._lag_monitor.cancel()
+            if self.http_server is not None:
+                await self.http_server.stop()
             self.running = False
             logger.log_info("toad_influx_data server stopped")
 
     def add_handler(self, handler: IHandler):
         for topic in handler.get_topics():
-            self.mqtt_client.subscribe(topic)
-            self.listen_topics.append(topic)
+            subscription = self._get_subscription(topic)
+            if subscription in self.listen_topics:
+                continue
+            self.mqtt_client.subscribe(subscription)
+            self.listen_topics.append(subscription)
         self.handlers.append(handler)
+        self.router.add_handler(handler)
 
     async def _mqtt_response_handler(
             self, topic: MQTTTopic, payload: bytes, properties: MQTTProperties
     ):
         """
-        Handles MQTT messages; it checks what handlers can handle it.
+        Handles MQTT messages; it looks up what handlers can handle it.
         Every positive handler generates points from the MQTT message,
         and the DataServer stores the points into InfluxDB.
 
@@ -94,39 +241,218 @@ class DataServer:
         :param properties: MQTT message properties
         :return:
         """
-        payload_json = json.loads(payload.decode())
-        data = payload_json[prot.PAYLOAD_DATA_FIELD]
-        for parser in self.handlers:
-            if not parser.can_handle(topic):
+        if self.shard is not None and not self.shard.owns(topic):
+            return
+        if self.registry is not None:
+            for handler in self.registry.load_for(topic):
+                self.add_handler(handler)
+        parsers = self.router.match(topic)
+        for parser in parsers:
+            metrics.MESSAGES_RECEIVED.labels(parser.__class__.__name__).inc()
+        if not parsers:
+            metrics.MESSAGES_RECEIVED.labels(NO_HANDLER).inc()
+        start = time.perf_counter()
+        try:
+            decoded_payload = self.codecs.decode(topic, payload, properties)
+            data = decoded_payload[prot.PAYLOAD_DATA_FIELD]
+        except Exception as e:
+            record = payload.decode("utf-8", "replace")
+            self._dead_letter(topic, None, [(record, f"Invalid payload: {e}")])
+            return
+        metrics.DECODE_SECONDS.observe(time.perf_counter() - start)
+        for parser in parsers:
+            if self.executor.get_mode(parser) != INLINE:
+                await self.executor.submit(parser, topic, data)
                 continue
-            power_data_points = parser.get_influx_power_points(data)
-            status_data_points = parser.get_influx_status_points(data)
-            database = parser.get_influx_database(topic)
-            # time_precision = parser.get_time_precision()
-            time_precision = None
-            for point in power_data_points:
-                asyncio.create_task(
-                    self._write_to_influx(database, point, time_precision)
-                )
-            for point in status_data_points:
-                asyncio.create_task(
-                    self._write_to_influx(database, point, time_precision)
+            handler_name = parser.__class__.__name__
+            start = time.perf_counter()
+            try:
+                database = parser.get_influx_database(topic)
+                points, time_precision, rejected = get_points(parser, data)
+            except Exception as e:
+                # handlers without point batches convert the message as a whole
+                self._dead_letter(topic, handler_name, [(data, str(e))])
+                continue
+            metrics.CONVERSION_SECONDS.labels(handler_name).observe(
+                time.perf_counter() - start
+            )
+            await self._handle_points(
+                topic, handler_name, database, points, time_precision, rejected
+            )
+
+    async def _handle_conversion(
+            self,
+            parser: IHandler,
+            topic: MQTTTopic,
+            data: Any,
+            conversion: Optional[Conversion],
+            error: Optional[str],
+    ):
+        """
+        Handles the conversion of a message by a handler that runs in a pool.
+
+        :param parser: handler of the message.
+        :param topic: MQTT topic the message was received in.
+        :param data: MQTT message data.
+        :param conversion: the database, points, time precision and rejected
+            records of the message; None if the conversion raised an error.
+        :param error: the error that the conversion raised.
+        :return:
+        """
+        handler_name = parser.__class__.__name__
+        if conversion is None:
+            self._dead_letter(topic, handler_name, [(data, error)])
+            return
+        await self._handle_points(topic, handler_name, *conversion)
+
+    async def _handle_points(
+            self,
+            topic: MQTTTopic,
+            handler_name: str,
+            database: str,
+            points: Points,
+            time_precision: Optional[str],
+            rejected: List[Tuple[Any, str]],
+    ):
+        """
+        Dead-letters the rejected records of a message, and rolls up, stores and
+        writes its points.
+
+        :param topic: MQTT topic the message was received in.
+        :param handler_name: name of the handler of the message.
+        :param database: InfluxDB database of the points.
+        :param points: point batch or data points of the message.
+        :param time_precision: the precision of the timestamps of the points.
+        :param rejected: the records that could not be converted and why.
+        :return:
+        """
+        if rejected:
+            self._dead_letter(topic, handler_name, rejected)
+        metrics.POINTS_PRODUCED.labels(handler_name).inc(len(points))
+        if self.cardinality is not None:
+            points = self.cardinality.filter(database, points)
+        if self.rollup is not None:
+            self.rollup.add(database, points, time_precision)
+        if self.last_values is not None:
+            self.last_values.update(database, points, time_precision)
+        if self.series_state is not None:
+            points = self.series_state.filter(database, points)
+        transport = self.writer.route(database, handler_name)
+        await self._write_to_influx(database, points, time_precision, transport)
+        for sink in self.sinks:
+            # a failing sink does not affect the writes to InfluxDB, or other sinks
+            try:
+                await sink.write(database, points, time_precision)
+            except Exception as e:
+                sink_name = sink.__class__.__name__
+                metrics.SINK_ERRORS.labels(sink_name).inc()
+                logger.log_info_sampled(
+                    "server.sink", "Error writing to %s: %s", sink_name, e
                 )
 
+    def _dead_letter(
+            self,
+            topic: MQTTTopic,
+            handler_name: Optional[str],
+            rejected: List[Tuple[Any, str]],
+    ):
+        """
+        Counts the records that could not be decoded or converted, and republishes
+        them with the reason to the dead-letter topic, if it is configured.
+
+        :param topic: MQTT topic the records were received in.
+        :param handler_name: name of the handler that rejected the records; None if
+            the payload could not be decoded.
+        :param rejected: the records and why they were rejected.
+        :return:
+        """
+        metrics.RECORDS_REJECTED.labels(handler_name or "").inc(len(rejected))
+        logger.log_info_sampled(
+            "server.rejected",
+            "Rejected %d records from %s: %s",
+            len(rejected),
+            topic,
+            rejected[0][1],
+        )
+        if not config.MQTT_DEAD_LETTER_TOPIC:
+            return
+        message = {
+            "topic": topic,
+            "handler": handler_name,
+            "errors": [
+                {"record": record, "reason": reason} for record, reason in rejected
+            ],
+        }
+        try:
+            self.mqtt_client.publish(
+                config.MQTT_DEAD_LETTER_TOPIC,
+                json.dumps(message, default=repr),
+                qos=0,
+            )
+        except Exception as e:
+            logger.log_error(f"Error publishing to the dead-letter topic: {e!r}")
+
+    def _get_subscription(self, topic: MQTTTopic) -> MQTTTopic:
+        """
+
+        :param topic: topic that a handler listens to.
+        :return: the topic to subscribe to, which depends on the shard.
+        """
+        return self.shard.subscription(topic) if self.shard is not None else topic
+
+    def _get_spool_directory(self) -> str:
+        """
+
+        :return: the spool directory; every shard has its own.
+        """
+        if self.shard is None:
+            return config.SPOOL_DIRECTORY
+        return os.path.join(config.SPOOL_DIRECTORY, str(self.shard.index))
+
+    def _get_http_port(self) -> int:
+        """
+
+        :return: the HTTP server port; every shard listens on its own.
+        """
+        return config.SERVER_PORT + (self.shard.index if self.shard is not None else 0)
+
+    def _get_last_value_peers(self) -> List[str]:
+        """
+
+        :return: the base URLs of the HTTP servers of the other shards, whose last
+            values are served too.
+        """
+        if self.shard is None:
+            return []
+        # the workers of the supervisor run on the same host
+        host = config.SERVER_IP
+        if host in ("0.0.0.0", "::"):
+            host = "127.0.0.1"
+        return [
+            f"http://{host}:{config.SERVER_PORT + index}"
+            for index in range(self.shard.count)
+            if index != self.shard.index
+        ]
+
     async def _write_to_influx(
-            self, database: str, point_data: Any, time_precision: Optional[str]
+            self,
+            database: str,
+            points: Points,
+            time_precision: Optional[str],
+            transport: Optional[str] = None,
     ):
         """
-        Method for writing a data point to InfluxDB
+        Method for writing data points to InfluxDB; the points are buffered by the
+        writer and written in batches.
 
         :param database: InfluxDB database to which will write.
-        :param point_data: data point that will write.
+        :param points: point batch, data points or line protocol lines that will
+            write.
         :param time_precision: the precision that the time is formatted.
+        :param transport: name of the write transport; routed by database if None.
         :return:
         """
-        logger.log_info(f"Writing to influx {database}:{point_data}...")
-        async with InfluxDBClient(
-                db=database, host=config.INFLUXDB_HOST, port=config.INFLUXDB_PORT
-        ) as client:
-            await client.write(point_data, precision=time_precision)
-        logger.log_info(f"Written to influx {database}:{point_data}")
+        logger.log_info_sampled(
+            "server.write", "Writing to influx %s:%s...", database, points
+        )
+        await self.writer.write(database, points, time_precision, transport)
@@ -0,0 +1,93 @@
+import zlib
+
+from toad_influx_data.utils import config
+
+# sharding modes
+SHARDING_SHARED = "shared"
+SHARDING_HASH = "hash"
+SHARDING_MODES = (SHARDING_SHARED, SHARDING_HASH)
+
+SHARED_SUBSCRIPTION_PREFIX = "$share"
+
+
+class Shard:
+    """
+    Share of the ingested messages that a ~`toad_influx_data.server.DataServer`
+    handles, when several of them run in parallel.
+
+    - ``shared``: every server subscribes to MQTT shared subscriptions of the same
+      group, so that the broker distributes the messages between them.
+    - ``hash``: every server subscribes to every topic, and only handles the topics
+      whose device level hashes to its index; so the messages of a device are
+      always handled by the same server, in order.
+
+    :ivar index: index of the shard, from 0 to `count` - 1.
+    :ivar count: number of shards.
+    :ivar mode: sharding mode; one of ~`SHARDING_MODES`.
+    :ivar group: shared subscription group, for the ``shared`` mode.
+    :ivar topic_level: topic level that identifies the device, for the ``hash``
+        mode; e.g. 1 for ``data/<device>/influx_data``.
+    """
+
+    index: int
+    count: int
+    mode: str
+    group: str
+    topic_level: int
+
+    def __init__(
+        self,
+        index: int,
+        count: int,
+        mode: str = config.INGEST_SHARDING,
+        group: str = config.INGEST_SHARED_GROUP,
+        topic_level: int = config.INGEST_SHARD_TOPIC_LEVEL,
+    ):
+        """
+        Shard initializer.
+
+        :param index: index of the shard, from 0 to `count` - 1.
+        :param count: number of shards.
+        :param mode: sharding mode; one of ~`SHARDING_MODES`.
+        :param group: shared subscription group, for the ``shared`` mode.
+        :param topic_level: topic level that identifies the device.
+        """
+        if mode not in SHARDING_MODES:
+            raise ValueError(f"Unknown sharding mode: {mode}")
+        self.index = index
+        self.count = count
+        self.mode = mode
+        self.group = group
+        self.topic_level = topic_level
+
+    def subscription(self, topic: str) -> str:
+        """
+
+        :param topic: topic that a handler listens to.
+        :return: the topic that the server has to subscribe to.
+        """
+        if self.mode == SHARDING_SHARED:
+            return f"{SHARED_SUBSCRIPTION_PREFIX}/{self.group}/{topic}"
+        return topic
+
+    @property
+    def owns_devices(self) -> bool:
+        """
+
+        :return: if all the messages of a device are handled by this shard, or by
+            another one.
+        """
+        return self.mode == SHARDING_HASH or self.count == 1
+
+    def owns(self, topic: str) -> bool:
+        """
+
+        :param topic: the topic that the message was received from.
+        :return: if the message has to be handled by this shard.
+        """
+        if self.mode == SHARDING_SHARED or self.count == 1:
+            return True
+        levels = topic.split("/")
+        device = levels[self.topic_level] if self.topic_level < len(levels) else topic
+        # crc32 instead of hash(), which is randomized in every process
+        return zlib.crc32(device.encode()) % self.count == self.index
@@ -0,0 +1,213 @@
+import mmap
+import os
+import struct
+import zlib
+from contextlib import closing
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+from toad_influx_data.utils import config
+from toad_influx_data.utils import logger
+
+SEGMENT_SUFFIX = ".seg"
+# record header: payload length and CRC32 of the payload
+RECORD_HEADER = struct.Struct("<II")
+# payload header: database, time precision and transport lengths
+PAYLOAD_HEADER = struct.Struct("<HHH")
+
+# (database, time precision, body, transport)
+SpoolRecord = Tuple[str, Optional[str], bytes, Optional[str]]
+
+
+class Spool:
+    """
+    Disk-backed write-ahead spool for line protocol writes that could not be
+    written to InfluxDB.
+
+    Writes are appended as checksummed records to segment files, which are rotated
+    when they reach `segment_size` bytes. Closed segments are read back through a
+    memory map, in order, and removed once every record of them was replayed. A
+    record whose checksum does not match, like a record half-written when the
+    process was killed, ends the segment.
+
+    :ivar directory: directory where the segment files are stored.
+    :ivar segment_size: size in bytes at which the active segment is rotated.
+    """
+
+    directory: str
+    segment_size: int
+
+    def __init__(
+        self,
+        directory: str = config.SPOOL_DIRECTORY,
+        segment_size: int = config.SPOOL_SEGMENT_SIZE,
+    ):
+        """
+        Spool initializer.
+
+        :param directory: directory where the segment files are stored.
+        :param segment_size: size in bytes at which the active segment is rotated.
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self._active: Optional[BinaryIO] = None
+        self._active_path: Optional[str] = None
+        self._active_size = 0
+        self._next_sequence = 0
+
+    def open(self):
+        """
+        Opens a new active segment after the segments left by previous runs.
+
+        :return:
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self._list_segments()
+        if segments:
+            last, _ = os.path.splitext(os.path.basename(segments[-1]))
+            self._next_sequence = int(last) + 1
+            logger.log_info(f"Spool has {len(segments)} segments to replay")
+        self._open_segment()
+
+    def close(self):
+        """
+        Closes the active segment, removing it if it is empty.
+
+        :return:
+        """
+        if self._active is None:
+            return
+        self._active.close()
+        if self._active_size == 0:
+            os.remove(self._active_path)
+        self._active = None
+
+    def append(
+        self,
+        database: str,
+        time_precision: Optional[str],
+        body: bytes,
+        transport: Optional[str] = None,
+    ):
+        """
+        Appends a write to the active segment, rotating it if it is full.
+
+        :param database: InfluxDB database of the write.
+        :param time_precision: the precision of the timestamps of the lines.
+        :param body: line protocol lines, separated by new lines.
+        :param transport: name of the transport of the write.
+        :return:
+        """
+        database_bytes = database.encode()
+        precision_bytes = (time_precision or "").encode()
+        transport_bytes = (transport or "").encode()
+        payload = (
+            PAYLOAD_HEADER.pack(
+                len(database_bytes), len(precision_bytes), len(transport_bytes)
+            )
+            + database_bytes
+            + precision_bytes
+            + transport_bytes
+            + body
+        )
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        self._active.write(record)
+        self._active.flush()
+        self._active_size += len(record)
+        if self._active_size >= self.segment_size:
+            self.rotate()
+
+    def rotate(self):
+        """
+        Closes the active segment, so that it can be replayed, and opens a new one.
+
+        :return:
+        """
+        if self._active_size == 0:
+            return
+        self._active.close()
+        self._open_segment()
+
+    def pending(self) -> bool:
+        """
+
+        :return: if there are spooled writes, in closed or in the active segment.
+        """
+        return self._active_size > 0 or bool(self.closed_segments())
+
+    def closed_segments(self) -> List[str]:
+        """
+
+        :return: paths of the segments that can be replayed, oldest first.
+        """
+        return [path for path in self._list_segments() if path != self._active_path]
+
+    def read_segment(self, path: str) -> Iterator[SpoolRecord]:
+        """
+        Reads the records of a closed segment through a memory map.
+
+        :param path: segment path.
+        :return: iterator over the writes of the segment.
+        """
+        if os.path.getsize(path) == 0:
+            return
+        with open(path, "rb") as segment_file, closing(
+            mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        ) as segment:
+            offset = 0
+            while offset + RECORD_HEADER.size <= len(segment):
+                length, checksum = RECORD_HEADER.unpack_from(segment, offset)
+                start = offset + RECORD_HEADER.size
+                offset = start + length
+                payload = segment[start:offset]
+                if len(payload) != length or zlib.crc32(payload) != checksum:
+                    logger.log_error(f"Corrupted spool record in {path} at {start}")
+                    return
+                yield self._decode_payload(payload)
+
+    def remove_segment(self, path: str):
+        """
+        Removes a replayed segment.
+
+        :param path: segment path.
+        :return:
+        """
+        os.remove(path)
+
+    def _decode_payload(self, payload: bytes) -> SpoolRecord:
+        """
+
+        :param payload: record payload.
+        :return: the spooled write.
+        """
+        lengths = PAYLOAD_HEADER.unpack_from(payload)
+        database_start = PAYLOAD_HEADER.size
+        precision_start = database_start + lengths[0]
+        transport_start = precision_start + lengths[1]
+        body_start = transport_start + lengths[2]
+        database = payload[database_start:precision_start].decode()
+        time_precision = payload[precision_start:transport_start].decode()
+        transport = payload[transport_start:body_start].decode()
+        return database, time_precision or None, payload[body_start:], transport or None
+
+    def _open_segment(self):
+        """
+        Opens a new, empty, active segment.
+
+        :return:
+        """
+        name = f"{self._next_sequence:020d}{SEGMENT_SUFFIX}"
+        self._next_sequence += 1
+        self._active_path = os.path.join(self.directory, name)
+        self._active = open(self._active_path, "ab")
+        self._active_size = 0
+
+    def _list_segments(self) -> List[str]:
+        """
+
+        :return: paths of every segment, oldest first.
+        """
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
@@ -0,0 +1,163 @@
+import functools
+import multiprocessing
+import signal
+import time
+import uuid
+from multiprocessing.process import BaseProcess
+from typing import List, Optional
+
+from toad_influx_data.sharding import Shard
+from toad_influx_data.utils import config
+from toad_influx_data.utils import logger
+
+# seconds between checks of the workers' state
+MONITOR_INTERVAL = 0.5
+# seconds a crashed worker waits before being restarted, doubled up to a maximum
+# while it keeps crashing right after starting
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+# seconds a worker has to run to be considered started correctly
+STABLE_UPTIME = 10.0
+# seconds a worker has to stop gracefully before it is killed
+SHUTDOWN_TIMEOUT = 30.0
+
+
+def run_worker(server_id: str, index: int, count: int):
+    """
+    Runs a sharded ~`toad_influx_data.server.DataServer` until it is stopped by a
+    signal; entry point of the worker processes.
+
+    :param server_id: ID of the worker's server.
+    :param index: shard index of the worker.
+    :param count: number of shards.
+    :return:
+    """
+    from toad_influx_data.main import run_server
+    from toad_influx_data.server import DataServer
+
+    run_server(
+        functools.partial(DataServer, server_id=server_id, shard=Shard(index, count))
+    )
+
+
+class Supervisor:
+    """
+    Runs several ~`toad_influx_data.server.DataServer` processes that share the
+    ingest (see ~`toad_influx_data.sharding.Shard`), restarts the ones that crash,
+    and stops all of them together.
+
+    :ivar supervisor_id: random ID from which the workers' server IDs are built.
+    :ivar processes: number of worker processes.
+    :ivar running: boolean that represents if the supervisor is running.
+    """
+
+    supervisor_id: str
+    processes: int
+    running: bool
+
+    def __init__(self, processes: int = config.INGEST_PROCESSES):
+        """
+        Supervisor initializer.
+
+        :param processes: number of worker processes.
+        """
+        self.supervisor_id = uuid.uuid4().hex
+        self.processes = processes
+        self.running = False
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: List[Optional[BaseProcess]] = [None] * processes
+        self._started_at = [0.0] * processes
+        self._restart_delays = [RESTART_DELAY] * processes
+        # monotonic times at which the exited workers are restarted
+        self._restart_at: List[Optional[float]] = [None] * processes
+
+    def run(self):
+        """
+        Starts the workers and supervises them until SIGINT or SIGTERM is received.
+
+        :return:
+        """
+        logger.configure()
+        self.running = True
+        signal.signal(signal.SIGINT, self._on_stop_signal)
+        signal.signal(signal.SIGTERM, self._on_stop_signal)
+        for index in range(self.processes):
+            self._start_worker(index)
+        logger.log_info(f"Supervising {self.processes} toad_influx_data workers...")
+        while self.running:
+            time.sleep(MONITOR_INTERVAL)
+            self._check_workers()
+        self._stop_workers()
+
+    def _check_workers(self):
+        """
+        Schedules the restart of the workers that exited, and restarts the ones
+        whose restart is due.
+
+        :return:
+        """
+        for index, worker in enumerate(self._workers):
+            if not self.running:
+                return
+            restart_at = self._restart_at[index]
+            if restart_at is None:
+                if not worker.is_alive():
+                    self._schedule_restart(index)
+            elif time.monotonic() >= restart_at:
+                self._restart_at[index] = None
+                self._start_worker(index)
+
+    def _on_stop_signal(self, signum, frame):
+        self.running = False
+
+    def _start_worker(self, index: int):
+        """
+        Starts the worker of a shard.
+
+        :param index: shard index of the worker.
+        :return:
+        """
+        worker = self._context.Process(
+            target=run_worker,
+            args=(f"{self.supervisor_id}-{index}", index, self.processes),
+            name=f"toad_influx_data-{index}",
+        )
+        worker.start()
+        self._workers[index] = worker
+        self._started_at[index] = time.monotonic()
+
+    def _schedule_restart(self, index: int):
+        """
+        Schedules the restart of a worker that exited, backing off if it keeps
+        crashing; the other workers are still monitored in the meantime.
+
+        :param index: shard index of the worker.
+        :return:
+        """
+        worker = self._workers[index]
+        logger.log_error(f"Worker {worker.name} exited with code {worker.exitcode}")
+        if time.monotonic() - self._started_at[index] < STABLE_UPTIME:
+            delay = self._restart_delays[index]
+            self._restart_delays[index] = min(delay * 2, MAX_RESTART_DELAY)
+        else:
+            delay = self._restart_delays[index] = RESTART_DELAY
+        self._restart_at[index] = time.monotonic() + delay
+
+    def _stop_workers(self):
+        """
+        Stops every worker gracefully, killing the ones that do not stop in time.
+
+        :return:
+        """
+        workers = [worker for worker in self._workers if worker is not None]
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()  # SIGTERM; the worker stops its server
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for worker in workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                logger.log_error(f"Killing worker {worker.name}")
+                worker.kill()
+                worker.join()
+        logger.log_info("toad_influx_data workers stopped")
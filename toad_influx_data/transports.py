@@ -0,0 +1,327 @@
+import asyncio
+import gzip
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from toad_influx_data.utils import config
+from toad_influx_data.utils import line_protocol
+
+# transport names
+HTTP = "http"
+HTTP_GZIP = "http_gzip"
+UDP = "udp"
+INFLUXDB2 = "v2"
+TRANSPORTS = (HTTP, HTTP_GZIP, UDP, INFLUXDB2)
+
+# InfluxDB 2.x names of the time precisions
+INFLUXDB2_PRECISIONS = {
+    None: "ns",
+    "ns": "ns",
+    "u": "us",
+    "µ": "us",
+    "ms": "ms",
+    "s": "s",
+}
+
+
+class ITransport(ABC):
+    """
+    Interface that the write transports need to implement.
+    Transports send line protocol bodies, already batched by the
+    ~`toad_influx_data.writer.InfluxWriter`, to InfluxDB.
+
+    :ivar durable: if a failed write raises, so that it can be spooled and retried;
+        fire-and-forget transports are not durable.
+    """
+
+    durable = True
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def get_time_precision(self, time_precision: Optional[str]) -> Optional[str]:
+        """
+
+        :param time_precision: the precision of the timestamps of some points.
+        :return: the precision in which the points are best serialized for the
+            transport, so that it does not convert their timestamps.
+        """
+        return time_precision
+
+    @abstractmethod
+    async def write(self, database: str, body: bytes, time_precision: Optional[str]):
+        """
+
+        :param database: InfluxDB database to which will write.
+        :param body: line protocol lines, separated by new lines.
+        :param time_precision: the precision of the timestamps of the lines.
+        :return:
+        """
+        pass
+
+
+class HTTPTransport(ITransport):
+    """
+    InfluxDB 1.x ``/write`` HTTP endpoint, through a pooled session. With
+    `compress`, bodies are gzip compressed; in a thread if they have at least
+    `offload_size` bytes, so that large batches do not block the event loop.
+
+    :ivar host: InfluxDB host.
+    :ivar port: InfluxDB port.
+    :ivar timeout: seconds after which a request is considered failed.
+    :ivar compress: if the bodies are gzip compressed.
+    :ivar offload_size: body size from which compression runs in a thread.
+    """
+
+    host: str
+    port: int
+    timeout: float
+    compress: bool
+    offload_size: int
+
+    def __init__(
+        self,
+        host: str = config.INFLUXDB_HOST,
+        port: int = config.INFLUXDB_PORT,
+        timeout: float = config.INFLUXDB_WRITE_TIMEOUT,
+        compress: bool = False,
+        offload_size: int = config.INFLUXDB_GZIP_OFFLOAD_SIZE,
+    ):
+        """
+        HTTPTransport initializer.
+
+        :param host: InfluxDB host.
+        :param port: InfluxDB port.
+        :param timeout: seconds after which a request is considered failed.
+        :param compress: if the bodies are gzip compressed.
+        :param offload_size: body size from which compression runs in a thread.
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.compress = compress
+        self.offload_size = offload_size
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        self._session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+
+    async def stop(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def write(self, database: str, body: bytes, time_precision: Optional[str]):
+        params = {"db": database}
+        if time_precision:
+            params["precision"] = time_precision
+        await self._post(f"http://{self.host}:{self.port}/write", params, body)
+
+    async def _post(self, url: str, params: Dict[str, str], body: bytes):
+        """
+        Posts line protocol, compressed if enabled.
+
+        :param url: write endpoint URL.
+        :param params: query parameters.
+        :param body: line protocol lines, separated by new lines.
+        :return:
+        """
+        headers = self._get_headers()
+        if self.compress:
+            headers["Content-Encoding"] = "gzip"
+            if len(body) >= self.offload_size:
+                loop = asyncio.get_running_loop()
+                body = await loop.run_in_executor(None, gzip.compress, body)
+            else:
+                body = gzip.compress(body)
+        async with self._session.post(
+            url, params=params, data=body, headers=headers
+        ) as resp:
+            if resp.status != 204:
+                from aioinflux.client import InfluxDBWriteError
+
+                raise InfluxDBWriteError(resp)
+
+    def _get_headers(self) -> Dict[str, str]:
+        return {}
+
+
+class InfluxDB2Transport(HTTPTransport):
+    """
+    InfluxDB 2.x ``/api/v2/write`` HTTP endpoint; the database is written as the
+    bucket of the organization, e.g. ``database/retention_policy`` for the 1.x
+    compatibility buckets.
+
+    :ivar org: InfluxDB organization.
+    :ivar token: InfluxDB API token.
+    """
+
+    org: str
+    token: str
+
+    def __init__(
+        self,
+        host: str = config.INFLUXDB2_HOST,
+        port: int = config.INFLUXDB2_PORT,
+        org: str = config.INFLUXDB2_ORG,
+        token: str = config.INFLUXDB2_TOKEN,
+        timeout: float = config.INFLUXDB_WRITE_TIMEOUT,
+        compress: bool = False,
+        offload_size: int = config.INFLUXDB_GZIP_OFFLOAD_SIZE,
+    ):
+        """
+        InfluxDB2Transport initializer.
+
+        :param host: InfluxDB host.
+        :param port: InfluxDB port.
+        :param org: InfluxDB organization.
+        :param token: InfluxDB API token.
+        :param timeout: seconds after which a request is considered failed.
+        :param compress: if the bodies are gzip compressed.
+        :param offload_size: body size from which compression runs in a thread.
+        """
+        super().__init__(host, port, timeout, compress, offload_size)
+        self.org = org
+        self.token = token
+
+    async def write(self, database: str, body: bytes, time_precision: Optional[str]):
+        if time_precision not in INFLUXDB2_PRECISIONS:
+            raise ValueError(f"Time precision not supported: {time_precision}")
+        params = {
+            "org": self.org,
+            "bucket": database,
+            "precision": INFLUXDB2_PRECISIONS[time_precision],
+        }
+        await self._post(f"http://{self.host}:{self.port}/api/v2/write", params, body)
+
+    def _get_headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Token {self.token}"}
+
+
+class UDPTransport(ITransport):
+    """
+    Fire-and-forget InfluxDB UDP listener; lines are sent in datagrams of at most
+    `datagram_size` bytes, and lost datagrams are not noticed.
+
+    The UDP listener writes to its own configured database and with its own time
+    precision, so the database of the writes is ignored and the timestamps are
+    converted to `precision`.
+
+    :ivar host: InfluxDB host.
+    :ivar port: InfluxDB UDP listener port.
+    :ivar precision: time precision of the UDP listener.
+    :ivar datagram_size: maximum bytes of a datagram.
+    """
+
+    durable = False
+    host: str
+    port: int
+    precision: Optional[str]
+    datagram_size: int
+
+    def __init__(
+        self,
+        host: str = config.INFLUXDB_HOST,
+        port: int = config.INFLUXDB_UDP_PORT,
+        precision: Optional[str] = config.INFLUXDB_UDP_PRECISION,
+        datagram_size: int = config.INFLUXDB_UDP_DATAGRAM_SIZE,
+    ):
+        """
+        UDPTransport initializer.
+
+        :param host: InfluxDB host.
+        :param port: InfluxDB UDP listener port.
+        :param precision: time precision of the UDP listener.
+        :param datagram_size: maximum bytes of a datagram.
+        """
+        self.host = host
+        self.port = port
+        self.precision = precision
+        self.datagram_size = datagram_size
+        self._transport: Optional[asyncio.DatagramTransport] = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=(self.host, self.port)
+        )
+
+    async def stop(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def get_time_precision(self, time_precision: Optional[str]) -> Optional[str]:
+        return self.precision
+
+    async def write(self, database: str, body: bytes, time_precision: Optional[str]):
+        lines = body.split(b"\n")
+        if time_precision != self.precision:
+            lines = self._convert_precision(lines, time_precision)
+        datagram: List[bytes] = []
+        size = 0
+        for line in lines:
+            if datagram and size + len(line) + 1 > self.datagram_size:
+                self._transport.sendto(b"\n".join(datagram))
+                datagram, size = [], 0
+            datagram.append(line)
+            size += len(line) + 1
+        if datagram:
+            self._transport.sendto(b"\n".join(datagram))
+
+    def _convert_precision(
+        self, lines: List[bytes], time_precision: Optional[str]
+    ) -> List[bytes]:
+        """
+
+        :param lines: line protocol lines.
+        :param time_precision: the precision of the timestamps of the lines.
+        :return: the lines, with timestamps in the precision of the listener.
+        """
+        target = line_protocol.PRECISION_MULTIPLIERS[self.precision]
+        source = line_protocol.PRECISION_MULTIPLIERS[time_precision]
+        converted = []
+        for line in lines:
+            series_key, fields, timestamp = line_protocol.split_line(line)
+            if timestamp is None:
+                converted.append(line)
+                continue
+            # integer arithmetic, so that nanosecond timestamps are exact
+            if isinstance(target, int) and isinstance(source, int) and target >= source:
+                value = int(timestamp) * (target // source)
+            else:
+                value = int(round(int(timestamp) * target / source))
+            converted.append(b" ".join((series_key, fields, str(value).encode())))
+        return converted
+
+
+def create_transport(
+    name: str,
+    host: str = config.INFLUXDB_HOST,
+    port: int = config.INFLUXDB_PORT,
+    timeout: float = config.INFLUXDB_WRITE_TIMEOUT,
+) -> ITransport:
+    """
+
+    :param name: one of ~`TRANSPORTS`.
+    :param host: InfluxDB 1.x host.
+    :param port: InfluxDB 1.x HTTP port.
+    :param timeout: seconds after which a request is considered failed.
+    :return: the transport, configured from the configuration file.
+    """
+    if name == HTTP:
+        return HTTPTransport(host, port, timeout)
+    if name == HTTP_GZIP:
+        return HTTPTransport(host, port, timeout, compress=True)
+    if name == UDP:
+        return UDPTransport(host)
+    if name == INFLUXDB2:
+        return InfluxDB2Transport(timeout=timeout)
+    raise ValueError(f"Unknown transport: {name}")
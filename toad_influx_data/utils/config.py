@@ -10,16 +10,214 @@ DEFAULT_CONFIG_FILE = path.join(
 config = configparser.ConfigParser()
 config.read(os.environ.get("TOAD_API_CONFIG_FILE", DEFAULT_CONFIG_FILE))
 
+server_config = config["SERVER"]
 influx_config = config["INFLUXDB"]
 mqtt_config = config["MQTT"]
 logger_config = config["LOGGER"]
 
+# HTTP server configuration
+SERVER_ENABLED = server_config.getboolean("ENABLED", fallback=True)
+SERVER_IP = server_config["IP"]
+SERVER_PORT = int(server_config["PORT"])
 # InfluxDB configuration
 INFLUXDB_HOST = influx_config["HOST"]
 INFLUXDB_PORT = influx_config["PORT"]
+INFLUXDB_BATCH_SIZE = influx_config.getint("BATCH_SIZE", fallback=5000)
+INFLUXDB_FLUSH_INTERVAL = influx_config.getfloat("FLUSH_INTERVAL", fallback=1.0)
+INFLUXDB_WRITE_TIMEOUT = influx_config.getfloat("WRITE_TIMEOUT", fallback=10.0)
+INFLUXDB_MAX_RETRIES = influx_config.getint("MAX_RETRIES", fallback=3)
+INFLUXDB_RETRY_BACKOFF = influx_config.getfloat("RETRY_BACKOFF", fallback=0.5)
+INFLUXDB_RETRY_MAX_BACKOFF = influx_config.getfloat("RETRY_MAX_BACKOFF", fallback=30.0)
+INFLUXDB_CIRCUIT_FAILURES = influx_config.getint("CIRCUIT_FAILURES", fallback=5)
+INFLUXDB_CIRCUIT_RESET_TIMEOUT = influx_config.getfloat(
+    "CIRCUIT_RESET_TIMEOUT", fallback=10.0
+)
+INFLUXDB_MAX_IN_FLIGHT = influx_config.getint("MAX_IN_FLIGHT", fallback=4)
+INFLUXDB_GZIP_OFFLOAD_SIZE = influx_config.getint("GZIP_OFFLOAD_SIZE", fallback=65536)
+INFLUXDB_UDP_PORT = influx_config.getint("UDP_PORT", fallback=8089)
+INFLUXDB_UDP_PRECISION = influx_config.get("UDP_PRECISION", fallback="ns")
+INFLUXDB_UDP_DATAGRAM_SIZE = influx_config.getint("UDP_DATAGRAM_SIZE", fallback=1400)
+# InfluxDB 2.x configuration
+INFLUXDB2_HOST = config.get("INFLUXDB2", "HOST", fallback=INFLUXDB_HOST)
+INFLUXDB2_PORT = config.getint("INFLUXDB2", "PORT", fallback=8086)
+INFLUXDB2_ORG = config.get("INFLUXDB2", "ORG", fallback="")
+INFLUXDB2_TOKEN = config.get("INFLUXDB2", "TOKEN", fallback="")
+# Write transports configuration
+TRANSPORTS_DEFAULT = config.get("TRANSPORTS", "DEFAULT", fallback="http")
+# one "<handler class or database> = <transport>" per line
+TRANSPORTS_ROUTES = dict(
+    tuple(part.strip() for part in line.split("="))
+    for line in config.get("TRANSPORTS", "ROUTES", fallback="").splitlines()
+    if line.strip()
+)
+# Handlers configuration
+HANDLERS_ENABLED = [
+    handler.strip()
+    for handler in config.get("HANDLERS", "ENABLED", fallback="generic").split(",")
+    if handler.strip()
+]
+# one "<handler> = <comma-separated topic patterns>" per line
+HANDLERS_LAZY = {
+    name.strip(): [topic.strip() for topic in topics.split(",") if topic.strip()]
+    for name, topics in (
+        line.split("=", 1)
+        for line in config.get("HANDLERS", "LAZY", fallback="").splitlines()
+        if line.strip()
+    )
+}
 # MQTT client configuration
 MQTT_BROKER_HOST = mqtt_config["BROKER_HOST"]
+MQTT_BROKER_PORT = mqtt_config.getint("BROKER_PORT", fallback=1883)
 MQTT_RESPONSE_TIMEOUT = int(mqtt_config["RESPONSE_TIMEOUT"])
+MQTT_DEAD_LETTER_TOPIC = mqtt_config.get("DEAD_LETTER_TOPIC", fallback="")
+# Ingest queue configuration
+INGEST_QUEUE_SIZE = config.getint("INGEST", "QUEUE_SIZE", fallback=10000)
+INGEST_WORKERS = config.getint("INGEST", "WORKERS", fallback=4)
+INGEST_OVERFLOW_POLICY = config.get("INGEST", "OVERFLOW_POLICY", fallback="block")
+INGEST_PROCESSES = config.getint("INGEST", "PROCESSES", fallback=1)
+INGEST_SHARDING = config.get("INGEST", "SHARDING", fallback="shared")
+INGEST_SHARED_GROUP = config.get("INGEST", "SHARED_GROUP", fallback="toad_influx_data")
+INGEST_SHARD_TOPIC_LEVEL = config.getint("INGEST", "SHARD_TOPIC_LEVEL", fallback=1)
+INGEST_SERIES_CACHE_SIZE = config.getint("INGEST", "SERIES_CACHE_SIZE", fallback=100000)
+# Spool configuration
+SPOOL_ENABLED = config.getboolean("SPOOL", "ENABLED", fallback=False)
+SPOOL_DIRECTORY = config.get("SPOOL", "DIRECTORY", fallback="spool")
+SPOOL_SEGMENT_SIZE = config.getint("SPOOL", "SEGMENT_SIZE", fallback=16 * 1024 ** 2)
+SPOOL_REPLAY_RATE = config.getfloat("SPOOL", "REPLAY_RATE", fallback=10.0)
+# Payload codecs configuration
+CODECS_JSON_BACKEND = config.get("CODECS", "JSON_BACKEND", fallback="auto")
+# one "<topic pattern> = <codec>" per line
+CODECS_TOPICS = [
+    tuple(part.strip() for part in line.split("="))
+    for line in config.get("CODECS", "TOPICS", fallback="").splitlines()
+    if line.strip()
+]
+# Change detection configuration
+CHANGE_DETECTION_ENABLED = config.getboolean(
+    "CHANGE_DETECTION", "ENABLED", fallback=False
+)
+CHANGE_DETECTION_MEASUREMENTS = [
+    measurement.strip()
+    for measurement in config.get(
+        "CHANGE_DETECTION", "MEASUREMENTS", fallback="status"
+    ).split(",")
+    if measurement.strip()
+]
+CHANGE_DETECTION_HEARTBEAT = config.getfloat(
+    "CHANGE_DETECTION", "HEARTBEAT", fallback=300.0
+)
+CHANGE_DETECTION_COALESCE_WINDOW = config.getfloat(
+    "CHANGE_DETECTION", "COALESCE_WINDOW", fallback=1.0
+)
+CHANGE_DETECTION_MAX_SERIES = config.getint(
+    "CHANGE_DETECTION", "MAX_SERIES", fallback=100000
+)
+# Rollup configuration
+ROLLUP_ENABLED = config.getboolean("ROLLUP", "ENABLED", fallback=False)
+ROLLUP_INTERVALS = [
+    interval.strip()
+    for interval in config.get("ROLLUP", "INTERVALS", fallback="1m, 1h").split(",")
+    if interval.strip()
+]
+ROLLUP_MEASUREMENTS = [
+    measurement.strip()
+    for measurement in config.get("ROLLUP", "MEASUREMENTS", fallback="power").split(",")
+    if measurement.strip()
+]
+ROLLUP_GRACE = config.getfloat("ROLLUP", "GRACE", fallback=30.0)
+# Last values configuration
+LAST_VALUES_ENABLED = config.getboolean("LAST_VALUES", "ENABLED", fallback=False)
+LAST_VALUES_MEASUREMENTS = [
+    measurement.strip()
+    for measurement in config.get("LAST_VALUES", "MEASUREMENTS", fallback="").split(",")
+    if measurement.strip()
+]
+LAST_VALUES_INDEX_TAGS = [
+    tag.strip()
+    for tag in config.get(
+        "LAST_VALUES", "INDEX_TAGS", fallback="id, row, column, type"
+    ).split(",")
+    if tag.strip()
+]
+LAST_VALUES_MAX_SERIES = config.getint("LAST_VALUES", "MAX_SERIES", fallback=100000)
+# Handler execution configuration
+EXECUTION_LANES = config.getint("EXECUTION", "LANES", fallback=4)
+EXECUTION_BATCH_SIZE = config.getint("EXECUTION", "BATCH_SIZE", fallback=100)
+EXECUTION_QUEUE_SIZE = config.getint("EXECUTION", "QUEUE_SIZE", fallback=1000)
+EXECUTION_THREAD_WORKERS = config.getint("EXECUTION", "THREAD_WORKERS", fallback=4)
+EXECUTION_PROCESS_WORKERS = config.getint("EXECUTION", "PROCESS_WORKERS", fallback=0)
+EXECUTION_MODES = {
+    name.strip(): mode.strip()
+    for name, mode in (
+        line.split("=", 1)
+        for line in config.get("EXECUTION", "MODES", fallback="").splitlines()
+        if line.strip()
+    )
+}
+# Cardinality guardrail configuration
+CARDINALITY_ENABLED = config.getboolean("CARDINALITY", "ENABLED", fallback=False)
+CARDINALITY_LIMIT = config.getint("CARDINALITY", "LIMIT", fallback=100000)
+CARDINALITY_ACTION = config.get("CARDINALITY", "ACTION", fallback="warn")
+CARDINALITY_FOLD_TAGS = [
+    tag.strip()
+    for tag in config.get("CARDINALITY", "FOLD_TAGS", fallback="id").split(",")
+    if tag.strip()
+]
+CARDINALITY_PRECISION = config.getint("CARDINALITY", "PRECISION", fallback=12)
+CARDINALITY_MAX_MEASUREMENTS = config.getint(
+    "CARDINALITY", "MAX_MEASUREMENTS", fallback=1000
+)
+CARDINALITY_ERROR_RATE = config.getfloat("CARDINALITY", "ERROR_RATE", fallback=0.01)
+# Parquet archive configuration
+PARQUET_ENABLED = config.getboolean("PARQUET", "ENABLED", fallback=False)
+PARQUET_DIRECTORY = config.get("PARQUET", "DIRECTORY", fallback="archive")
+PARQUET_ROW_GROUP_SIZE = config.getint("PARQUET", "ROW_GROUP_SIZE", fallback=100000)
+PARQUET_FLUSH_INTERVAL = config.getfloat("PARQUET", "FLUSH_INTERVAL", fallback=60.0)
+PARQUET_CLOSE_AFTER = config.getfloat("PARQUET", "CLOSE_AFTER", fallback=3600.0)
+PARQUET_COMPRESSION = config.get("PARQUET", "COMPRESSION", fallback="zstd")
+# Backfill configuration
+BACKFILL_WORKERS = config.getint("BACKFILL", "WORKERS", fallback=0)
+BACKFILL_CHUNK_SIZE = config.getint("BACKFILL", "CHUNK_SIZE", fallback=4 * 1024 ** 2)
+BACKFILL_BATCH_SIZE = config.getint("BACKFILL", "BATCH_SIZE", fallback=50000)
+BACKFILL_RATE = config.getfloat("BACKFILL", "RATE", fallback=0.0)
+BACKFILL_CHECKPOINT = config.get("BACKFILL", "CHECKPOINT", fallback="backfill.json")
+BACKFILL_CHECKPOINT_INTERVAL = config.getint(
+    "BACKFILL", "CHECKPOINT_INTERVAL", fallback=10
+)
+# Runtime configuration
+RUNTIME_EVENT_LOOP = config.get("RUNTIME", "EVENT_LOOP", fallback="auto")
+RUNTIME_GC_THRESHOLDS = [
+    int(threshold)
+    for threshold in config.get("RUNTIME", "GC_THRESHOLDS", fallback="").split(",")
+    if threshold.strip()
+]
+RUNTIME_GC_FREEZE = config.getboolean("RUNTIME", "GC_FREEZE", fallback=False)
+RUNTIME_WATCHDOG_INTERVAL = config.getfloat(
+    "RUNTIME", "WATCHDOG_INTERVAL", fallback=0.1
+)
+RUNTIME_WATCHDOG_THRESHOLD = config.getfloat(
+    "RUNTIME", "WATCHDOG_THRESHOLD", fallback=0.5
+)
+RUNTIME_PROFILE_SIGNAL = config.get("RUNTIME", "PROFILE_SIGNAL", fallback="")
+RUNTIME_PROFILE_SECONDS = config.getfloat("RUNTIME", "PROFILE_SECONDS", fallback=10.0)
+RUNTIME_PROFILE_INTERVAL = config.getfloat(
+    "RUNTIME", "PROFILE_INTERVAL", fallback=0.005
+)
+RUNTIME_PROFILE_DIRECTORY = config.get(
+    "RUNTIME", "PROFILE_DIRECTORY", fallback="profiles"
+)
 
 # Logger configuration
 LOGGER_VERBOSE = logger_config.getboolean("VERBOSE")
+LOGGER_QUEUE_SIZE = logger_config.getint("QUEUE_SIZE", fallback=10000)
+LOGGER_SAMPLE_EVERY = logger_config.getint("SAMPLE_EVERY", fallback=1000)
+LOGGER_SAMPLE_RATE = logger_config.getfloat("SAMPLE_RATE", fallback=1.0)
+# one "<category> = <1 in how many messages>, <messages per second>" per line
+LOGGER_SAMPLING = {
+    category.strip(): (int(every), float(rate))
+    for category, every, rate in (
+        [line.split("=", 1)[0], *line.split("=", 1)[1].split(",")]
+        for line in logger_config.get("SAMPLING", fallback="").splitlines()
+        if line.strip()
+    )
+}
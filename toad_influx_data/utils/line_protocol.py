@@ -0,0 +1,240 @@
+"""
+InfluxDB line protocol encoding.
+
+See https://docs.influxdata.com/influxdb/v1.8/write_protocols/line_protocol_reference/
+"""
+import datetime
+import math
+import re
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# the same escaping as InfluxDB's Go implementation and aioinflux
+MEASUREMENT_ESCAPE = str.maketrans({"\\": "\\\\", ",": r"\,", " ": r"\ ", "\n": ""})
+KEY_ESCAPE = str.maketrans({"\\": "\\\\", ",": r"\,", " ": r"\ ", "=": r"\=", "\n": ""})
+STRING_FIELD_ESCAPE = str.maketrans({"\\": "\\\\", '"': r"\"", "\n": ""})
+# separators that are not escaped
+_SPACE = re.compile(rb"(?<!\\) ")
+_COMMA = re.compile(rb"(?<!\\),")
+_EQUALS = re.compile(rb"(?<!\\)=")
+# an escaped character
+_ESCAPED = re.compile(r"\\(.)")
+# a field of a field set: key, and quoted string or unquoted value
+_FIELD = re.compile(rb'((?:[^,=\\]|\\.)+)=("(?:[^"\\]|\\.)*"|[^,]*)')
+
+# timestamp units per second of every time precision
+PRECISION_MULTIPLIERS = {
+    None: 10 ** 9,
+    "ns": 10 ** 9,
+    "u": 10 ** 6,
+    "µ": 10 ** 6,
+    "ms": 10 ** 3,
+    "s": 1,
+    "m": 1 / 60,
+    "h": 1 / 3600,
+}
+
+
+def escape_measurement(measurement: str) -> str:
+    return measurement.translate(MEASUREMENT_ESCAPE)
+
+
+def escape_key(key: str) -> str:
+    """
+    Escapes tag keys, tag values and field keys.
+
+    :param key: tag key, tag value or field key.
+    :return: the escaped string.
+    """
+    return key.translate(KEY_ESCAPE)
+
+
+def encode_series_key(measurement: str, tags: Iterable[Tuple[str, Any]]) -> str:
+    """
+    Encodes the series key of a line; the measurement and the tag set.
+
+    :param measurement: measurement name.
+    :param tags: tag key and value pairs; pairs whose value is empty are skipped.
+    :return: the series key, e.g. ``power,id=sp_m2,type=m``.
+    """
+    series_key = escape_measurement(measurement)
+    for key, value in sorted(tags):
+        if value is None or value == "":
+            continue
+        series_key += f",{escape_key(key)}={escape_key(str(value))}"
+    return series_key
+
+
+def encode_field_value(value: Any) -> str:
+    """
+    Encodes a field value with the same types as aioinflux, so that both encoders
+    can write to the same fields.
+
+    :param value: float, integer, boolean or string value.
+    :return: the encoded field value.
+    :raises ValueError: if the value is NaN or infinite, which InfluxDB rejects.
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, str):
+        return f'"{value.translate(STRING_FIELD_ESCAPE)}"'
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f"Value is not finite: {value}")
+    return repr(value)
+
+
+def encode_fields(fields: Dict[str, Any]) -> str:
+    """
+
+    :param fields: field keys and values; fields whose value is None are skipped.
+    :return: the encoded field set, e.g. ``value=120.1``.
+    """
+    return ",".join(
+        f"{escape_key(key)}={encode_field_value(value)}"
+        for key, value in fields.items()
+        if value is not None
+    )
+
+
+def to_timestamp(seconds: float, time_precision: Optional[str]) -> int:
+    """
+
+    :param seconds: epoch time in seconds.
+    :param time_precision: the precision of the timestamp; None for nanoseconds.
+    :return: the integer epoch timestamp in the given precision.
+    """
+    return int(round(seconds * PRECISION_MULTIPLIERS[time_precision]))
+
+
+def encode_line(series_key: str, fields: str, timestamp: Optional[int]) -> bytes:
+    """
+
+    :param series_key: encoded series key; see ~`encode_series_key`.
+    :param fields: encoded field set; see ~`encode_fields`.
+    :param timestamp: integer timestamp; None to use the server time.
+    :return: the line protocol line.
+    """
+    if timestamp is None:
+        return f"{series_key} {fields}".encode()
+    return f"{series_key} {fields} {timestamp}".encode()
+
+
+def split_line(line: bytes) -> Tuple[bytes, bytes, Optional[bytes]]:
+    """
+
+    :param line: line protocol line.
+    :return: the series key, field set and timestamp of the line; the timestamp is
+        None if the line has none.
+    """
+    match = _SPACE.search(line)
+    if match is None:
+        raise ValueError(f"Invalid line protocol line: {line!r}")
+    end, start = match.span()
+    series_key, rest = line[:end], line[start:]
+    fields, _, timestamp = rest.rpartition(b" ")
+    # the last space may be inside a string field instead of before the timestamp
+    if not fields or not timestamp.lstrip(b"-").isdigit():
+        return series_key, rest, None
+    return series_key, fields, timestamp
+
+
+def get_measurement(series_key: bytes) -> str:
+    """
+
+    :param series_key: encoded series key.
+    :return: the unescaped measurement name of the series.
+    """
+    return unescape(_COMMA.split(series_key, 1)[0].decode())
+
+
+def split_series_key(series_key: bytes) -> Tuple[str, bytes]:
+    """
+
+    :param series_key: encoded series key.
+    :return: the unescaped measurement name and the encoded tag set of the series,
+        which starts with a comma if there are tags.
+    """
+    parts = _COMMA.split(series_key, 1)
+    tags = b"," + parts[1] if len(parts) > 1 else b""
+    return unescape(parts[0].decode()), tags
+
+
+def parse_fields(fields: bytes) -> Dict[str, Any]:
+    """
+
+    :param fields: encoded field set.
+    :return: the field keys and values; the types that ~`encode_field_value`
+        encodes.
+    """
+    parsed: Dict[str, Any] = {}
+    for key, value in _FIELD.findall(fields):
+        if value.startswith(b'"'):
+            parsed_value: Any = unescape(value[1:-1].decode())
+        elif value in (b"t", b"T", b"true", b"True", b"TRUE"):
+            parsed_value = True
+        elif value in (b"f", b"F", b"false", b"False", b"FALSE"):
+            parsed_value = False
+        elif value.endswith((b"i", b"u")):
+            parsed_value = int(value[:-1])
+        else:
+            parsed_value = float(value)
+        parsed[unescape(key.decode())] = parsed_value
+    return parsed
+
+
+def parse_tags(tags: bytes) -> Dict[str, str]:
+    """
+
+    :param tags: encoded tag set, as returned by ~`split_series_key`.
+    :return: the unescaped tag keys and values.
+    """
+    parsed = {}
+    for tag in _COMMA.split(tags):
+        if tag:
+            key, value = _EQUALS.split(tag, 1)
+            parsed[unescape(key.decode())] = unescape(value.decode())
+    return parsed
+
+
+def to_nanoseconds(timestamp: int, time_precision: Optional[str]) -> int:
+    """
+
+    :param timestamp: integer timestamp in the given precision.
+    :param time_precision: the precision of the timestamp; None for nanoseconds.
+    :return: the timestamp in nanoseconds.
+    """
+    multiplier = PRECISION_MULTIPLIERS[time_precision]
+    nanoseconds = PRECISION_MULTIPLIERS[None]
+    if isinstance(multiplier, int):
+        return timestamp * (nanoseconds // multiplier)
+    return int(timestamp * nanoseconds / multiplier)
+
+
+def to_seconds(point_time: Any) -> float:
+    """
+
+    :param point_time: time of a data point; RFC 3339 string, datetime, integer
+        nanoseconds, or None for now.
+    :return: the epoch time in seconds.
+    """
+    if point_time is None:
+        return time.time()
+    if isinstance(point_time, str):
+        import strict_rfc3339
+
+        return strict_rfc3339.rfc3339_to_timestamp(point_time)
+    if isinstance(point_time, datetime.datetime):
+        return point_time.timestamp()
+    return point_time / PRECISION_MULTIPLIERS[None]
+
+
+def unescape(value: str) -> str:
+    """
+
+    :param value: measurement, key or string field value, as escaped in a line.
+    :return: the unescaped value.
+    """
+    return _ESCAPED.sub(r"\1", value)
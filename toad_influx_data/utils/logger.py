@@ -1,31 +1,203 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+import time
+from typing import Any, Dict, Optional
+
 from toad_influx_data.utils import config
 
 # define VERBOSE only if it wasn't defined before importing this file
 VERBOSE = config.LOGGER_VERBOSE
 
-# configure logger
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(message)s",
-    datefmt="%Y-%m-%dT%H:%M:%SZ",
-    level=logging.INFO,
-)
 logger = logging.getLogger(__name__)
 
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["_DroppingQueueHandler"] = None
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Handler that puts the records in a bounded queue, unformatted, and drops them
+    when it is full, so that logging never blocks the event loop.
+
+    :ivar dropped: number of records dropped because the queue was full.
+    """
+
+    def __init__(self, record_queue: queue.Queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # formatted by the listener thread; the arguments must not change after
+        # they are logged
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Sampler:
+    """
+    Sampling and rate limit of a category of log messages: 1 in `every` messages
+    is logged, at most `rate` per second; the next logged message reports how many
+    were suppressed since the last one.
+
+    :ivar every: 1 in how many messages is logged.
+    :ivar rate: maximum messages logged per second.
+    :ivar seen: number of messages of the category.
+    :ivar logged: number of messages of the category that were logged.
+    :ivar suppressed: messages suppressed since the last logged one.
+    """
+
+    __slots__ = ("every", "rate", "seen", "logged", "suppressed", "_allowance", "_last")
+
+    def __init__(self, every: int, rate: float):
+        self.every = max(every, 1)
+        self.rate = rate
+        self.seen = 0
+        self.logged = 0
+        self.suppressed = 0
+        self._allowance = rate
+        self._last = time.monotonic()
+
+    def sample(self) -> bool:
+        """
+
+        :return: if the message is logged.
+        """
+        self.seen += 1
+        if self.seen % self.every == 0:
+            # token bucket of `rate` messages per second
+            now = time.monotonic()
+            self._allowance = min(
+                self.rate, self._allowance + (now - self._last) * self.rate
+            )
+            self._last = now
+            if self._allowance >= 1:
+                self._allowance -= 1
+                self.logged += 1
+                return True
+        self.suppressed += 1
+        return False
+
+
+_samplers: Dict[str, _Sampler] = {}
+
+
+def configure(queue_size: int = config.LOGGER_QUEUE_SIZE):
+    """
+    Configures the root logger; called by the entry points of the server, so that
+    importing the package has no side effects.
 
-def log_info(msg):
-    logger.info(msg)
+    Records are put in a bounded queue and written to stderr by a background
+    thread, so that slow output does not block the event loop.
 
+    :param queue_size: maximum records waiting to be written; the rest are dropped.
+    :return:
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter(
+            "%(asctime)s - %(name)s - %(message)s", datefmt="%Y-%m-%dT%H:%M:%SZ"
+        )
+    )
+    record_queue: queue.Queue = queue.Queue(queue_size)
+    _handler = _DroppingQueueHandler(record_queue)
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(logging.INFO)
+    _listener = logging.handlers.QueueListener(record_queue, stream_handler)
+    _listener.start()
+    atexit.register(shutdown)
 
-def log_error(msg):
-    logger.error(msg)
 
+def shutdown():
+    """
+    Writes the queued records and stops the background thread.
 
-def log_info_verbose(msg):
+    :return:
+    """
+    global _listener, _handler
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger().removeHandler(_handler)
+    _listener = _handler = None
+
+
+def get_dropped() -> int:
+    """
+
+    :return: number of records dropped because the log queue was full.
+    """
+    return _handler.dropped if _handler is not None else 0
+
+
+def get_suppressed() -> Dict[str, int]:
+    """
+
+    :return: number of messages that were not logged by sampling, by category.
+    """
+    return {
+        category: sampler.seen - sampler.logged
+        for category, sampler in _samplers.items()
+    }
+
+
+def _get_sampler(category: str) -> _Sampler:
+    sampler = _samplers.get(category)
+    if sampler is None:
+        every, rate = config.LOGGER_SAMPLING.get(
+            category, (config.LOGGER_SAMPLE_EVERY, config.LOGGER_SAMPLE_RATE)
+        )
+        sampler = _samplers[category] = _Sampler(every, rate)
+    return sampler
+
+
+def log_info(msg, *args):
+    logger.info(msg, *args)
+
+
+def log_error(msg, *args):
+    logger.error(msg, *args)
+
+
+def log_info_verbose(msg, *args):
     if VERBOSE:
-        logger.info(msg)
+        logger.info(msg, *args)
 
 
-def log_error_verbose(msg):
+def log_error_verbose(msg, *args):
     if VERBOSE:
-        logger.error(msg)
+        logger.error(msg, *args)
+
+
+def log_info_sampled(category: str, msg: str, *args: Any):
+    """
+    Verbose log of the ingest hot path, sampled and rate limited by category (see
+    ``[LOGGER]`` in the configuration), so that its volume does not grow with the
+    ingest rate. The message is formatted with the arguments only if it is logged.
+
+    :param category: category of the message, e.g. ``mqtt.message``.
+    :param msg: %-style format string.
+    :param args: arguments of the message.
+    :return:
+    """
+    if not VERBOSE:
+        return
+    sampler = _get_sampler(category)
+    if not sampler.sample():
+        return
+    suppressed = sampler.suppressed
+    sampler.suppressed = 0
+    if suppressed:
+        msg = f"{msg} (+%d {category} messages suppressed)"
+        args = args + (suppressed,)
+    logger.info(msg, *args)
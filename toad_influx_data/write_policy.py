@@ -0,0 +1,207 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable
+
+import aiohttp
+
+from toad_influx_data import metrics
+from toad_influx_data.utils import config
+from toad_influx_data.utils import logger
+
+# circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+Write = Callable[[], Awaitable[None]]
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of writing while the circuit breaker is open.
+    """
+
+    pass
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+
+    :param error: exception raised by a write.
+    :return: if the write can succeed when retried: InfluxDB errors (5xx) and
+        throttling (429), timeouts, connection errors and an open circuit; but not
+        requests rejected by InfluxDB (4xx) or invalid writes.
+    """
+    # aioinflux is imported lazily, as it tries to import pandas
+    from aioinflux.client import InfluxDBWriteError
+
+    if isinstance(error, InfluxDBWriteError):
+        return error.status >= 500 or error.status == 429
+    return isinstance(
+        error,
+        (asyncio.TimeoutError, aiohttp.ClientError, OSError, CircuitOpenError),
+    )
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of the InfluxDB writes.
+
+    The circuit opens after `failure_threshold` consecutive failures, and then no
+    write is sent. Every `reset_timeout` seconds it is half open, and a single
+    write is let through as a probe; the circuit closes if it succeeds, and opens
+    again if it fails.
+
+    :ivar failure_threshold: consecutive failures that open the circuit.
+    :ivar reset_timeout: seconds after which an open circuit lets a probe through.
+    :ivar state: ~`CLOSED`, ~`OPEN` or ~`HALF_OPEN`.
+    :ivar failures: consecutive failures.
+    """
+
+    failure_threshold: int
+    reset_timeout: float
+    state: str
+    failures: int
+
+    def __init__(
+        self,
+        failure_threshold: int = config.INFLUXDB_CIRCUIT_FAILURES,
+        reset_timeout: float = config.INFLUXDB_CIRCUIT_RESET_TIMEOUT,
+    ):
+        """
+        CircuitBreaker initializer.
+
+        :param failure_threshold: consecutive failures that open the circuit.
+        :param reset_timeout: seconds after which an open circuit lets a probe
+            through.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def closed(self) -> bool:
+        return self.state == CLOSED
+
+    def allow(self) -> bool:
+        """
+
+        :return: if a write can be sent; a half open circuit lets a single probe
+            through every `reset_timeout` seconds, so that a probe whose result is
+            never recorded does not keep the circuit open.
+        """
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if now - self._opened_at < self.reset_timeout:
+            return False
+        self.state = HALF_OPEN
+        self._opened_at = now
+        return True
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.log_info("InfluxDB circuit closed")
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state == CLOSED:
+                logger.log_error(f"InfluxDB circuit open after {self.failures} errors")
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+
+
+class WritePolicy:
+    """
+    Failure policy of the InfluxDB writes: at most `max_in_flight` writes are sent
+    at once, retryable failures are retried up to `max_retries` times with jittered
+    exponential backoff, and the writes go through a ~`CircuitBreaker`.
+
+    A write that waits for a retry keeps its in-flight slot, and the retries stop
+    as soon as the circuit opens, so that retries do not amplify an outage.
+
+    :ivar max_retries: retries of a write after its first attempt.
+    :ivar backoff: seconds of the first backoff, which doubles on every retry.
+    :ivar max_backoff: maximum seconds of a backoff.
+    :ivar breaker: circuit breaker of the writes.
+    :ivar max_in_flight: maximum number of writes sent at once.
+    """
+
+    max_retries: int
+    backoff: float
+    max_backoff: float
+    breaker: CircuitBreaker
+    max_in_flight: int
+
+    def __init__(
+        self,
+        max_retries: int = config.INFLUXDB_MAX_RETRIES,
+        backoff: float = config.INFLUXDB_RETRY_BACKOFF,
+        max_backoff: float = config.INFLUXDB_RETRY_MAX_BACKOFF,
+        failure_threshold: int = config.INFLUXDB_CIRCUIT_FAILURES,
+        reset_timeout: float = config.INFLUXDB_CIRCUIT_RESET_TIMEOUT,
+        max_in_flight: int = config.INFLUXDB_MAX_IN_FLIGHT,
+    ):
+        """
+        WritePolicy initializer.
+
+        :param max_retries: retries of a write after its first attempt.
+        :param backoff: seconds of the first backoff, which doubles on every retry.
+        :param max_backoff: maximum seconds of a backoff.
+        :param failure_threshold: consecutive failures that open the circuit.
+        :param reset_timeout: seconds after which an open circuit lets a probe
+            through.
+        :param max_in_flight: maximum number of writes sent at once.
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_in_flight = max_in_flight
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+
+    def get_backoff(self, retry: int) -> float:
+        """
+
+        :param retry: number of the retry, from 0.
+        :return: seconds to wait before the retry; a random time up to the
+            exponential backoff, so that writes that failed together do not retry
+            together.
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+    async def execute(self, write: Write):
+        """
+        Sends a write, retrying it while it fails with a retryable error.
+
+        :param write: async function that sends the write.
+        :return:
+        :raises CircuitOpenError: if the circuit is open.
+        """
+        async with self._in_flight:
+            retry = 0
+            while True:
+                if not self.breaker.allow():
+                    raise CircuitOpenError("InfluxDB circuit is open")
+                try:
+                    await write()
+                except Exception as e:
+                    if not is_retryable(e):
+                        # InfluxDB answered, so it is healthy
+                        self.breaker.record_success()
+                        raise
+                    self.breaker.record_failure()
+                    if retry >= self.max_retries or not self.breaker.closed:
+                        raise
+                    metrics.WRITE_RETRIES.inc()
+                    await asyncio.sleep(self.get_backoff(retry))
+                    retry += 1
+                    continue
+                self.breaker.record_success()
+                return
@@ -0,0 +1,451 @@
+import asyncio
+import functools
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from toad_influx_data import metrics
+from toad_influx_data.handlers.handler_abc import InfluxPoint, PointBatch
+from toad_influx_data.spool import Spool
+from toad_influx_data.transports import ITransport, create_transport
+from toad_influx_data.utils import config
+from toad_influx_data.utils import logger
+from toad_influx_data.write_policy import WritePolicy, is_retryable
+
+BufferKey = Tuple[str, Optional[str], str]  # (database, time precision, transport)
+# a point is either a dict or an already encoded line protocol line
+WritablePoint = Union[InfluxPoint, bytes]
+# the points that go through the pipeline stages: points, or a point batch
+Points = Union[Sequence[WritablePoint], PointBatch]
+
+
+class ISink(ABC):
+    """
+    Interface that the destinations of the points need to implement; the
+    ~`InfluxWriter`, and the archives that the points are also written to.
+    """
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def write(
+        self, database: str, points: Points, time_precision: Optional[str] = None
+    ):
+        """
+        Buffers points, to be written in batches.
+
+        :param database: InfluxDB database of the points.
+        :param points: data points or line protocol lines, or a
+            ~`toad_influx_data.handlers.handler_abc.PointBatch`.
+        :param time_precision: the precision of the timestamps of the lines; a
+            point batch has its own.
+        :return:
+        """
+        pass
+
+    async def flush(self):
+        """
+        Writes every buffered point.
+
+        :return:
+        """
+        pass
+
+
+class InfluxWriter(ISink):
+    """
+    Long-lived InfluxDB writer, which buffers points and writes them in batches.
+
+    Points are buffered per database, time precision and transport. A buffer is
+    written as a single multi-line request when it reaches `batch_size` points, or
+    when the periodic flush runs every `flush_interval` seconds. The requests go
+    through the ~`toad_influx_data.transports` of the `routes`, which map handler
+    classes and databases to transport names, or else through the
+    `default_transport`.
+
+    Every transport has a ~`toad_influx_data.write_policy.WritePolicy`, which
+    limits its requests in flight, retries the ones that fail with a retryable error
+    with jittered exponential backoff, and opens its circuit while InfluxDB keeps
+    failing, so that no request is sent until a probe succeeds.
+
+    Dict points are serialized with nanosecond timestamps, so they must be written
+    with no time precision; line protocol lines are written as they are, with
+    timestamps in the given time precision. Point batches are kept as they are
+    until their buffer is written, and serialized in the time precision that their
+    transport takes.
+
+    If a `spool` is given, requests of durable transports that fail with a retryable
+    error are appended to it, and while the circuit of their transport is not closed
+    every new request goes straight to it. A replayer writes the spooled requests
+    back, in order and at most `replay_rate` per second, which also probes if
+    InfluxDB is healthy again. Without a spool, requests that fail are dropped.
+
+    :ivar transports: transports by name.
+    :ivar default_transport: name of the transport of the writes without a route.
+    :ivar routes: transport names by handler class name or database.
+    :ivar policies: write policies by transport name.
+    :ivar batch_size: number of buffered points that triggers a write.
+    :ivar flush_interval: seconds between periodic flushes of every buffer.
+    :ivar spool: optional ~`toad_influx_data.spool.Spool` for failed requests.
+    :ivar replay_rate: maximum spooled requests replayed per second; unlimited if 0.
+    :ivar dropped: number of points dropped because their write failed.
+    :ivar running: boolean that represents if the writer is running.
+    """
+
+    transports: Dict[str, ITransport]
+    default_transport: str
+    routes: Dict[str, str]
+    policies: Dict[str, WritePolicy]
+    batch_size: int
+    flush_interval: float
+    spool: Optional[Spool]
+    replay_rate: float
+    dropped: int
+    running: bool
+
+    def __init__(
+        self,
+        host: str = config.INFLUXDB_HOST,
+        port: int = config.INFLUXDB_PORT,
+        batch_size: int = config.INFLUXDB_BATCH_SIZE,
+        flush_interval: float = config.INFLUXDB_FLUSH_INTERVAL,
+        write_timeout: float = config.INFLUXDB_WRITE_TIMEOUT,
+        spool: Optional[Spool] = None,
+        replay_rate: float = config.SPOOL_REPLAY_RATE,
+        transports: Optional[Dict[str, ITransport]] = None,
+        default_transport: str = config.TRANSPORTS_DEFAULT,
+        routes: Optional[Dict[str, str]] = None,
+        policies: Optional[Dict[str, WritePolicy]] = None,
+    ):
+        """
+        InfluxWriter initializer.
+
+        :param host: InfluxDB host of the transports that are not given.
+        :param port: InfluxDB port of the transports that are not given.
+        :param batch_size: number of buffered points that triggers a write.
+        :param flush_interval: seconds between periodic flushes of every buffer.
+        :param write_timeout: seconds after which a request is considered failed.
+        :param spool: optional spool for the requests that fail.
+        :param replay_rate: maximum spooled requests replayed per second; unlimited
+            if 0.
+        :param transports: transports by name; the routed ones that are not given
+            are created from the configuration.
+        :param default_transport: name of the transport of the writes without a
+            route.
+        :param routes: transport names by handler class name or database; from the
+            configuration if not given.
+        :param policies: write policies by transport name; the ones that are not
+            given are created from the configuration.
+        """
+        self.routes = dict(config.TRANSPORTS_ROUTES if routes is None else routes)
+        self.default_transport = default_transport
+        self.transports = dict(transports or {})
+        for name in {default_transport, *self.routes.values()}:
+            if name not in self.transports:
+                self.transports[name] = create_transport(
+                    name, host, port, write_timeout
+                )
+        self.policies = dict(policies or {})
+        for name in self.transports:
+            if name not in self.policies:
+                self.policies[name] = WritePolicy()
+            breaker = self.policies[name].breaker
+            metrics.INFLUXDB_CIRCUIT_OPEN.labels(name).set_function(
+                lambda breaker=breaker: 0 if breaker.closed else 1
+            )
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool = spool
+        self.replay_rate = replay_rate
+        self.dropped = 0
+        self.running = False
+        self._buffers: Dict[BufferKey, _Buffer] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._replay_task: Optional[asyncio.Task] = None
+        self._STOP: Optional[asyncio.Event] = None
+
+    async def start(self):
+        """
+        Starts the periodic flush, and the replayer if there is a spool.
+
+        :return:
+        """
+        if self.running:
+            raise RuntimeError("Writer already running")
+        for transport in self.transports.values():
+            await transport.start()
+        self._STOP = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        if self.spool is not None:
+            self.spool.open()
+            self._replay_task = asyncio.create_task(self._replay_loop())
+        self.running = True
+
+    async def stop(self):
+        """
+        Stops the periodic flush, writes every buffered point and stops the
+        transports.
+        Spooled requests that were not replayed yet are kept for the next start.
+
+        :return:
+        """
+        if not self.running:
+            return
+        self.running = False
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+            await asyncio.gather(self._replay_task, return_exceptions=True)
+            self._replay_task = None
+        self._STOP.set()
+        # the flush loop writes every buffered point before returning
+        await self._flush_task
+        for transport in self.transports.values():
+            await transport.stop()
+        if self.spool is not None:
+            self.spool.close()
+
+    async def write(
+        self,
+        database: str,
+        points: Points,
+        time_precision: Optional[str] = None,
+        transport: Optional[str] = None,
+    ):
+        """
+        Buffers points, writing the buffer if it reached the batch size.
+
+        :param database: InfluxDB database to which the points will be written.
+        :param points: data points or line protocol lines to write, or a
+            ~`toad_influx_data.handlers.handler_abc.PointBatch`.
+        :param time_precision: the precision that the time is formatted; a point
+            batch is written with the one its transport takes.
+        :param transport: name of the transport; routed by database if not given.
+        :return:
+        """
+        transport = transport or self.route(database)
+        if isinstance(points, PointBatch):
+            time_precision = self.transports[transport].get_time_precision(
+                points.time_precision
+            )
+            points = points.with_time_precision(time_precision)
+        key = (database, time_precision, transport)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = _Buffer()
+        buffer.add(points)
+        if buffer.size >= self.batch_size:
+            await self._flush_buffer(key)
+
+    async def flush(self):
+        """
+        Writes every buffered point.
+
+        :return:
+        """
+        await asyncio.gather(*(self._flush_buffer(key) for key in list(self._buffers)))
+
+    def route(self, database: str, handler: Optional[str] = None) -> str:
+        """
+
+        :param database: InfluxDB database to which the points will be written.
+        :param handler: class name of the handler that generated the points.
+        :return: name of the transport of the points; the route of the handler, or
+            else of the database, or else the default one.
+        """
+        if handler is not None and handler in self.routes:
+            return self.routes[handler]
+        return self.routes.get(database, self.default_transport)
+
+    @property
+    def healthy(self) -> bool:
+        """
+
+        :return: if the circuit of every transport is closed.
+        """
+        return all(policy.breaker.closed for policy in self.policies.values())
+
+    def pending(self) -> int:
+        """
+
+        :return: number of buffered points waiting to be written.
+        """
+        return sum(buffer.size for buffer in self._buffers.values())
+
+    async def _flush_loop(self):
+        """
+        Flushes every buffer each `flush_interval` seconds, and once more when the
+        writer is stopped.
+
+        :return:
+        """
+        stopped = False
+        while not stopped:
+            try:
+                await asyncio.wait_for(self._STOP.wait(), self.flush_interval)
+                stopped = True
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def _flush_buffer(self, key: BufferKey):
+        """
+        Writes a buffer as a single request.
+
+        The buffer is detached before writing, so that points received while the
+        request is in flight go to a new buffer.
+
+        :param key: database, time precision and transport of the buffer.
+        :return:
+        """
+        buffer = self._buffers.pop(key, None)
+        if buffer is None or not buffer.size:
+            return
+        count = buffer.size
+        database, time_precision, name = key
+        transport = self.transports[name]
+        policy = self.policies[name]
+        try:
+            body = _serialize(buffer.chunks)
+        except Exception as e:
+            # the points are dropped, and the flush loop keeps running
+            logger.log_error(f"Error serializing {count} points: {e!r}")
+            self.dropped += count
+            metrics.WRITE_DROPPED_POINTS.labels(database).inc(count)
+            return
+        spool = self.spool if transport.durable else None
+        if spool is not None and not policy.breaker.closed:
+            spool.append(database, time_precision, body, name)
+            return
+        logger.log_info_sampled(
+            "writer.write", "Writing %d points to influx %s...", count, database
+        )
+        metrics.WRITE_BATCH_POINTS.observe(count)
+        start = time.perf_counter()
+        try:
+            await policy.execute(
+                functools.partial(transport.write, database, body, time_precision)
+            )
+        except Exception as e:
+            metrics.WRITE_ERRORS.labels(database).inc()
+            logger.log_error(f"Error writing {count} points to {database}: {e}")
+            if spool is not None and is_retryable(e):
+                spool.append(database, time_precision, body, name)
+            else:
+                self.dropped += count
+                metrics.WRITE_DROPPED_POINTS.labels(database).inc(count)
+            return
+        metrics.WRITE_SECONDS.labels(database).observe(time.perf_counter() - start)
+        logger.log_info_sampled(
+            "writer.written", "Written %d points to influx %s", count, database
+        )
+
+    async def _replay_loop(self):
+        """
+        Writes the spooled requests back to InfluxDB, oldest first, until the writer
+        is stopped. A request that fails is retried every `flush_interval` seconds,
+        once the circuit of its transport lets it through, so that the spool is
+        replayed in order once InfluxDB is healthy again.
+
+        :return:
+        """
+        while True:
+            segments = self.spool.closed_segments()
+            if not segments:
+                # let the requests spooled so far be replayed
+                self.spool.rotate()
+                segments = self.spool.closed_segments()
+            if not segments:
+                await asyncio.sleep(self.flush_interval)
+                continue
+            for path in segments:
+                for record in self.spool.read_segment(path):
+                    await self._replay(*record)
+                    if self.replay_rate > 0:
+                        await asyncio.sleep(1 / self.replay_rate)
+                self.spool.remove_segment(path)
+            logger.log_info("Spool replayed")
+
+    async def _replay(
+        self,
+        database: str,
+        time_precision: Optional[str],
+        body: bytes,
+        transport: Optional[str],
+    ):
+        """
+        Writes a spooled request, retrying it until it succeeds or fails permanently.
+
+        :param database: InfluxDB database to which will write.
+        :param time_precision: the precision of the timestamps of the lines.
+        :param body: line protocol lines, separated by new lines.
+        :param transport: name of the transport of the request; the default one if
+            it is no longer configured.
+        :return:
+        """
+        if transport not in self.transports:
+            transport = self.default_transport
+        target = self.transports[transport]
+        policy = self.policies[transport]
+        while True:
+            try:
+                await policy.execute(
+                    functools.partial(target.write, database, body, time_precision)
+                )
+            except Exception as e:
+                if not is_retryable(e):
+                    logger.log_error(f"Dropping spooled write to {database}: {e}")
+                    return
+                await asyncio.sleep(self.flush_interval)
+                continue
+            return
+
+
+class _Buffer:
+    """
+    Points waiting to be written in a single request.
+
+    :ivar chunks: the points of every write, in order; serialized when the buffer
+        is written.
+    :ivar size: number of points.
+    """
+
+    __slots__ = ("chunks", "size")
+
+    def __init__(self):
+        self.chunks: List[Points] = []
+        self.size = 0
+
+    def add(self, points: Points):
+        """
+
+        :param points: points of a write.
+        :return:
+        """
+        self.chunks.append(points)
+        self.size += len(points)
+
+
+def _serialize(chunks: List[Points]) -> bytes:
+    """
+
+    :param chunks: data points, line protocol lines or point batches.
+    :return: the line protocol body of the points.
+    """
+    lines: List[bytes] = []
+    for points in chunks:
+        if isinstance(points, PointBatch):
+            lines.extend(points.to_lines())
+            continue
+        encoded = [point for point in points if isinstance(point, bytes)]
+        if len(encoded) == len(points):
+            lines.extend(encoded)
+            continue
+        # aioinflux, which tries to import pandas, is only needed for dict points
+        from aioinflux.serialization import serialize
+
+        lines.append(serialize(points))
+    return b"\n".join(lines)